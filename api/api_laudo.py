@@ -1,263 +1,121 @@
 # -*- coding: utf-8 -*-
-import re
-from statistics import mean
-from typing import Optional, Tuple, List
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
 import time
+from datetime import datetime
 from collections import defaultdict
 from typing import Dict, Set, Any
 from fastapi import Path
 
-import mysql.connector
-from fastapi import FastAPI, Query, HTTPException
+from fastapi import FastAPI, Query, HTTPException, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from utils.comparaveis import (
+    parse_metragem_param, calcular_comparaveis, metragem_alvo as escolher_metragem_alvo,
+    valorar, arredondar_milhar, fmt_brl,
+)
+from utils.storage import get_backend, set_backend, copiar_tabelas_auxiliares, MYSQL_POOL
+from utils import rollups, knn, historico, localidades, listagem, enderecos, perfil, snapshot_mmap, mudancas
+from utils.coalescencia import SingleFlight, chave_normalizada
+from utils.cache import CacheTTL
+from utils.bootstrap import intervalo_bootstrap, preparar as preparar_bootstrap
+from utils.laudos import GeradorLaudos
+from utils.aquecimento import Aquecedor, ContadorAcessos, versao_dados
+from utils.admissao import ControleAdmissao, BaldesPorCliente, Sobrecarga
 
 # =========================
-# Config MySQL
+# Núcleo: cálculo do m² por comparáveis (utils/comparaveis.py)
 # =========================
-config = {
-    "user": "",
-    "password": "",
-    "host": "",
-    "database": "quadr767_laudo-db",
-    "port": 3306
-}
-
-def conectar():
-    return mysql.connector.connect(**config)
+# tempo máximo de cada consulta da cascata e das listagens (ms; 0 = sem limite)
+TEMPO_MAX_CONSULTA_MS = int(os.getenv("LAUDO_CONSULTA_MAX_MS", "1500"))
 
 # =========================
-# Utils / Parsers
+# Inicialização (lifespan) e prontidão
 # =========================
-def parse_metragem_str_to_float(m_str: str):
-    if m_str is None:
-        return None
-    s = str(m_str).strip().lower().replace("m²", "")
-    s = re.sub(r"[^\d,\.]", "", s)
-    if not s:
-        return None
-    if "," in s and "." in s:
-        s = s.replace(".", "").replace(",", ".")
-    elif "," in s:
-        s = s.replace(",", ".")
+# O processo aceita conexões logo após o import; a preparação (pool do banco,
+# snapshot, índice de localidades, NumPy, aquecimento do top-N) roda em
+# segundo plano e /ready só responde 200 quando termina.
+PRAZO_AQUECIMENTO_INICIAL = float(os.getenv("LAUDO_PRONTO_PRAZO", "60"))  # segundos
+
+prontidao: Dict[str, Any] = {"pronto": False, "erro": None, "etapas": {}, "inicio": time.time(), "pronto_em_s": None}
+
+def _preparar_backend():
+    origem = get_backend()
+    n = origem.abrir_pool(MYSQL_POOL)
+    if n:
+        print(f"[INFO] pool MySQL: {n} conexões")
+    carregar_snapshot()
+    with get_backend().cursor() as cur:
+        cur.execute("SELECT 1 AS ok")
+        cur.fetchone()
+
+def _importar_numpy():
+    # import tardio em utils/bootstrap.py: aqui ele (e a matriz do bootstrap) é pago antes da primeira estimativa
     try:
-        return float(s)
-    except ValueError:
-        return None
-
-def parse_valor_str_to_float(v_str: str):
-    if v_str is None:
-        return None
-    s = re.sub(r"[^\d]", "", str(v_str))
-    if not s:
-        return None
-    try:
-        return float(s)
-    except ValueError:
-        return None
-
-def arredondar_milhar(v: float) -> float:
-    return round(v / 1000.0) * 1000.0
-
-def parse_metragem_param(valor) -> Optional[Tuple[float, float] or float]:
-    if not valor or valor == "*":
-        return None
-    s = str(valor).strip().lower().replace("m²", "")
-    s = re.sub(r"[^\d\-,]", "", s)
-    if "-" in s:
-        a, b = s.split("-", 1)
-        try:
-            return (float(a), float(b))
-        except:
-            return None
+        preparar_bootstrap()
+    except ImportError:
+        pass
+
+async def _etapa(nome: str, fn, essencial: bool = False):
+    t0 = time.perf_counter()
     try:
-        return float(s)
-    except:
-        return None
-
-# ---------- LIKE helpers ----------
-def tokens_from_text(texto: str) -> List[str]:
-    toks = re.findall(r"[A-Za-z0-9]+", str(texto or "").upper())
-    return [t for t in toks if t]
-
-def apply_like_tokens(sql_base: str, params: list, campo: str, texto: str):
-    toks = tokens_from_text(texto)
-    for t in toks:
-        sql_base += f" AND {campo} LIKE %s"
-        params.append(f"%{t}%")
-    return sql_base, params
+        await asyncio.to_thread(fn)
+        prontidao["etapas"][nome] = {"ok": True, "s": round(time.perf_counter() - t0, 3)}
+    except Exception as e:
+        prontidao["etapas"][nome] = {"ok": False, "s": round(time.perf_counter() - t0, 3), "erro": str(e)}
+        print(f"[WARN] inicialização ({nome}): {e}")
+        if essencial:
+            raise
 
-# =========================
-# Núcleo: cálculo do m² por comparáveis
-# =========================
-def media_m2_comparaveis(cursor,
-                         bairro: Optional[str],
-                         cidade: Optional[str],
-                         endereco: Optional[str],
-                         quartos: Optional[int],
-                         suites: Optional[int],
-                         vagas: Optional[int],
-                         tipo: Optional[str],
-                         metragem_alvo: Optional[float],
-                         metragem_intervalo: Optional[Tuple[float, float]],
-                         tipo_negocio: str = "Venda",
-                         tolerancia_pct: float = 0.10,
-                         trim_quantil: float = 0.10,
-                         comparables_limit: int = 2000,
-                         min_amostra_local: int = 5):
-    """
-    Retorna (valor_m2_robusto, n_usados, nivel, parsed_trim)
-    nivel ∈ {'endereco','bairro','cidade'}
-    parsed_trim = lista [(m, v, pm2, id)]
-    """
-    def montar(nivel: str):
-        base = "SELECT ID, Metragem, VALOR FROM imoveis_df WHERE 1=1"
-        params = []
-        if nivel == "endereco" and endereco:
-            base, params = apply_like_tokens(base, params, "endereco", endereco)
-        elif nivel == "bairro" and bairro:
-            base += " AND BAIRRO LIKE %s"; params.append(f"%{bairro}%")
-        elif nivel == "cidade" and cidade:
-            base += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
-        else:
-            return None, None
-
-        if tipo:
-            base += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
-        if quartos is not None:
-            base += " AND QUARTOS = %s"; params.append(quartos)
-        if suites is not None:
-            base += " AND SUITES = %s"; params.append(suites)
-        if vagas is not None:
-            base += " AND VAGAS = %s"; params.append(vagas)
-        if tipo_negocio:
-            base += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
-
-        if metragem_intervalo and len(metragem_intervalo) == 2:
-            a, b = metragem_intervalo
-            base += (" AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') "
-                     "AS DECIMAL(10,2)) BETWEEN %s AND %s")
-            params.extend([a, b])
-        elif metragem_alvo:
-            a = metragem_alvo * (1 - tolerancia_pct)
-            b = metragem_alvo * (1 + tolerancia_pct)
-            base += (" AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') "
-                     "AS DECIMAL(10,2)) BETWEEN %s AND %s")
-            params.extend([a, b])
-
-        base += f" LIMIT {comparables_limit}"
-        return base, params
-
-    nivel_ordem = []
-    if endereco:
-        nivel_ordem.append("endereco")
-    nivel_ordem += ["bairro", "cidade"]
-
-    rows = []
-    nivel_usado = None
-
-    for nv in nivel_ordem:
-        sqlx, parx = montar(nv)
-        if not sqlx:
-            continue
-        cursor.execute(sqlx, parx)
-        rows = cursor.fetchall()
-
-        comps = []
-        for r in rows:
-            m = parse_metragem_str_to_float(r["Metragem"])
-            v = parse_valor_str_to_float(r["VALOR"])
-            if m and m > 0 and v and v > 0:
-                comps.append((m, v, v / m, r["ID"]))
-
-        if (nv == "endereco" and len(comps) >= min_amostra_local) or (nv != "endereco" and len(comps) >= 3):
-            nivel_usado = nv
-            rows = [r for r in rows if r["ID"] in [c[3] for c in comps]]
-            break
-
-    if not rows:
-        return None, 0, (nivel_usado or "cidade"), []
-
-    parsed = []
-    for r in rows:
-        m = parse_metragem_str_to_float(r["Metragem"])
-        v = parse_valor_str_to_float(r["VALOR"])
-        if m and m > 0 and v and v > 0:
-            parsed.append((m, v, v / m, r["ID"]))
-
-    if len(parsed) < 3:
-        return None, len(parsed), (nivel_usado or "cidade"), parsed
-
-    # trim outliers
-    per_m2 = sorted(x[2] for x in parsed)
-    if len(per_m2) > 10:
-        ql = per_m2[int(len(per_m2) * trim_quantil)]
-        qh = per_m2[int(len(per_m2) * (1 - trim_quantil)) - 1]
-        parsed_trim = [x for x in parsed if ql <= x[2] <= qh] or parsed
-    else:
-        parsed_trim = parsed
-
-    # ponderação por proximidade
-    if metragem_alvo:
-        pesos, valores = [], []
-        for (m, v, pm2, _) in parsed_trim:
-            dist = abs(m - metragem_alvo)
-            peso = 1.0 / (1.0 + dist)
-            pesos.append(peso); valores.append(pm2)
-        valor_m2 = sum(p * x for p, x in zip(pesos, valores)) / sum(pesos)
-    else:
-        valor_m2 = mean(pm2 for (_, _, pm2, _) in parsed_trim)
-
-    return valor_m2, len(parsed_trim), (nivel_usado or "cidade"), parsed_trim
-
-def fmt_brl(v: Optional[float]) -> Optional[str]:
-    if v is None:
-        return None
-    s = f"R$ {v:,.0f}"
-    return s.replace(",", "X").replace(".", ",").replace("X", ".")
-
-# =============== NOVO: buscar metragem do primeiro resultado (como seu script) ===============
-def buscar_primeira_metragem(
-    cidade: Optional[str], bairro: Optional[str], endereco: Optional[str], tipo: Optional[str],
-    quartos: Optional[int], suites: Optional[int], vagas: Optional[int],
-    tipo_negocio: str
-) -> Optional[float]:
-    conn = conectar()
-    cur = conn.cursor(dictionary=True)
+async def preparar():
+    """Etapas independentes em paralelo; depois o aquecimento inicial (LAUDO_AQUECER=1)."""
     try:
-        sql = "SELECT Metragem FROM imoveis_df WHERE 1=1"
-        params = []
-        if cidade:
-            sql += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
-        if bairro:
-            sql += " AND BAIRRO LIKE %s"; params.append(f"%{bairro}%")
-        if tipo:
-            sql += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
-        if quartos is not None:
-            sql += " AND QUARTOS = %s"; params.append(quartos)
-        if suites is not None:
-            sql += " AND SUITES = %s"; params.append(suites)
-        if vagas is not None:
-            sql += " AND VAGAS = %s"; params.append(vagas)
-        if tipo_negocio:
-            sql += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
-        if endereco:
-            sql, params = apply_like_tokens(sql, params, "endereco", endereco)
-
-        # mesmo sort do script (valor desc). Ajuste se necessário.
-        sql += " ORDER BY CAST(REPLACE(REPLACE(VALOR, '.', ''), ',', '') AS UNSIGNED) DESC LIMIT 1"
-        cur.execute(sql, params)
-        row = cur.fetchone()
-        if not row:
-            return None
-        return parse_metragem_str_to_float(row.get("Metragem"))
-    finally:
-        cur.close()
-        conn.close()
+        await asyncio.gather(
+            _etapa("backend", _preparar_backend, essencial=True),
+            _etapa("localidades", localidades.mapa_cidade_uf),
+            _etapa("snapshot_mmap", snapshot_mmap.snapshot_atual),
+            _etapa("numpy", _importar_numpy),
+        )
+        if MUDANCAS_ATIVAS:
+            assinante.iniciar()
+        if os.getenv("LAUDO_AQUECER") == "1":
+            aquecedor.iniciar()
+            await _etapa("aquecimento", lambda: aquecedor.aguardar_primeiro_ciclo(PRAZO_AQUECIMENTO_INICIAL))
+    except Exception as e:
+        prontidao["erro"] = str(e)
+        return
+    prontidao["pronto"] = True
+    prontidao["pronto_em_s"] = round(time.time() - prontidao["inicio"], 3)
+    print(f"[INFO] pronto em {prontidao['pronto_em_s']}s")
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    tarefa = asyncio.create_task(preparar())
+    yield
+    if not tarefa.done():
+        tarefa.cancel()
+    if assinante.metricas()["ativo"]:
+        assinante.parar()
+    if aquecedor.metricas()["ativo"]:
+        aquecedor.parar()
+    await gerador_laudos.fechar()
 
 # =========================
 # FastAPI
 # =========================
-app = FastAPI(title="API de Estimativa de Imóveis", version="1.1.0")
+app = FastAPI(title="API de Estimativa de Imóveis", version="1.1.0", lifespan=ciclo_de_vida)
+
+@app.get("/ready")
+def pronto(response: Response) -> Dict[str, Any]:
+    """Prontidão para o balanceador: 503 até o fim da preparação (ou se o banco falhou)."""
+    if not prontidao["pronto"]:
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+    return {"ok": prontidao["pronto"], **prontidao}
 
 app.add_middleware(
     CORSMiddleware,
@@ -265,25 +123,115 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
-@app.get("/api/laudo/estimativa")
-def estimativa(
-    cidade: Optional[str] = Query(None),
-    bairro: Optional[str] = Query(None),
-    endereco: Optional[str] = Query(None, description="Texto livre; tokenizado p/ LIKE AND"),
-    tipo: Optional[str] = Query(None, description="Ex: CASA, APARTAMENTO"),
-    limite: int = Query(20, ge=1, le=2000),
+# ?_profile=1 para administradores (só com LAUDO_ADMIN_TOKEN; ver utils/perfil.py)
+perfil.instalar(app)
 
-    quartos: Optional[int] = Query(None, ge=0),
-    vagas: Optional[int] = Query(None, ge=0),
-    suites: Optional[int] = Query(None, ge=0),
+# cálculo compartilhado entre requisições idênticas simultâneas (single-flight)
+coalescedor = SingleFlight()
 
-    metragem: Optional[str] = Query(None, description="Ex: '200-250' ou '220' ou '*'"),
-    metragem_para_estimativa: Optional[float] = Query(None, description="Se enviado, usa diretamente como metragem alvo"),
-    estado_conservacao: Optional[str] = Query("Padrão", description="reformado | original | Padrão"),
+# comparáveis (e intervalo bootstrap) por parâmetros normalizados
+cache_comparaveis = CacheTTL(
+    max_itens=int(os.getenv("LAUDO_CACHE_ITENS", "2048")),
+    ttl=float(os.getenv("LAUDO_CACHE_TTL", "300")),
+)
 
-    tolerancia_m2_pct: float = Query(0.10, ge=0.0, le=0.5),
-    tipo_negocio: str = Query("Venda")
-):
+# geração de laudos por LLM (fila assíncrona; ver utils/laudos.py)
+gerador_laudos = GeradorLaudos(coalescedor=coalescedor)
+
+# admissão das rotas caras (ver utils/admissao.py): vagas + fila com prazo e token bucket por cliente
+admissao = ControleAdmissao(
+    concorrencia=int(os.getenv("LAUDO_ADMISSAO_CONCORRENCIA", "8")),
+    max_fila=int(os.getenv("LAUDO_ADMISSAO_FILA", "32")),
+    prazo=float(os.getenv("LAUDO_ADMISSAO_PRAZO", "2")),
+)
+baldes_clientes = BaldesPorCliente(
+    taxa=float(os.getenv("LAUDO_CLIENTE_TAXA", "5")),
+    rajada=float(os.getenv("LAUDO_CLIENTE_RAJADA", "20")),
+)
+
+def _cliente(request: Request) -> str:
+    return request.headers.get("x-api-key") or (request.client.host if request.client else "-")
+
+async def _fichas_e_vaga(request: Request):
+    """Fichas do cliente (429) e depois vaga ou lugar na fila dentro do prazo (503), com Retry-After."""
+    try:
+        baldes_clientes.consumir(_cliente(request))
+    except Sobrecarga as e:
+        raise HTTPException(status_code=429, detail=f"Muitas requisições: {e.motivo}.",
+                            headers={"Retry-After": str(e.retry_after)})
+    try:
+        await admissao.entrar()
+    except Sobrecarga as e:
+        raise HTTPException(status_code=503, detail=f"Servidor ocupado: {e.motivo}.",
+                            headers={"Retry-After": str(e.retry_after)})
+
+async def admitir(request: Request):
+    """Dependência das rotas caras: a vaga fica ocupada até a resposta (ver _fichas_e_vaga)."""
+    await _fichas_e_vaga(request)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        admissao.sair(time.perf_counter() - t0)
+
+# segmentos mais pedidos da estimativa, recalculados a cada nova versão dos dados
+# (LAUDO_AQUECER=1; ver utils/aquecimento.py)
+acessos_estimativa = ContadorAcessos()
+
+# =========================
+# Snapshot Parquet (opcional)
+# =========================
+# LAUDO_SNAPSHOT_DIR aponta para o diretório do utils/snapshot_parquet.py.
+# Os imóveis passam a vir do snapshot (memory-map -> SQLite em memória);
+# endereco/tipo são copiados uma vez do backend configurado.
+SNAPSHOT_DIR = os.getenv("LAUDO_SNAPSHOT_DIR")
+
+def carregar_snapshot():
+    if not SNAPSHOT_DIR:
+        return
+    from utils.snapshot_parquet import carregar_em_sqlite
+
+    t0 = time.perf_counter()
+    origem = get_backend()
+    snap = carregar_em_sqlite(SNAPSHOT_DIR)
+    if snap is None:
+        print(f"[WARN] Nenhum snapshot em {SNAPSHOT_DIR}; usando backend {origem.nome}.")
+        return
+    try:
+        copiar_tabelas_auxiliares(origem, snap)
+    except Exception as e:
+        print(f"[WARN] endereco/tipo não copiados do backend {origem.nome}: {e}")
+    rollups.reconstruir(snap)
+    set_backend(snap)
+    print(f"[INFO] Snapshot carregado de {SNAPSHOT_DIR} em {time.perf_counter() - t0:.2f}s")
+
+def _consulta_interrompida(backend, erro: Exception):
+    """Consulta interrompida pelo tempo máximo -> 503; outros erros seguem adiante."""
+    if backend.tempo_esgotado(erro):
+        raise HTTPException(status_code=503, detail="Consulta excedeu o tempo máximo; refine os filtros.",
+                            headers={"Retry-After": "1"})
+    raise erro
+
+def calcular_estimativa(
+    cidade: Optional[str] = None,
+    bairro: Optional[str] = None,
+    endereco: Optional[str] = None,
+    tipo: Optional[str] = None,
+    limite: int = 20,
+    quartos: Optional[int] = None,
+    vagas: Optional[int] = None,
+    suites: Optional[int] = None,
+    metragem: Optional[str] = None,
+    metragem_para_estimativa: Optional[float] = None,
+    estado_conservacao: Optional[str] = "Padrão",
+    tolerancia_m2_pct: float = 0.10,
+    tipo_negocio: str = "Venda",
+    usar_agregados: bool = False,
+    modo_comparaveis: str = "cascata",
+    k_vizinhos: int = 50,
+    intervalo_confianca: bool = False,
+    meia_vida_dias: Optional[float] = None,
+) -> Dict[str, Any]:
     """
     Política de metragem alvo (idêntico ao script consultas_imoveis.py):
       1) Se 'metragem_para_estimativa' for enviada -> usa ela.
@@ -298,80 +246,65 @@ def estimativa(
     pm = parse_metragem_param(metragem)
 
     # Conexão e cursor (usados também para obter o primeiro imóvel quando metragem é intervalo)
+    backend = get_backend()
     try:
-        conn = conectar()
-        cursor = conn.cursor(dictionary=True)
+        conn = backend.conectar()
+        cursor = backend.novo_cursor(conn)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao conectar no MySQL: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao conectar no banco ({backend.nome}): {e}")
 
     try:
         # Se precisar listar resultados (para obter primeira metragem quando metragem é intervalo),
         # faz um SELECT com os mesmos filtros do script consultas_imoveis.py
-        sql = "SELECT * FROM imoveis_df WHERE 1=1"
-        params = []
-
-        if isinstance(pm, tuple):
-            sql += (" AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') "
-                    "AS DECIMAL(10,2)) BETWEEN %s AND %s")
-            params.extend([pm[0], pm[1]])
-        elif isinstance(pm, float):
-            sql += " AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') AS DECIMAL(10,2)) >= %s"
-            params.append(pm)
-
-        if quartos is not None:
-            sql += " AND QUARTOS = %s"; params.append(quartos)
-        if suites is not None:
-            sql += " AND SUITES = %s"; params.append(suites)
-        if vagas is not None:
-            sql += " AND VAGAS = %s"; params.append(vagas)
-        if cidade and cidade != "*":
-            sql += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
-        if bairro and bairro != "*":
-            sql += " AND BAIRRO LIKE %s"; params.append(f"%{bairro}%")
-        if tipo:
-            sql += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
-        if endereco:
-            sql, params = apply_like_tokens(sql, params, "endereco", endereco)
-        if tipo_negocio:
-            sql += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
-
-        sql += " ORDER BY CAST(REPLACE(REPLACE(VALOR, '.', ''), ',', '') AS UNSIGNED) DESC LIMIT %s"
+        where, params = listagem.filtros_imoveis(
+            backend, metragem=pm, quartos=quartos, suites=suites, vagas=vagas,
+            cidade=cidade, bairro=bairro, endereco=endereco, tipo=tipo, tipo_negocio=tipo_negocio,
+        )
+        sql = f"SELECT * FROM imoveis_df WHERE {where} ORDER BY {backend.expr_valor} DESC, ID DESC LIMIT %s"
         params.append(limite)
 
-        cursor.execute(sql, params)
-        resultados = cursor.fetchall()
-
-        # Decide metragem_alvo seguindo a mesma ordem do script consultas_imoveis.py
-        if isinstance(metragem_para_estimativa, (int, float)):
-            metragem_alvo = float(metragem_para_estimativa)
-            metragem_intervalo = None
-        else:
-            if isinstance(pm, tuple):
-                metragem_intervalo = pm
-                # usa a metragem do primeiro imóvel listado (se existir)
-                if resultados:
-                    metragem_alvo = parse_metragem_str_to_float(resultados[0].get("Metragem"))
-                else:
-                    metragem_alvo = None
-            elif isinstance(pm, float):
-                metragem_intervalo = None
-                metragem_alvo = pm
-            else:
-                metragem_intervalo = None
-                metragem_alvo = None
-
-        # Cálculo do m² ponderado — usa 2000 comparáveis (igual ao script)
-        valor_m2, n_usados, nivel, comps = media_m2_comparaveis(
-            cursor,
-            bairro=bairro, cidade=cidade, endereco=endereco,
-            quartos=quartos, suites=suites, vagas=vagas, tipo=tipo,
-            metragem_alvo=metragem_alvo,
-            metragem_intervalo=(metragem_intervalo if isinstance(metragem_intervalo, tuple) else None),
-            tipo_negocio=tipo_negocio,
-            tolerancia_pct=tolerancia_m2_pct,
-            trim_quantil=0.10,
-            comparables_limit=2000,  # <-- alinhado ao script
+        try:
+            with backend.tempo_maximo(cursor, TEMPO_MAX_CONSULTA_MS):
+                cursor.execute(sql, params)
+                resultados = cursor.fetchall()
+        except Exception as e:
+            _consulta_interrompida(backend, e)
+
+        # metragem alvo: mesma política do consultas_imoveis.py (intervalo -> primeiro imóvel listado)
+        metragem_alvo, metragem_intervalo = escolher_metragem_alvo(
+            pm, metragem_para_estimativa, resultados[0].get("Metragem") if resultados else None)
+
+        chave_comp = chave_normalizada(
+            "comparaveis", cidade=cidade, bairro=bairro, endereco=endereco, tipo=tipo,
+            quartos=quartos, suites=suites, vagas=vagas, tipo_negocio=tipo_negocio,
+            metragem_alvo=metragem_alvo, metragem_intervalo=metragem_intervalo,
+            tolerancia_m2_pct=tolerancia_m2_pct, usar_agregados=usar_agregados,
+            modo_comparaveis=modo_comparaveis, k_vizinhos=k_vizinhos,
+            meia_vida_dias=meia_vida_dias,
         )
+        # com ?_profile=1 o perfil tem de mostrar o cálculo, não o acerto de cache
+        comp = None if perfil.em_perfil() else cache_comparaveis.get(chave_comp)
+        if comp is None:
+            avisos = []
+            comp = calcular_comparaveis(
+                cursor, backend, cidade=cidade, bairro=bairro, endereco=endereco, tipo=tipo,
+                quartos=quartos, suites=suites, vagas=vagas, tipo_negocio=tipo_negocio,
+                metragem_alvo=metragem_alvo,
+                metragem_intervalo=(metragem_intervalo if isinstance(metragem_intervalo, tuple) else None),
+                tolerancia_m2_pct=tolerancia_m2_pct, usar_agregados=usar_agregados,
+                modo_comparaveis=modo_comparaveis, k_vizinhos=k_vizinhos,
+                meia_vida_dias=meia_vida_dias,
+                tempo_max_ms=TEMPO_MAX_CONSULTA_MS, avisos=avisos,
+            )
+            for aviso in avisos:
+                print(f"[WARN] comparáveis: {aviso}")
+            # o que o cálculo consultou: o canal de mudanças invalida só os segmentos afetados
+            cache_comparaveis.set(chave_comp, comp, segmento={
+                "cidade": cidade, "bairro": bairro, "endereco": endereco, "tipo": tipo,
+                "tipo_negocio": tipo_negocio, "nivel": comp["nivel"],
+                "modo_comparaveis": modo_comparaveis, "usar_agregados": usar_agregados,
+            })
+        valor_m2, n_usados, nivel, comps = comp["valor_m2"], comp["n_usados"], comp["nivel"], comp["comps"]
     finally:
         cursor.close()
         conn.close()
@@ -389,25 +322,36 @@ def estimativa(
             "processado_em": f"{elapsed:.2f}s"
         }
 
-    # Ajustes e estimativa
-    valor_base = float(metragem_alvo) * float(valor_m2)
-
-    estado = (estado_conservacao or "Padrão").strip().lower()
-    ajuste_pct = 0.0
-    desc_estado = "em bom estado de conservação"
-    if estado == "reformado":
-        ajuste_pct = 0.10; desc_estado = "em excelente estado de conservação"
-    elif estado == "original":
-        ajuste_pct = -0.10; desc_estado = "necessitando de reforma/manutenção"
+    # Intervalo bootstrap (opcional), guardado junto dos comparáveis no cache
+    intervalo = None
+    if intervalo_confianca and comps:
+        if "intervalo" not in comp:
+            # mesmos pesos da média do nível (distância no k-NN, proximidade x recência na cascata)
+            comp["intervalo"] = intervalo_bootstrap([c[2] for c in comps], comp["pesos"])
+        intervalo = comp["intervalo"]
 
-    valor_ajustado = valor_base * (1 + ajuste_pct)
-    valor_estimado = arredondar_milhar(valor_ajustado)
-    faixa_min = valor_estimado * 0.95
-    faixa_max = valor_estimado * 1.05
+    # Ajustes e estimativa
+    v = valorar(metragem_alvo, valor_m2, estado_conservacao)
+    valor_base, ajuste_pct, desc_estado = v["valor_base"], v["ajuste_pct"], v["descricao_estado"]
+    valor_estimado, faixa_min, faixa_max = v["valor_estimado"], v["faixa_min"], v["faixa_max"]
+
+    intervalo_saida = None
+    if intervalo:
+        fator = float(metragem_alvo) * (1 + ajuste_pct)
+        intervalo_saida = {
+            "nivel": intervalo["nivel"],
+            "reamostragens": intervalo["reamostragens"],
+            "valor_m2_min": round(intervalo["valor_m2_min"], 2),
+            "valor_m2_max": round(intervalo["valor_m2_max"], 2),
+            "erro_padrao_m2": round(intervalo["erro_padrao_m2"], 2),
+            "valor_min": round(arredondar_milhar(intervalo["valor_m2_min"] * fator), 2),
+            "valor_max": round(arredondar_milhar(intervalo["valor_m2_max"] * fator), 2),
+        }
 
     # monta lista detalhada de comparáveis (para retorno JSON, para facilitar conferência com script)
     comparaveis_detalhados = [
-        {"id": int(c[3]), "metragem": round(float(c[0]), 2), "valor": round(float(c[1]), 2), "valor_m2": round(float(c[2]), 2)}
+        {"id": int(c[3]), "metragem": round(float(c[0]), 2), "valor": round(float(c[1]), 2), "valor_m2": round(float(c[2]), 2),
+         "data_da_busca": datetime.fromtimestamp(c[4]).strftime("%Y-%m-%d") if c[4] else None}
         for c in comps
     ]
 
@@ -421,6 +365,8 @@ def estimativa(
             "estado_conservacao": estado_conservacao,
             "tolerancia_m2_pct": tolerancia_m2_pct,
             "tipo_negocio": tipo_negocio,
+            "modo_comparaveis": modo_comparaveis,
+            "meia_vida_dias": meia_vida_dias,
             "limite_listagem": limite
         },
         "resultado": {
@@ -437,6 +383,7 @@ def estimativa(
             "valor_estimado": round(valor_estimado, 2),
             "faixa_negociacao_min": round(faixa_min, 2),
             "faixa_negociacao_max": round(faixa_max, 2),
+            "intervalo_confianca": intervalo_saida,
 
             "formatado_ptbr": {
                 "valor_m2_ponderado": f"R$ {valor_m2:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
@@ -449,26 +396,239 @@ def estimativa(
         "processado_em": f"{(time.time() - start_time):.2f}s"
     }
 
-def _norm(s: str | None) -> str:
-    return (s or "").strip()
+@app.get("/api/laudo/estimativa", dependencies=[Depends(admitir)])
+@perfil.perfilavel
+def estimativa(
+    cidade: Optional[str] = Query(None),
+    bairro: Optional[str] = Query(None),
+    endereco: Optional[str] = Query(None, description="Texto livre; tokenizado p/ LIKE AND"),
+    tipo: Optional[str] = Query(None, description="Ex: CASA, APARTAMENTO"),
+    limite: int = Query(20, ge=1, le=2000),
+
+    quartos: Optional[int] = Query(None, ge=0),
+    vagas: Optional[int] = Query(None, ge=0),
+    suites: Optional[int] = Query(None, ge=0),
+
+    metragem: Optional[str] = Query(None, description="Ex: '200-250' ou '220' ou '*'"),
+    metragem_para_estimativa: Optional[float] = Query(None, description="Se enviado, usa diretamente como metragem alvo"),
+    estado_conservacao: Optional[str] = Query("Padrão", description="reformado | original | Padrão"),
+
+    tolerancia_m2_pct: float = Query(0.10, ge=0.0, le=0.5),
+    tipo_negocio: str = Query("Venda"),
+    usar_agregados: bool = Query(False, description="Usa a média aparada do segmento (rollup_m2) quando houver amostra"),
+    modo_comparaveis: str = Query("cascata", pattern="^(cascata|knn)$", description="cascata (endereço/bairro/bairros vizinhos/cidade) ou knn"),
+    k_vizinhos: int = Query(50, ge=3, le=500, description="Nº de vizinhos no modo knn"),
+    intervalo_confianca: bool = Query(False, description="Inclui intervalo bootstrap do valor (requer NumPy)"),
+    meia_vida_dias: Optional[float] = Query(None, ge=1, description="Pondera comparáveis pela recência (peso cai 50% a cada meia-vida)")
+):
+    """
+    Estimativa de valor de mercado por comparáveis (ver calcular_estimativa).
+    Requisições simultâneas com os mesmos parâmetros compartilham um único cálculo.
+    """
+    params = dict(
+        cidade=cidade, bairro=bairro, endereco=endereco, tipo=tipo, limite=limite,
+        quartos=quartos, vagas=vagas, suites=suites,
+        metragem=metragem, metragem_para_estimativa=metragem_para_estimativa,
+        estado_conservacao=estado_conservacao, tolerancia_m2_pct=tolerancia_m2_pct,
+        tipo_negocio=tipo_negocio, usar_agregados=usar_agregados,
+        modo_comparaveis=modo_comparaveis, k_vizinhos=k_vizinhos,
+        intervalo_confianca=intervalo_confianca, meia_vida_dias=meia_vida_dias,
+    )
+    if perfil.em_perfil():
+        return calcular_estimativa(**params)
+    acessos_estimativa.registrar(params)
+    chave = chave_normalizada("estimativa", **params)
+    return coalescedor.executar(chave, calcular_estimativa, **params)
+
+@app.get("/api/laudo/imoveis", dependencies=[Depends(admitir)])
+@perfil.perfilavel
+def listar_imoveis(
+    cidade: Optional[str] = Query(None),
+    bairro: Optional[str] = Query(None),
+    endereco: Optional[str] = Query(None, description="Texto livre; tokenizado p/ LIKE AND"),
+    tipo: Optional[str] = Query(None),
+    quartos: Optional[int] = Query(None, ge=0),
+    vagas: Optional[int] = Query(None, ge=0),
+    suites: Optional[int] = Query(None, ge=0),
+    metragem: Optional[str] = Query(None, description="Ex: '200-250' ou '220' ou '*'"),
+    tipo_negocio: str = Query("Venda"),
+    colapsar_duplicados: bool = Query(True, description="Só o representante de cada grupo de anúncios repetidos"),
+    campos: Optional[str] = Query(None, description="Colunas separadas por vírgula (padrão: todas)"),
+    limite: int = Query(listagem.LIMITE_PADRAO, ge=1, le=listagem.LIMITE_MAXIMO),
+    cursor: Optional[str] = Query(None, description="proximo_cursor da página anterior"),
+    ordem: str = Query("desc", pattern="^(asc|desc)$", description="Ordenação por valor"),
+) -> Dict[str, Any]:
+    """
+    Imóveis com os mesmos filtros da estimativa, ordenados por valor, em
+    páginas: envie o proximo_cursor recebido para buscar a página seguinte.
+    """
+    t0 = time.perf_counter()
+    backend = get_backend()
+    where, params = listagem.filtros_imoveis(
+        backend, metragem=parse_metragem_param(metragem), quartos=quartos, suites=suites, vagas=vagas,
+        cidade=cidade, bairro=bairro, endereco=endereco, tipo=tipo, tipo_negocio=tipo_negocio,
+        colapsar_duplicados=colapsar_duplicados,
+    )
+    lista_campos = [c.strip() for c in campos.split(",") if c.strip()] if campos else None
+    try:
+        with backend.cursor() as cur, backend.tempo_maximo(cur, TEMPO_MAX_CONSULTA_MS):
+            pagina = listagem.pagina(cur, backend, where, params, campos=lista_campos,
+                                     limite=limite, apos=cursor, ordem=ordem)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        _consulta_interrompida(backend, e)
+    return dict(pagina, ok=True, limite=limite, ordem=ordem,
+                processado_em=f"{(time.perf_counter() - t0):.3f}s")
+
+class PedidoLaudo(BaseModel):
+    cidade: Optional[str] = None
+    bairro: Optional[str] = None
+    endereco: Optional[str] = None
+    tipo: Optional[str] = None
+    quartos: Optional[int] = None
+    suites: Optional[int] = None
+    vagas: Optional[int] = None
+    metragem: Optional[str] = None
+    metragem_para_estimativa: Optional[float] = None
+    estado_conservacao: Optional[str] = "Padrão"
+    tipo_negocio: str = "Venda"
+    template: str = "nat_update"
+
+@app.post("/api/laudo/gerar", status_code=202)
+async def gerar_laudo(pedido: PedidoLaudo, request: Request) -> Dict[str, Any]:
+    """
+    Enfileira a geração do laudo: estimativa -> template ai/prompts/{template}.md
+    -> LLM. Responde na hora com o id do job; o progresso sai por SSE.
+    A etapa da estimativa passa pela mesma admissão de /api/laudo/estimativa:
+    a vaga é tomada aqui (429/503 antes de criar o job) e devolvida quando o
+    cálculo termina, já dentro do job.
+    """
+    if not gerador_laudos.disponivel():
+        raise HTTPException(status_code=503, detail="LLM não configurado (LAUDO_LLM_URL).")
+
+    params = pedido.model_dump(exclude={"template"})
+    chave = chave_normalizada("estimativa", **params)
+    await _fichas_e_vaga(request)
+    loop = asyncio.get_running_loop()
+
+    def estimar():
+        t0 = time.perf_counter()
+        try:
+            return coalescedor.executar(chave, calcular_estimativa, **params)
+        finally:
+            # roda numa thread do job; a admissão só é mexida no event loop
+            loop.call_soon_threadsafe(admissao.sair, time.perf_counter() - t0)
+
+    try:
+        job = gerador_laudos.enfileirar(estimar, template=pedido.template)
+    except ValueError as e:
+        admissao.sair()
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "ok": True, "job": job.id, "status": job.status,
+        "consultar": f"/api/laudo/gerar/{job.id}",
+        "eventos": f"/api/laudo/gerar/{job.id}/eventos",
+    }
+
+@app.get("/api/laudo/gerar/{job_id}")
+async def consultar_laudo(job_id: str = Path(...)) -> Dict[str, Any]:
+    job = gerador_laudos.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return {"ok": True, **job.resumo()}
+
+@app.get("/api/laudo/gerar/{job_id}/eventos")
+async def eventos_laudo(job_id: str = Path(...), desde: int = Query(0, ge=0)):
+    """Server-Sent Events: estado, estimativa, tentativa, resultado (fecha ao concluir)."""
+    job = gerador_laudos.obter(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado.")
+    return StreamingResponse(
+        job.stream_sse(desde),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# =========================
+# Pré-aquecimento (opcional)
+# =========================
+def _aquecer_estimativa(params: dict):
+    params = {"limite": 1, **params}
+    return coalescedor.executar(chave_normalizada("estimativa", **params), calcular_estimativa, **params)
+
+def _invalidar_caches():
+    cache_comparaveis.invalidar()
+    knn.invalidar()
+
+# Canal de mudanças (LAUDO_MUDANCAS=1; ver utils/mudancas.py): o getdf.py publica os
+# segmentos de cada anúncio alterado e só as entradas afetadas saem do cache. Com ele
+# o aquecedor não invalida tudo a cada versão: faz o aquecimento inicial e depois
+# recalcula apenas os segmentos quentes atingidos.
+MUDANCAS_ATIVAS = os.getenv("LAUDO_MUDANCAS") == "1"
+
+def _aplicar_mudancas(eventos: list):
+    cache_comparaveis.invalidar(lambda seg: any(mudancas.afeta(seg, ev) for ev in eventos))
+    knn.invalidar_se(lambda chave: any(mudancas.afeta(dict(chave, nivel="knn"), ev) for ev in eventos))
+    if aquecedor.metricas()["ativo"]:
+        # params da rota sem o nível usado: considera a cascata inteira
+        alvo = [params for _, params in acessos_estimativa.top(aquecedor.top)
+                if any(mudancas.afeta(params, ev) for ev in eventos)]
+        if alvo:
+            aquecedor.aquecer(alvo)
+
+assinante = mudancas.Assinante(
+    _aplicar_mudancas, intervalo=float(os.getenv("LAUDO_MUDANCAS_INTERVALO", str(mudancas.INTERVALO_PADRAO))),
+)
+
+aquecedor = Aquecedor(
+    acessos_estimativa, _aquecer_estimativa, invalidar=None if MUDANCAS_ATIVAS else _invalidar_caches,
+    versao=(lambda: ("canal de mudanças",)) if MUDANCAS_ATIVAS else versao_dados,
+    em_voo=lambda: coalescedor.metricas()["em_voo"],
+    top=int(os.getenv("LAUDO_AQUECER_TOP", "50")),
+    concorrencia=int(os.getenv("LAUDO_AQUECER_CONCORRENCIA", "2")),
+    intervalo=float(os.getenv("LAUDO_AQUECER_INTERVALO", "60")),
+    caminho_acessos=os.getenv("LAUDO_ACESSOS_PATH"),
+)
 
 def _upper_clean(s: str | None) -> str:
-    # remove espaços duplicados e sobe para CAIXA ALTA
-    return " ".join(_norm(s).split()).upper()
+    # remove espaços duplicados e sobe para CAIXA ALTA (mesma regra da carga em massa)
+    return localidades.limpar_caixa_alta(s)
+
+# endereços por (uf, versão): a versão sobe quando a UF ganha endereços (utils/enderecos.py)
+cache_enderecos = CacheTTL(max_itens=64, ttl=86400.0)
 
 @app.get("/api/laudo/enderecos/{uf}")
 def listar_enderecos_por_uf(
-    uf: str = Path(..., description="UF ex: DF")
-) -> Dict[str, Any]:
+    request: Request,
+    response: Response,
+    uf: str = Path(..., description="UF ex: DF"),
+):
+    """
+    Cidades -> bairros -> endereços da UF. ETag = versão de endereços da UF:
+    com If-None-Match igual, responde 304 sem corpo.
+    """
     t0 = time.perf_counter()
 
     uf_up = _upper_clean(uf)
     if not uf_up:
         raise HTTPException(status_code=400, detail="UF inválida.")
 
-    conn = conectar()
-    cur = conn.cursor(dictionary=True)
+    backend = get_backend()
+    conn = backend.conectar()
+    cur = backend.novo_cursor(conn)
     try:
+        versao = enderecos.versao(cur, uf_up)
+        etag = f'W/"enderecos-{uf_up}-{versao}"'
+        cabecalhos = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=cabecalhos)
+        response.headers.update(cabecalhos)
+
+        saida = cache_enderecos.get((uf_up, versao))
+        if saida is not None:
+            return dict(saida, processado_em=f"{round(time.perf_counter() - t0, 2)}s")
+
         sql = """
             SELECT cidade, bairro, endereco
             FROM endereco
@@ -494,15 +654,169 @@ def listar_enderecos_por_uf(
             saida[cidade] = {}
             for bairro, end_set in bairros.items():
                 saida[cidade][bairro] = sorted(end_set)
+        cache_enderecos.set((uf_up, versao), saida, segmento={"uf": uf_up})
 
         # tempo de processamento em segundos (ex: "0.12s")
         tempo_s = round((time.perf_counter() - t0), 2)
-        saida["processado_em"] = f"{tempo_s}s"
-        return saida
+        return dict(saida, processado_em=f"{tempo_s}s")
     finally:
         cur.close()
         conn.close()
 
+def _mercado(uf: str, cidade: str, bairro: Optional[str], tipo_negocio: str, tipo: Optional[str]) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    uf_up = _upper_clean(uf)
+    if not uf_up:
+        raise HTTPException(status_code=400, detail="UF inválida.")
+
+    filtros = {"uf": uf_up, "cidade": cidade, "bairro": bairro, "tipo_negocio": tipo_negocio, "tipo": tipo}
+    with get_backend().cursor() as cur:
+        geral = rollups.consultar(cur, filtros).get(())
+        por_tipo = rollups.consultar(cur, filtros, agrupar_por=["tipo"])
+        por_faixa = rollups.consultar(cur, filtros, agrupar_por=["faixa_metragem"])
+        por_bairro = {} if bairro else rollups.consultar(cur, filtros, agrupar_por=["bairro"])
+
+    if not geral:
+        raise HTTPException(status_code=404, detail="Sem agregados para a localização informada.")
+
+    saida = {
+        "ok": True,
+        "uf": uf_up, "cidade": _upper_clean(cidade), "bairro": _upper_clean(bairro) or None,
+        "tipo_negocio": tipo_negocio, "tipo": tipo,
+        "geral": geral,
+        "por_tipo": {k[0]: v for k, v in sorted(por_tipo.items())},
+        "por_faixa_metragem": {k[0]: v for k, v in por_faixa.items()},
+    }
+    if not bairro:
+        saida["por_bairro"] = {k[0]: v for k, v in sorted(por_bairro.items())}
+    saida["processado_em"] = f"{round(time.perf_counter() - t0, 2)}s"
+    return saida
+
+@app.get("/api/laudo/mercado/{uf}/{cidade}")
+@perfil.perfilavel
+def mercado_cidade(
+    uf: str = Path(..., description="UF ex: DF"),
+    cidade: str = Path(...),
+    tipo_negocio: str = Query("Venda"),
+    tipo: Optional[str] = Query(None, description="Ex: APARTAMENTO"),
+) -> Dict[str, Any]:
+    """Estatísticas de R$/m² da cidade (rollup_m2), com quebra por bairro, tipo e faixa de metragem."""
+    return _mercado(uf, cidade, None, tipo_negocio, tipo)
+
+@app.get("/api/laudo/mercado/{uf}/{cidade}/{bairro}")
+@perfil.perfilavel
+def mercado_bairro(
+    uf: str = Path(..., description="UF ex: DF"),
+    cidade: str = Path(...),
+    bairro: str = Path(...),
+    tipo_negocio: str = Query("Venda"),
+    tipo: Optional[str] = Query(None, description="Ex: APARTAMENTO"),
+) -> Dict[str, Any]:
+    """Estatísticas de R$/m² do bairro (rollup_m2), com quebra por tipo e faixa de metragem."""
+    return _mercado(uf, cidade, bairro, tipo_negocio, tipo)
+
+def _tendencia(uf: str, cidade: str, bairro: Optional[str], tipo_negocio: str, tipo: Optional[str], meses: int) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    uf_up = _upper_clean(uf)
+    if not uf_up:
+        raise HTTPException(status_code=400, detail="UF inválida.")
+
+    filtros = {"uf": uf_up, "cidade": cidade, "bairro": bairro, "tipo_negocio": tipo_negocio, "tipo": tipo}
+    with get_backend().cursor() as cur:
+        serie = historico.tendencia(cur, filtros, meses=meses)
+    if not serie:
+        raise HTTPException(status_code=404, detail="Sem histórico para a localização informada.")
+
+    return {
+        "ok": True,
+        "uf": uf_up, "cidade": _upper_clean(cidade), "bairro": _upper_clean(bairro) or None,
+        "tipo_negocio": tipo_negocio, "tipo": tipo, "meses": meses,
+        "serie": serie,
+        "processado_em": f"{round(time.perf_counter() - t0, 2)}s",
+    }
+
+@app.get("/api/laudo/tendencia/{uf}/{cidade}")
+@perfil.perfilavel
+def tendencia_cidade(
+    uf: str = Path(..., description="UF ex: DF"),
+    cidade: str = Path(...),
+    tipo_negocio: str = Query("Venda"),
+    tipo: Optional[str] = Query(None, description="Ex: APARTAMENTO"),
+    meses: int = Query(24, ge=1, le=120),
+) -> Dict[str, Any]:
+    """Série mensal de R$/m² da cidade (anúncios novos ou com preço alterado em cada mês)."""
+    return _tendencia(uf, cidade, None, tipo_negocio, tipo, meses)
+
+@app.get("/api/laudo/tendencia/{uf}/{cidade}/{bairro}")
+@perfil.perfilavel
+def tendencia_bairro(
+    uf: str = Path(..., description="UF ex: DF"),
+    cidade: str = Path(...),
+    bairro: str = Path(...),
+    tipo_negocio: str = Query("Venda"),
+    tipo: Optional[str] = Query(None, description="Ex: APARTAMENTO"),
+    meses: int = Query(24, ge=1, le=120),
+) -> Dict[str, Any]:
+    """Série mensal de R$/m² do bairro (anúncios novos ou com preço alterado em cada mês)."""
+    return _tendencia(uf, cidade, bairro, tipo_negocio, tipo, meses)
+
+@app.get("/api/laudo/historico/{id_imovel}")
+def historico_imovel(id_imovel: int = Path(..., ge=1)) -> Dict[str, Any]:
+    """Versões registradas de um anúncio (preço e atributos), da mais antiga à mais recente."""
+    t0 = time.perf_counter()
+    with get_backend().cursor() as cur:
+        versoes = historico.versoes(cur, id_imovel)
+    if not versoes:
+        raise HTTPException(status_code=404, detail="Anúncio sem histórico.")
+    return {
+        "ok": True, "id": id_imovel, "count": len(versoes), "versoes": versoes,
+        "processado_em": f"{round(time.perf_counter() - t0, 2)}s",
+    }
+
+@app.get("/api/laudo/metricas")
+def metricas() -> Dict[str, Any]:
+    """Contadores internos do processo (single-flight, cache da estimativa, laudos, aquecedor, mudanças e admissão)."""
+    return {
+        "ok": True,
+        "coalescencia": coalescedor.metricas(),
+        "cache_comparaveis": cache_comparaveis.metricas(),
+        "laudos": gerador_laudos.metricas(),
+        "aquecimento": aquecedor.metricas(),
+        "mudancas": assinante.metricas(),
+        "admissao": dict(admissao.metricas(), clientes=baldes_clientes.metricas()),
+    }
+
+@app.get("/api/laudo/localidades")
+def localidades_ufs() -> Dict[str, Any]:
+    """UFs do índice compilado de metadados (utils/localidades.py)."""
+    ufs = localidades.indice().ufs()
+    return {"ok": True, "count": len(ufs), "ufs": ufs}
+
+@app.get("/api/laudo/localidades/{uf}")
+def localidades_cidades(uf: str = Path(..., description="UF ex: DF")) -> Dict[str, Any]:
+    cidades = localidades.indice().cidades(uf)
+    if not cidades:
+        raise HTTPException(status_code=404, detail="UF sem cidades no índice.")
+    return {"ok": True, "uf": _upper_clean(uf), "count": len(cidades), "cidades": cidades}
+
+@app.get("/api/laudo/localidades/{uf}/{cidade}")
+def localidades_bairros(uf: str = Path(...), cidade: str = Path(...)) -> Dict[str, Any]:
+    bairros = localidades.indice().bairros(uf, cidade)
+    if not bairros:
+        raise HTTPException(status_code=404, detail="Cidade sem bairros no índice.")
+    return {"ok": True, "uf": _upper_clean(uf), "cidade": localidades.normalizar_nome(cidade),
+            "count": len(bairros), "bairros": bairros}
+
+@app.get("/api/laudo/localidades/{uf}/{cidade}/{bairro}")
+def localidades_enderecos(
+    uf: str = Path(...), cidade: str = Path(...), bairro: str = Path(...),
+    prefixo: Optional[str] = Query(None, description="Início do endereço (sem acento/caixa)"),
+    limite: int = Query(200, ge=1, le=5000),
+) -> Dict[str, Any]:
+    enderecos = localidades.indice().enderecos(uf, cidade, bairro, prefixo=prefixo, limite=limite)
+    return {"ok": True, "uf": _upper_clean(uf), "cidade": localidades.normalizar_nome(cidade),
+            "bairro": localidades.normalizar_nome(bairro), "count": len(enderecos), "enderecos": enderecos}
+
 @app.get("/api/laudo/tipos")
 def listar_tipos() -> Dict[str, Any]:
     """
@@ -510,8 +824,9 @@ def listar_tipos() -> Dict[str, Any]:
     Saída: { "ok": True, "count": n, "tipos": [{ "id": id, "tipo": "..." }, ...], "processado_em": "0.12s" }
     """
     t0 = time.perf_counter()
-    conn = conectar()
-    cur = conn.cursor(dictionary=True)
+    backend = get_backend()
+    conn = backend.conectar()
+    cur = backend.novo_cursor(conn)
     try:
         cur.execute("SELECT id, tipo FROM tipo ORDER BY tipo ASC")
         rows = cur.fetchall()
@@ -1,21 +1,17 @@
 from collections import defaultdict
 from typing import Dict, Set, Any
-from fastapi import FastAPI, Depends, Path, HTTPException
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, Session
+from fastapi import FastAPI, Path, HTTPException
 from dotenv import load_dotenv
-import os, time
+import os, sys, time
 from fastapi.middleware.cors import CORSMiddleware
 # =========================
 # Configuração
 # =========================
 load_dotenv()
 
-# MYSQL_URL = "mysql+pymysql://root:@localhost/dfdb?charset=utf8mb4"
-MYSQL_URL = "mysql+pymysql://root:@localhost/dfdb?charset=utf8mb4"
-
-engine = create_engine(MYSQL_URL, pool_pre_ping=True, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+# mesma camada de dados da API (api/utils/storage.py); backend via LAUDO_DB_BACKEND
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.storage import get_backend
 
 app = FastAPI(title="imoGo — Endereços", version="1.0.0")
 
@@ -27,13 +23,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def get_db() -> Session:
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def _norm(s: str | None) -> str:
     return (s or "").strip()
 
@@ -46,8 +35,7 @@ def _upper_clean(s: str | None) -> str:
 # =========================
 @app.get("/api/laudo/enderecos/{uf}")
 def listar_enderecos_por_uf(
-    uf: str = Path(..., description="UF ex: DF"),
-    db: Session = Depends(get_db)
+    uf: str = Path(..., description="UF ex: DF")
 ) -> Dict[str, Any]:
     t0 = time.perf_counter()
 
@@ -57,24 +45,26 @@ def listar_enderecos_por_uf(
 
     # Busca tudo da tabela endereco para a UF informada
     # Colunas: uf, cidade, bairro, endereco
-    sql = text("""
+    sql = """
         SELECT cidade, bairro, endereco
         FROM endereco
-        WHERE uf = :uf
+        WHERE uf = %s
           AND cidade IS NOT NULL AND TRIM(cidade) <> ''
           AND bairro IS NOT NULL AND TRIM(bairro) <> ''
           AND endereco IS NOT NULL AND TRIM(endereco) <> ''
         ORDER BY cidade ASC, bairro ASC, endereco ASC
-    """)
-    rows = db.execute(sql, {"uf": uf_up}).all()
+    """
+    with get_backend().cursor() as cur:
+        cur.execute(sql, (uf_up,))
+        rows = cur.fetchall()
 
     # Mapa -> CIDADE: { BAIRRO: set(ENDERECO) }
     mapa: Dict[str, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
 
-    for cidade, bairro, endereco in rows:
-        c = _upper_clean(cidade)
-        b = _upper_clean(bairro)
-        e = _upper_clean(endereco)
+    for row in rows:
+        c = _upper_clean(row.get("cidade"))
+        b = _upper_clean(row.get("bairro"))
+        e = _upper_clean(row.get("endereco"))
         if c and b and e:
             mapa[c][b].add(e)
 
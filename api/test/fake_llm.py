@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+fake_llm.py
+Servidor falso compatível com POST /v1/chat/completions (formato OpenAI),
+para testar a geração de laudos sem chamar um LLM de verdade.
+
+Uso:
+  python test/fake_llm.py --porta 8099 --atraso 2 --falhas 0.3
+  LAUDO_LLM_URL=http://127.0.0.1:8099/v1 uvicorn api_laudo:app --port 8000
+
+  --atraso  segundos de espera por resposta (simula LLM lento)
+  --falhas  fração de respostas 503 (exercita as novas tentativas do cliente)
+"""
+
+import re
+import json
+import time
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def laudo_falso(prompt: str) -> dict:
+    """Laudo no formato de saída do nat_update.md, montado com os dados do prompt."""
+    m = re.search(r"```json\s*(\{.*?\})\s*```", prompt, re.S)
+    try:
+        dados = json.loads(m.group(1)) if m else {}
+    except ValueError:
+        dados = {}
+    est = dados.get("estimativa_mercado") or {}
+    return {
+        "template_path": "templates/laudo-imogo.pptx",
+        "text": {
+            "endereco_full": dados.get("endereco_full"),
+            "tipo_imovel": str(dados.get("tipo_imovel") or "").upper(),
+            "metragem": f"{dados.get('metragem')} M²",
+            "bairro": dados.get("bairro"),
+            "cidade": dados.get("cidade"),
+            "valor_m2": est.get("valor_m2"),
+            "valor_laudo": est.get("valor_estimado"),
+        },
+        "fake": True,
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    atraso = 0.0
+    falhas = 0.0
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        corpo = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        time.sleep(self.atraso)
+        if random.random() < self.falhas:
+            self.send_error(503, "indisponível (simulado)")
+            return
+
+        prompt = (corpo.get("messages") or [{}])[-1].get("content", "")
+        conteudo = "```json\n" + json.dumps(laudo_falso(prompt), ensure_ascii=False, indent=2) + "\n```"
+        resposta = json.dumps({
+            "id": f"fake-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "model": corpo.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": conteudo}}],
+        }, ensure_ascii=False).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(resposta)))
+        self.end_headers()
+        self.wfile.write(resposta)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="LLM falso (chat/completions) para testes.")
+    ap.add_argument("--porta", type=int, default=8099)
+    ap.add_argument("--atraso", type=float, default=1.0)
+    ap.add_argument("--falhas", type=float, default=0.0)
+    args = ap.parse_args()
+
+    Handler.atraso, Handler.falhas = args.atraso, args.falhas
+    srv = ThreadingHTTPServer(("127.0.0.1", args.porta), Handler)
+    print(f"[OK] LLM falso em http://127.0.0.1:{args.porta}/v1 (atraso={args.atraso}s, falhas={args.falhas:.0%})")
+    srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
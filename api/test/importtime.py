@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+importtime.py
+Orçamento de inicialização do api_laudo (workers novos do autoscaling).
+
+  1) python -X importtime -c "import api_laudo" num processo limpo: tempo total
+     do import, os módulos mais caros e os módulos pesados que NÃO podem ser
+     importados no carregamento (ficam para a rota que usa ou para a preparação
+     em segundo plano)
+  2) --pronto: sobe o app (lifespan) e mede quanto /ready leva para responder 200
+
+Sai com código 1 se o orçamento estourar ou um módulo proibido aparecer.
+Dentro de api/:
+  python test/importtime.py [--orcamento-ms 800] [--top 15] [--pronto]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import subprocess
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# módulos que só rotas específicas (ou a preparação do /ready) podem importar
+PROIBIDOS = ("numpy", "httpx", "mysql.connector", "pyarrow", "pyinstrument", "ijson", "urllib.request")
+
+LINHA = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def medir_import(modulo: str = "api_laudo") -> list:
+    """[(self_us, acumulado_us, profundidade, nome)] do -X importtime num processo novo."""
+    saida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=API_DIR, capture_output=True, text=True, check=True,
+    ).stderr
+    linhas = []
+    for m in LINHA.finditer(saida):
+        linhas.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return linhas
+
+
+def medir_pronto(prazo: float = 120.0) -> float:
+    """Segundos do import até /ready = 200 (o TestClient executa o lifespan)."""
+    t0 = time.perf_counter()
+    sys.path.insert(0, API_DIR)
+    from fastapi.testclient import TestClient
+    import api_laudo
+
+    with TestClient(api_laudo.app) as c:
+        while time.perf_counter() - t0 < prazo:
+            r = c.get("/ready")
+            if r.status_code == 200:
+                etapas = r.json()["etapas"]
+                for nome, e in etapas.items():
+                    print(f"    {nome:<14} {e['s']:>7.3f}s {'ok' if e['ok'] else 'ERRO: ' + e.get('erro', '')}")
+                return time.perf_counter() - t0
+            if r.json().get("erro"):
+                raise RuntimeError(r.json()["erro"])
+            time.sleep(0.05)
+    raise TimeoutError(f"/ready não ficou pronto em {prazo}s")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Orçamento de tempo de import/inicialização do api_laudo.")
+    ap.add_argument("--orcamento-ms", type=float, default=float(os.getenv("LAUDO_IMPORT_ORCAMENTO_MS", "800")),
+                    help="Tempo máximo do import de api_laudo (ms).")
+    ap.add_argument("--top", type=int, default=15, help="Módulos mais caros listados.")
+    ap.add_argument("--pronto", action="store_true", help="Mede também o tempo até /ready = 200.")
+    args = ap.parse_args()
+
+    linhas = medir_import()
+    total_ms = next(a for _, a, p, nome in linhas if nome == "api_laudo" and p == 0) / 1000.0
+    nomes = {nome for *_, nome in linhas}
+    falhas = []
+
+    print(f"import api_laudo: {total_ms:.1f} ms (orçamento {args.orcamento_ms:.0f} ms)")
+    print(f"  {'próprio ms':>10} {'acumulado ms':>12}  módulo")
+    for proprio, acumulado, _, nome in sorted(linhas, key=lambda x: x[0], reverse=True)[:args.top]:
+        print(f"  {proprio / 1000:>10.1f} {acumulado / 1000:>12.1f}  {nome}")
+    utils_ms = sum(p for p, _, _, nome in linhas if nome.startswith("utils")) / 1000.0
+    print(f"  módulos utils.*: {utils_ms:.1f} ms (próprio)")
+
+    if total_ms > args.orcamento_ms:
+        falhas.append(f"import de {total_ms:.1f} ms acima do orçamento de {args.orcamento_ms:.0f} ms")
+    for m in PROIBIDOS:
+        if m in nomes:
+            falhas.append(f"{m} importado no carregamento do api_laudo")
+
+    if args.pronto:
+        try:
+            print(f"/ready em {medir_pronto():.2f}s")
+        except Exception as e:
+            falhas.append(f"/ready: {e}")
+
+    for f in falhas:
+        print(f"[ERRO] {f}")
+    if falhas:
+        sys.exit(1)
+    print("[OK] dentro do orçamento")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+admissao.py
+Controle de admissão das rotas caras da API (estimativa, listagem).
+
+  - ControleAdmissao: no máximo `concorrencia` requisições em execução; as
+    demais esperam numa fila FIFO de até `max_fila` posições, por no máximo
+    `prazo` segundos. Fila cheia ou prazo vencido -> Sobrecarga (a API
+    responde 503 com Retry-After). A espera acontece no event loop: uma
+    requisição na fila não ocupa thread do threadpool nem conexão do banco.
+  - BaldesPorCliente: token bucket por cliente (X-Api-Key ou IP), para um
+    integrador não esgotar as vagas dos outros (a API responde 429).
+
+Configuração (api_laudo.py):
+  LAUDO_ADMISSAO_CONCORRENCIA  requisições simultâneas (padrão: 8)
+  LAUDO_ADMISSAO_FILA          requisições em espera (padrão: 32)
+  LAUDO_ADMISSAO_PRAZO         segundos de espera na fila (padrão: 2)
+  LAUDO_CLIENTE_TAXA           requisições/s por cliente (padrão: 5)
+  LAUDO_CLIENTE_RAJADA         tamanho do balde por cliente (padrão: 20)
+"""
+
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+
+MAX_CLIENTES = 10000
+PESO_MEDIA = 0.2   # média móvel exponencial do tempo de execução
+
+
+class Sobrecarga(Exception):
+    """Requisição recusada; retry_after em segundos."""
+
+    def __init__(self, motivo: str, retry_after: int):
+        super().__init__(motivo)
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+# =========================
+# Concorrência + fila
+# =========================
+class ControleAdmissao:
+    """Semáforo com fila limitada e prazo de espera (usar dentro de um único event loop)."""
+
+    def __init__(self, concorrencia: int = 8, max_fila: int = 32, prazo: float = 2.0):
+        self.concorrencia = max(1, concorrencia)
+        self.max_fila = max_fila
+        self.prazo = prazo
+        self._em_execucao = 0
+        self._fila: deque = deque()
+        self.tempo_medio = 0.5
+        self.estat = {"admitidas": 0, "enfileiradas": 0, "recusadas_fila": 0, "recusadas_prazo": 0}
+
+    def _retry_after(self) -> int:
+        # tempo para a fila atual escoar, pela média de execução
+        return max(1, math.ceil(self.tempo_medio * (len(self._fila) + 1) / self.concorrencia))
+
+    async def entrar(self):
+        if self._em_execucao < self.concorrencia and not self._fila:
+            self._em_execucao += 1
+            self.estat["admitidas"] += 1
+            return
+        if len(self._fila) >= self.max_fila:
+            self.estat["recusadas_fila"] += 1
+            raise Sobrecarga("fila cheia", self._retry_after())
+
+        vaga = asyncio.get_running_loop().create_future()
+        self._fila.append(vaga)
+        self.estat["enfileiradas"] += 1
+        try:
+            await asyncio.wait({vaga}, timeout=self.prazo)
+        except BaseException:
+            # cliente desconectou: devolve a vaga se ela já tinha sido passada
+            self._desistir(vaga)
+            raise
+        if not vaga.done():
+            self._desistir(vaga)
+            self.estat["recusadas_prazo"] += 1
+            raise Sobrecarga("prazo de espera esgotado", self._retry_after())
+        self.estat["admitidas"] += 1
+
+    def _desistir(self, vaga):
+        if vaga.done() and not vaga.cancelled():
+            self.sair()
+            return
+        vaga.cancel()
+        try:
+            self._fila.remove(vaga)
+        except ValueError:
+            pass
+
+    def sair(self, duracao: float | None = None):
+        if duracao is not None:
+            self.tempo_medio += PESO_MEDIA * (duracao - self.tempo_medio)
+        # a vaga passa direto para o primeiro da fila
+        while self._fila:
+            vaga = self._fila.popleft()
+            if not vaga.done():
+                vaga.set_result(True)
+                return
+        self._em_execucao -= 1
+
+    def metricas(self) -> dict:
+        return dict(self.estat, em_execucao=self._em_execucao, na_fila=len(self._fila),
+                    concorrencia=self.concorrencia, max_fila=self.max_fila, prazo=self.prazo,
+                    tempo_medio_s=round(self.tempo_medio, 3))
+
+
+# =========================
+# Token bucket por cliente
+# =========================
+class BaldesPorCliente:
+    """`taxa` fichas/s até `rajada` fichas por cliente; guarda os MAX_CLIENTES mais recentes."""
+
+    def __init__(self, taxa: float = 5.0, rajada: float = 20.0, max_clientes: int = MAX_CLIENTES):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.max_clientes = max_clientes
+        self._baldes: OrderedDict = OrderedDict()   # cliente -> [fichas, t]
+        self._lock = threading.Lock()
+        self.recusadas = 0
+
+    def consumir(self, cliente: str, custo: float = 1.0):
+        """Gasta `custo` fichas do cliente ou levanta Sobrecarga com o tempo até haver fichas."""
+        agora = time.monotonic()
+        with self._lock:
+            balde = self._baldes.get(cliente)
+            if balde is None:
+                balde = self._baldes[cliente] = [self.rajada, agora]
+                while len(self._baldes) > self.max_clientes:
+                    self._baldes.popitem(last=False)
+            self._baldes.move_to_end(cliente)
+            balde[0] = min(self.rajada, balde[0] + (agora - balde[1]) * self.taxa)
+            balde[1] = agora
+            if balde[0] >= custo:
+                balde[0] -= custo
+                return
+            self.recusadas += 1
+            falta = (custo - balde[0]) / self.taxa
+        raise Sobrecarga("limite de requisições do cliente", max(1, math.ceil(falta)))
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {"clientes": len(self._baldes), "recusadas": self.recusadas,
+                    "taxa": self.taxa, "rajada": self.rajada}
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+aquecimento.py
+Pré-aquecimento dos segmentos mais pedidos da estimativa depois de cada
+ingest.
+
+  - ContadorAcessos: contagem com decaimento (meia-vida) dos parâmetros de
+    /api/laudo/estimativa; o top-N é o conjunto "quente" do momento
+  - versao_dados: impressão digital barata dos dados (geração do snapshot
+    mmap, última versão de mudanca_imovel e totais de rollup_m2, que o
+    getdf.py atualiza na transação de cada anúncio novo ou alterado)
+  - Aquecedor: thread em segundo plano que, quando a versão muda, invalida
+    os caches e recalcula o top-N com concorrência limitada, prioridade
+    baixa e recuando enquanto houver requisições de usuários em andamento
+
+Na API (api_laudo.py), com LAUDO_AQUECER=1:
+  LAUDO_AQUECER_TOP          segmentos recalculados por versão (padrão: 50)
+  LAUDO_AQUECER_CONCORRENCIA cálculos simultâneos do aquecedor (padrão: 2)
+  LAUDO_AQUECER_INTERVALO    segundos entre verificações da versão (padrão: 60)
+  LAUDO_ACESSOS_PATH         arquivo JSON onde o contador é salvo/recarregado
+
+Como os caches passam a ser invalidados a cada nova versão, LAUDO_CACHE_TTL
+pode subir (ex.: 86400) sem servir dados velhos: toda mudança de anúncio que
+altera comparáveis (inclusive só endereço, bairro dentro do mesmo segmento
+do rollup ou grupo_duplicado) grava um evento em mudanca_imovel
+(utils/mudancas.py), e cargas em massa e dedup --reconstruir gravam um evento
+global. Alterações feitas direto no banco, fora desses caminhos, só aparecem
+depois do TTL.
+
+Comando separado (aquece uma API em execução pelo HTTP, a partir do
+arquivo de acessos; dentro de api/):
+  python -m utils.aquecimento --acessos acessos.json --url http://127.0.0.1:8000
+  python -m utils.aquecimento --acessos acessos.json --listar
+"""
+
+import os
+import json
+import time
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import snapshot_mmap, mudancas
+from utils.storage import StorageBackend, get_backend
+
+TOP_PADRAO = 50
+CONCORRENCIA_PADRAO = 2
+INTERVALO_PADRAO = 60.0
+MEIA_VIDA_ACESSOS = 6 * 3600.0   # segundos
+MAX_SEGMENTOS = 5000
+LIMIAR_OCUPADO = 4               # cálculos de usuários em voo acima dos quais o aquecedor espera
+PAUSA = 0.05                     # segundos entre dois cálculos de uma mesma thread
+NICE = 10
+
+# parâmetros que não mudam os comparáveis (ficam fora da chave de acesso)
+PARAMS_IGNORADOS = ("limite", "estado_conservacao")
+
+
+# =========================
+# Contador de acessos
+# =========================
+class ContadorAcessos:
+    """
+    Pontuação por conjunto de parâmetros: +1 a cada acesso, caindo pela
+    metade a cada `meia_vida` segundos. Guarda no máximo `max_segmentos`
+    (os de menor pontuação saem primeiro).
+    """
+
+    def __init__(self, meia_vida: float = MEIA_VIDA_ACESSOS, max_segmentos: int = MAX_SEGMENTOS):
+        self.meia_vida = meia_vida
+        self.max_segmentos = max_segmentos
+        self._itens: dict = {}   # chave -> [pontos, t, params]
+        self._lock = threading.Lock()
+
+    def _pontos(self, item, agora: float) -> float:
+        return item[0] * 0.5 ** ((agora - item[1]) / self.meia_vida)
+
+    def registrar(self, params: dict, agora: float | None = None):
+        params = {k: v for k, v in params.items() if k not in PARAMS_IGNORADOS and v is not None}
+        chave = json.dumps(params, sort_keys=True, default=str)
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self._itens[chave] = [1.0, agora, params]
+            else:
+                item[0], item[1] = self._pontos(item, agora) + 1.0, agora
+            if len(self._itens) > 2 * self.max_segmentos:
+                self._podar(agora)
+
+    def _podar(self, agora: float):
+        ordem = sorted(self._itens, key=lambda k: self._pontos(self._itens[k], agora), reverse=True)
+        for chave in ordem[self.max_segmentos:]:
+            del self._itens[chave]
+
+    def top(self, n: int, agora: float | None = None) -> list:
+        """[(pontos, params)] dos n segmentos mais pedidos."""
+        agora = time.time() if agora is None else agora
+        with self._lock:
+            itens = [(self._pontos(it, agora), dict(it[2])) for it in self._itens.values()]
+        itens.sort(key=lambda x: x[0], reverse=True)
+        return itens[:n]
+
+    def __len__(self):
+        return len(self._itens)
+
+    def salvar(self, caminho: str):
+        with self._lock:
+            dados = [{"pontos": p, "t": t, "params": params} for p, t, params in self._itens.values()]
+        tmp = caminho + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"meia_vida": self.meia_vida, "itens": dados}, f, ensure_ascii=False)
+        os.replace(tmp, caminho)
+
+    def carregar(self, caminho: str) -> int:
+        if not os.path.exists(caminho):
+            return 0
+        with open(caminho, encoding="utf-8") as f:
+            dados = json.load(f)
+        with self._lock:
+            for it in dados.get("itens", []):
+                chave = json.dumps(it["params"], sort_keys=True, default=str)
+                self._itens[chave] = [float(it["pontos"]), float(it["t"]), it["params"]]
+        return len(dados.get("itens", []))
+
+
+# =========================
+# Versão dos dados
+# =========================
+def versao_dados(backend: StorageBackend | None = None) -> tuple:
+    """
+    (geração do snapshot mmap, última versão de mudanca_imovel, nº de
+    segmentos, nº de anúncios, soma de R$/m²) de rollup_m2. A versão de
+    mudanca_imovel muda com qualquer alteração que afete comparáveis,
+    inclusive as que não mexem nos totais do rollup (endereço, bairro no
+    mesmo segmento, grupo_duplicado); os totais cobrem bases sem o canal.
+    Ambas as tabelas são lidas por agregado/índice, então a leitura é barata.
+    """
+    snap = snapshot_mmap.snapshot_atual()
+    with (backend or get_backend()).cursor() as cur:
+        ultima = mudancas.ultima_versao(cur)
+        cur.execute("SELECT COUNT(*) AS segmentos, COALESCE(SUM(n), 0) AS n, "
+                    "COALESCE(SUM(soma_m2), 0) AS soma FROM rollup_m2")
+        r = cur.fetchone()
+    return (snap.geracao if snap else None, ultima, int(r["segmentos"]), int(r["n"]),
+            round(float(r["soma"]), 2))
+
+
+def _baixar_prioridade():
+    """nice na thread atual (Linux: setpriority vale por thread); ignora onde não houver suporte."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), NICE)
+    except (AttributeError, OSError):
+        pass
+
+
+# =========================
+# Aquecedor
+# =========================
+class Aquecedor:
+    """
+    calcular(params): cálculo da estimativa (na API, via single-flight, que
+      preenche cache_comparaveis e os índices k-NN)
+    invalidar(): descarta os caches quando a versão muda
+    em_voo(): cálculos em andamento no processo (inclui os do aquecedor)
+    versao(): ver versao_dados
+    """
+
+    def __init__(self, acessos: ContadorAcessos, calcular, invalidar=None, em_voo=None,
+                 versao=versao_dados, top: int = TOP_PADRAO, concorrencia: int = CONCORRENCIA_PADRAO,
+                 intervalo: float = INTERVALO_PADRAO, caminho_acessos: str | None = None):
+        self.acessos = acessos
+        self.calcular = calcular
+        self.invalidar = invalidar
+        self.em_voo = em_voo
+        self.versao = versao
+        self.top = top
+        self.concorrencia = max(1, concorrencia)
+        self.intervalo = intervalo
+        self.caminho_acessos = caminho_acessos
+        self._versao = None
+        self._proprios = 0
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._primeiro_ciclo = threading.Event()
+        self._thread = None
+        self.estat = {"ciclos": 0, "aquecidos": 0, "falhas": 0, "esperas": 0,
+                      "ultimo_ciclo_s": None, "ultima_versao_em": None}
+
+    # ----- ciclo -----
+    def verificar(self) -> bool:
+        """Aquece se a versão dos dados mudou (ou na primeira verificação). True se aqueceu."""
+        versao = self.versao()
+        if versao == self._versao:
+            return False
+        primeira = self._versao is None
+        self._versao = versao
+        self.estat["ultima_versao_em"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        if not primeira and self.invalidar:
+            self.invalidar()
+        self.aquecer()
+        return True
+
+    def aquecer(self, alvo: list | None = None) -> int:
+        """Recalcula `alvo` (lista de params; padrão: o top-N atual). Retorna quantos aqueceu."""
+        t0 = time.perf_counter()
+        if alvo is None:
+            alvo = [params for _, params in self.acessos.top(self.top)]
+        antes = self.estat["aquecidos"]
+        with ThreadPoolExecutor(max_workers=self.concorrencia, initializer=_baixar_prioridade,
+                                thread_name_prefix="aquecedor") as ex:
+            list(ex.map(self._aquecer_um, alvo))
+        self.estat["ciclos"] += 1
+        self.estat["ultimo_ciclo_s"] = round(time.perf_counter() - t0, 2)
+        return self.estat["aquecidos"] - antes
+
+    def _ocupado(self) -> bool:
+        if self.em_voo is None:
+            return False
+        with self._lock:
+            proprios = self._proprios
+        return self.em_voo() - proprios > LIMIAR_OCUPADO
+
+    def _aquecer_um(self, params: dict):
+        # cede a vez às requisições de usuários (no máximo um intervalo de espera)
+        limite = time.monotonic() + self.intervalo
+        while self._ocupado() and time.monotonic() < limite:
+            self.estat["esperas"] += 1
+            if self._parar.wait(PAUSA * 10):
+                return
+        if self._parar.is_set():
+            return
+        with self._lock:
+            self._proprios += 1
+        try:
+            self.calcular(params)
+            self.estat["aquecidos"] += 1
+        except Exception as e:
+            self.estat["falhas"] += 1
+            print(f"[WARN] aquecimento de {params}: {e}")
+        finally:
+            with self._lock:
+                self._proprios -= 1
+        self._parar.wait(PAUSA)
+
+    # ----- thread -----
+    def _executar(self):
+        _baixar_prioridade()
+        espera = 0.0
+        while not self._parar.wait(espera):
+            espera = self.intervalo
+            try:
+                self.verificar()
+                if self.caminho_acessos:
+                    self.acessos.salvar(self.caminho_acessos)
+            except Exception as e:
+                print(f"[WARN] aquecedor: {e}")
+            finally:
+                self._primeiro_ciclo.set()
+
+    def iniciar(self):
+        if self.caminho_acessos:
+            try:
+                n = self.acessos.carregar(self.caminho_acessos)
+                print(f"[INFO] aquecedor: {n} segmento(s) de {self.caminho_acessos}")
+            except (OSError, ValueError, KeyError) as e:
+                print(f"[WARN] acessos não carregados de {self.caminho_acessos}: {e}")
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._executar, name="aquecedor", daemon=True)
+        self._thread.start()
+
+    def aguardar_primeiro_ciclo(self, timeout: float | None = None) -> bool:
+        """Espera o aquecimento inicial (top-N carregado de caminho_acessos). False se o prazo venceu."""
+        return self._primeiro_ciclo.wait(timeout)
+
+    def parar(self, timeout: float = 5.0):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.caminho_acessos:
+            self.acessos.salvar(self.caminho_acessos)
+
+    def metricas(self) -> dict:
+        return dict(self.estat, ativo=bool(self._thread and self._thread.is_alive()),
+                    versao=list(self._versao) if self._versao else None,
+                    segmentos_rastreados=len(self.acessos), top=self.top,
+                    concorrencia=self.concorrencia)
+
+
+# =========================
+# CLI (aquece uma API em execução)
+# =========================
+def aquecer_por_http(url_base: str, alvo: list, concorrencia: int, timeout: float) -> tuple:
+    import urllib.parse
+    import urllib.request  # só o comando separado usa (fora do import da API)
+
+    def um(params):
+        qs = urllib.parse.urlencode({k: str(v).lower() if isinstance(v, bool) else v for k, v in params.items()})
+        try:
+            with urllib.request.urlopen(f"{url_base.rstrip('/')}/api/laudo/estimativa?{qs}", timeout=timeout) as r:
+                return r.status == 200
+        except OSError as e:
+            print(f"[WARN] {params}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, concorrencia)) as ex:
+        ok = sum(ex.map(um, alvo))
+    return ok, len(alvo) - ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Pré-aquecimento dos segmentos mais pedidos da estimativa.")
+    ap.add_argument("--acessos", default=os.getenv("LAUDO_ACESSOS_PATH"),
+                    help="Arquivo de acessos salvo pela API (LAUDO_ACESSOS_PATH).")
+    ap.add_argument("--url", help="Raiz da API a aquecer (ex.: http://127.0.0.1:8000).")
+    ap.add_argument("--top", type=int, default=TOP_PADRAO, help=f"Segmentos (padrão: {TOP_PADRAO}).")
+    ap.add_argument("--concorrencia", type=int, default=CONCORRENCIA_PADRAO)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--listar", action="store_true", help="Só mostra o top-N.")
+    ap.add_argument("--versao", action="store_true", help="Mostra a versão atual dos dados.")
+    args = ap.parse_args()
+
+    if args.versao:
+        print(f"[INFO] versão dos dados: {versao_dados()}")
+    if not args.acessos:
+        if not args.versao:
+            ap.print_help()
+        return
+
+    acessos = ContadorAcessos()
+    acessos.carregar(args.acessos)
+    top = acessos.top(args.top)
+    if args.listar or not args.url:
+        for pontos, params in top:
+            print(f"{pontos:8.2f}  {json.dumps(params, ensure_ascii=False, sort_keys=True)}")
+        return
+
+    t0 = time.perf_counter()
+    ok, falhas = aquecer_por_http(args.url, [p for _, p in top], args.concorrencia, args.timeout)
+    print(f"[OK] {ok} segmento(s) aquecido(s), {falhas} falha(s) em {time.perf_counter() - t0:.1f}s")
+    print("[INFO] com vários workers, cada requisição aquece só o worker que a atendeu")
+
+
+if __name__ == "__main__":
+    main()
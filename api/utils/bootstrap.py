@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+bootstrap.py
+Intervalo de confiança (bootstrap) do R$/m² ponderado por proximidade.
+
+Vetorizado com NumPy (bootstrap de Poisson): com semente fixa, uma única
+matriz de contagens C ~ Poisson(1), B x N_MAX (6,4 MB em float64 para
+B = 400 e N_MAX = 2000), é gerada por processo. Para n comparáveis,
+C[:, :n] diz quantas vezes cada comparável entra em cada reamostra (a
+contagem Poisson(1) independente aproxima a multinomial do bootstrap
+clássico e, ao contrário dela, vale para qualquer prefixo de colunas), e
+todas as estimativas saem de um único produto matricial:
+    C[:, :n] @ [w*x, w]  ->  sum(c*w*x) / sum(c*w) por linha
+Custa cerca de 0,5 ms para n = 2000 e B = 400 (antes, com sorteio de
+índices e np.take, eram ~4 ms). Acima de N_MAX as contagens são
+sorteadas na hora.
+
+pip install numpy (opcional; sem NumPy o intervalo não é calculado)
+"""
+
+from functools import lru_cache
+
+SEMENTE = 20251020
+REAMOSTRAGENS = 400
+N_MAX = 2000   # comparables_limit da cascata
+
+
+@lru_cache(maxsize=2)
+def _contagens(reamostragens: int, semente: int):
+    import numpy as np
+    return np.random.default_rng(semente).poisson(1.0, (reamostragens, N_MAX)).astype(np.float64)
+
+
+def preparar(reamostragens: int = REAMOSTRAGENS, semente: int = SEMENTE):
+    """Gera a matriz de contagens antes da primeira requisição (ImportError sem NumPy)."""
+    _contagens(reamostragens, semente)
+
+
+def _contagens_n(n: int, reamostragens: int, semente: int):
+    import numpy as np
+    if n > N_MAX:
+        return np.random.default_rng(semente).poisson(1.0, (reamostragens, n)).astype(np.float64)
+    return _contagens(reamostragens, semente)[:, :n]
+
+
+def intervalo_bootstrap(valores_m2: list, pesos: list, nivel: float = 0.90,
+                        reamostragens: int = REAMOSTRAGENS, semente: int = SEMENTE) -> dict | None:
+    """
+    Intervalo percentil do R$/m² ponderado. None se NumPy não estiver
+    instalado ou a amostra tiver menos de 3 comparáveis.
+    """
+    if len(valores_m2) < 3:
+        return None
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+
+    x = np.asarray(valores_m2, dtype=np.float64)
+    w = np.asarray(pesos, dtype=np.float64)
+    if not w.sum() > 0:
+        w = np.ones_like(x)
+    v = np.empty((len(x), 2))
+    v[:, 0] = w * x
+    v[:, 1] = w
+    somas = _contagens_n(len(x), reamostragens, semente) @ v
+    den = somas[:, 1]
+    # reamostras vazias ou só com comparáveis de peso 0 não têm média ponderada
+    ok = den > 0
+    if ok.sum() < 2:
+        return None
+    estimativas = somas[ok, 0] / den[ok]
+
+    alfa = (1.0 - nivel) / 2.0
+    lo, hi = np.quantile(estimativas, [alfa, 1.0 - alfa])
+    return {
+        "nivel": nivel,
+        "valor_m2_min": float(lo),
+        "valor_m2_max": float(hi),
+        "erro_padrao_m2": float(estimativas.std(ddof=1)),
+        "reamostragens": reamostragens,
+    }
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+cache.py
+Cache LRU com expiração (TTL), seguro entre threads. Cada entrada pode levar
+um segmento (dict com cidade/bairro/tipo/tipo_negocio...) para invalidação
+seletiva.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class CacheTTL:
+    def __init__(self, max_itens: int = 2048, ttl: float = 300.0):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._dados: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+
+    def get(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None or item[0] < agora:
+                if item is not None:
+                    del self._dados[chave]
+                self.faltas += 1
+                return None
+            self._dados.move_to_end(chave)
+            self.acertos += 1
+            return item[1]
+
+    def set(self, chave, valor, segmento: dict | None = None):
+        with self._lock:
+            self._dados[chave] = (time.monotonic() + self.ttl, valor, segmento or {})
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+
+    def invalidar(self, predicado=None) -> int:
+        """Remove entradas cujo segmento satisfaz `predicado` (None = todas)."""
+        with self._lock:
+            alvo = [k for k, (_, _, seg) in self._dados.items() if predicado is None or predicado(seg)]
+            for k in alvo:
+                del self._dados[k]
+            return len(alvo)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            return {"itens": len(self._dados), "acertos": self.acertos, "faltas": self.faltas}
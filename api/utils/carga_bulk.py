@@ -0,0 +1,414 @@
+# -*- coding: utf-8 -*-
+"""
+carga_bulk.py
+Carga em massa da tabela endereco (todos_os_enderecos.json) e restauração de
+dumps SQL (mysqldump / phpMyAdmin) sem INSERT linha a linha.
+
+Fluxo (memória constante, independente do tamanho da entrada):
+  1) leitura em streaming: o JSON é percorrido cidade a cidade (ijson se
+     instalado, senão um leitor incremental da stdlib) e o dump é lido linha
+     a linha, tupla a tupla
+  2) normalização com a mesma regra das rotas da API
+     (localidades.limpar_caixa_alta)
+  3) arquivos TSV em lotes (LINHAS_POR_LOTE), no formato padrão do LOAD DATA
+  4) cada lote é carregado e apagado em seguida:
+       MySQL  -> LOAD DATA LOCAL INFILE (unique_checks/foreign_key_checks
+                 desligados na sessão)
+       SQLite -> executemany numa transação por lote
+  5) índices secundários removidos antes da carga e recriados no final
+     (MySQL: um único ALTER TABLE por tabela)
+
+Uso (dentro de api/):
+  python -m utils.carga_bulk --enderecos
+  python -m utils.carga_bulk --enderecos ../webscraping/dfimoveis/metadata/todos_os_enderecos.json
+  python -m utils.carga_bulk --dump dfdb.sql --tabelas imoveis_df,endereco,tipo
+  python -m utils.carga_bulk --dump dfdb.sql --sem-esvaziar --lote 100000
+
+MySQL: o servidor precisa de local_infile=ON. Depois de restaurar imoveis_df,
+reconstruir as tabelas derivadas (rollups, dedup, knn, histórico).
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from itertools import groupby
+
+from utils.localidades import METADATA_DIR, limpar_caixa_alta, uf_da_cidade
+from utils.storage import StorageBackend, get_backend
+from utils.enderecos import incrementar_versao
+from utils import mudancas
+
+LINHAS_POR_LOTE = 200_000
+TAMANHO_LEITURA = 1 << 16  # bytes lidos por vez do JSON (leitor sem ijson)
+
+ENDERECOS_JSON = os.path.join(METADATA_DIR, "todos_os_enderecos.json")
+COLUNAS_ENDERECO = ["uf", "cidade", "bairro", "endereco"]
+
+# colunas de cada tabela, na ordem do schema_dfdb.sql (dumps sem lista de colunas)
+COLUNAS_TABELAS = {
+    "imoveis_df": [
+        "ID", "CIDADE", "BAIRRO", "endereco", "tipo", "Titulo", "Metragem", "QUARTOS", "SUITES",
+        "VAGAS", "VALOR", "tipo_negocio", "valor_m2", "data_da_busca", "grupo_duplicado",
+    ],
+    "endereco": COLUNAS_ENDERECO,
+    "tipo": ["id", "tipo"],
+    "endereco_versao": ["uf", "versao", "atualizado_em"],
+}
+
+
+# =========================
+# TSV
+# =========================
+def _campo(v) -> str:
+    if v is None:
+        return "\\N"
+    s = v if isinstance(v, str) else str(v)
+    if "\\" in s or "\t" in s or "\n" in s or "\r" in s:
+        s = s.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+    return s
+
+
+class LotesTSV:
+    """Grava linhas em arquivos TSV de até `linhas_por_lote` linhas; devolve cada arquivo fechado."""
+
+    def __init__(self, pasta: str, prefixo: str, linhas_por_lote: int = LINHAS_POR_LOTE):
+        self.pasta = pasta
+        self.prefixo = prefixo
+        self.linhas_por_lote = linhas_por_lote
+        self._f = None
+        self._n = 0
+        self._seq = 0
+
+    def escrever(self, linha) -> str | None:
+        """Acrescenta uma linha; retorna o caminho do lote quando ele fica cheio."""
+        if self._f is None:
+            self._seq += 1
+            caminho = os.path.join(self.pasta, f"{self.prefixo}_{self._seq:05d}.tsv")
+            self._f = open(caminho, "w", encoding="utf-8", newline="\n")
+        self._f.write("\t".join(_campo(v) for v in linha) + "\n")
+        self._n += 1
+        if self._n >= self.linhas_por_lote:
+            return self.fechar()
+        return None
+
+    def fechar(self) -> str | None:
+        if self._f is None:
+            return None
+        caminho = self._f.name
+        self._f.close()
+        self._f, self._n = None, 0
+        return caminho
+
+
+# =========================
+# Leitura em streaming: JSON
+# =========================
+def _itens_objeto_json(f):
+    """(chave, valor) do objeto JSON de topo, um de cada vez (stdlib)."""
+    dec = json.JSONDecoder()
+    buf, pos, fim = "", 0, False
+
+    def garantir(n_min: int = 1):
+        nonlocal buf, pos, fim
+        while not fim and len(buf) - pos < n_min:
+            bloco = f.read(TAMANHO_LEITURA)
+            if not bloco:
+                fim = True
+            buf = buf[pos:] + bloco
+            pos = 0
+
+    def pular_espacos():
+        nonlocal pos
+        while True:
+            garantir()
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or fim:
+                return
+
+    def decodificar():
+        # lê mais texto até o valor inteiro caber no buffer
+        nonlocal pos
+        while True:
+            try:
+                valor, pos = dec.raw_decode(buf, pos)
+                return valor
+            except json.JSONDecodeError:
+                if fim:
+                    raise
+                garantir(len(buf) - pos + TAMANHO_LEITURA)
+
+    pular_espacos()
+    if buf[pos:pos + 1] != "{":
+        raise ValueError("JSON de endereços deve ser um objeto {cidade: {bairro: [...]}}")
+    pos += 1
+    while True:
+        pular_espacos()
+        if buf[pos:pos + 1] == "}":
+            return
+        if buf[pos:pos + 1] == ",":
+            pos += 1
+            pular_espacos()
+        chave = decodificar()
+        pular_espacos()
+        if buf[pos:pos + 1] != ":":
+            raise ValueError(f"JSON inválido perto de {buf[pos:pos + 40]!r}")
+        pos += 1
+        pular_espacos()
+        yield chave, decodificar()
+
+
+def itens_json(caminho: str):
+    """Itens de topo do JSON; usa ijson (pip install ijson) quando disponível."""
+    try:
+        import ijson
+    except ImportError:
+        ijson = None
+    if ijson is not None:
+        with open(caminho, "rb") as fb:
+            yield from ijson.kvitems(fb, "")
+        return
+    with open(caminho, "r", encoding="utf-8") as f:
+        yield from _itens_objeto_json(f)
+
+
+def linhas_enderecos(caminho: str = ENDERECOS_JSON):
+    """(uf, cidade, bairro, endereco) normalizados, sem repetir dentro do mesmo bairro."""
+    for cidade, bairros in itens_json(caminho):
+        c = limpar_caixa_alta(cidade)
+        if not c or not isinstance(bairros, dict):
+            continue
+        uf = uf_da_cidade(c) or "ND"
+        for bairro, enderecos in bairros.items():
+            b = limpar_caixa_alta(bairro)
+            if not b:
+                continue
+            vistos = set()
+            for e in enderecos or []:
+                e = limpar_caixa_alta(e)
+                if e and e not in vistos:
+                    vistos.add(e)
+                    yield (uf, c, b, e)
+
+
+# =========================
+# Leitura em streaming: dump SQL
+# =========================
+RE_INSERT = re.compile(
+    r"^\s*INSERT\s+(?:IGNORE\s+)?INTO\s+`?(\w+)`?\s*(?:\(([^)]*)\))?\s*VALUES\s*", re.I
+)
+RE_TOKEN = re.compile(
+    r"\s*(?:(\()|(\))|(,)|(;)|'((?:[^'\\]|\\.|'')*)'|([^\s,();']+))", re.S
+)
+_ESCAPES_SQL = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+
+def _texto_sql(s: str) -> str:
+    if "\\" not in s and "''" not in s:
+        return s
+    return re.sub(r"\\(.)|''", lambda m: "'" if m.group(1) is None else _ESCAPES_SQL.get(m.group(1), m.group(1)),
+                  s, flags=re.S)
+
+
+def _tuplas(texto: str, estado: dict):
+    """Tuplas de um trecho de VALUES; `estado` guarda o fim do comando (';')."""
+    pos, atual = 0, None
+    while pos < len(texto):
+        m = RE_TOKEN.match(texto, pos)
+        if not m:
+            if texto[pos:].strip():
+                raise ValueError(f"Dump inválido perto de {texto[pos:pos + 40]!r}")
+            return
+        pos = m.end()
+        abre, fecha, _, ponto_virgula, texto_sql, literal = m.groups()
+        if abre:
+            atual = []
+        elif fecha:
+            yield tuple(atual)
+            atual = None
+        elif ponto_virgula:
+            estado["em_insert"] = False
+            return
+        elif texto_sql is not None:
+            atual.append(_texto_sql(texto_sql))
+        elif literal is not None:
+            atual.append(None if literal.upper() == "NULL" else literal)
+
+
+def linhas_dump(caminho: str, tabelas: set | None = None):
+    """
+    (tabela, colunas, tupla) de cada linha dos INSERT do dump, sob demanda.
+    Aceita um INSERT por linha (mysqldump) ou uma tupla por linha (phpMyAdmin).
+    """
+    estado = {"em_insert": False}
+    tabela, colunas = None, None
+    with open(caminho, "r", encoding="utf-8", errors="replace") as f:
+        for linha in f:
+            if not estado["em_insert"]:
+                m = RE_INSERT.match(linha)
+                if not m:
+                    continue
+                tabela = m.group(1)
+                colunas = [c.strip(" `") for c in m.group(2).split(",")] if m.group(2) else None
+                estado["em_insert"] = True
+                linha = linha[m.end():]
+            if tabelas and tabela not in tabelas:
+                if linha.rstrip().endswith(";"):
+                    estado["em_insert"] = False
+                continue
+            for tupla in _tuplas(linha, estado):
+                yield tabela, colunas, tupla
+
+
+# =========================
+# Carga
+# =========================
+class Carga:
+    """Carga de uma tabela: índices adiados, lotes TSV carregados e apagados um a um."""
+
+    def __init__(self, backend: StorageBackend, tabela: str, colunas: list,
+                 pasta: str, esvaziar: bool = True, linhas_por_lote: int = LINHAS_POR_LOTE):
+        self.backend = backend
+        self.tabela = tabela
+        self.colunas = colunas
+        self.esvaziar = esvaziar
+        self.lotes = LotesTSV(pasta, tabela, linhas_por_lote)
+        self.linhas = 0
+        self.indices = []
+        self._conn = None
+
+    def __enter__(self):
+        self._conn = self.backend.conectar_carga()
+        self.indices = self.backend.listar_indices_secundarios(self._conn, self.tabela)
+        for nome, _ in self.indices:
+            self.backend.remover_indice(self._conn, self.tabela, nome)
+        if self.esvaziar:
+            self.backend.esvaziar(self._conn, self.tabela)
+        return self
+
+    def adicionar(self, linha):
+        pronto = self.lotes.escrever(linha)
+        if pronto:
+            self._carregar(pronto)
+
+    def _carregar(self, arquivo: str):
+        try:
+            self.linhas += self.backend.carregar_tsv(self._conn, self.tabela, self.colunas, arquivo)
+        finally:
+            os.remove(arquivo)
+        print(f"[INFO] {self.tabela}: {self.linhas} linha(s) carregada(s)")
+
+    def __exit__(self, tipo_exc, exc, tb):
+        try:
+            resto = self.lotes.fechar()
+            if resto and tipo_exc is None:
+                self._carregar(resto)
+            elif resto:
+                os.remove(resto)
+            # recria os índices mesmo se a carga falhou no meio
+            t0 = time.perf_counter()
+            self.backend.recriar_indices(self._conn, self.tabela, self.indices)
+            if self.indices:
+                print(f"[INFO] {self.tabela}: {len(self.indices)} índice(s) recriado(s) "
+                      f"em {time.perf_counter() - t0:.1f}s")
+            if tipo_exc is None:
+                self.backend.pos_carga(self._conn, self.tabela)
+        finally:
+            self._conn.close()
+        return False
+
+
+def _nova_versao_enderecos(backend: StorageBackend, ufs: set | None = None):
+    """Incrementa a versão das UFs recarregadas (ETag/cache de /api/laudo/enderecos/{uf})."""
+    with backend.transacao() as cur:
+        if ufs is None:
+            cur.execute("SELECT DISTINCT uf FROM endereco")
+            ufs = {r["uf"] for r in cur.fetchall()}
+        for uf in sorted(ufs):
+            incrementar_versao(cur, uf)
+
+
+def carregar_enderecos(backend: StorageBackend, caminho: str = ENDERECOS_JSON, esvaziar: bool = True,
+                       linhas_por_lote: int = LINHAS_POR_LOTE) -> int:
+    pasta = tempfile.mkdtemp(prefix="carga_bulk_")
+    ufs = set()
+    try:
+        with Carga(backend, "endereco", COLUNAS_ENDERECO, pasta, esvaziar, linhas_por_lote) as carga:
+            for linha in linhas_enderecos(caminho):
+                ufs.add(linha[0])
+                carga.adicionar(linha)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    _nova_versao_enderecos(backend, ufs)
+    return carga.linhas
+
+
+def restaurar_dump(backend: StorageBackend, caminho: str, tabelas: set | None = None, esvaziar: bool = True,
+                   linhas_por_lote: int = LINHAS_POR_LOTE) -> dict:
+    """
+    Carrega os INSERT do dump. Uma tabela por vez (o mysqldump agrupa os
+    INSERT de cada tabela); se a tabela reaparecer mais adiante, a carga
+    continua sem esvaziá-la de novo.
+    """
+    pasta = tempfile.mkdtemp(prefix="carga_bulk_")
+    totais: dict = {}
+    try:
+        for tabela, grupo in groupby(linhas_dump(caminho, tabelas), key=lambda x: x[0]):
+            _, colunas, primeira = next(grupo)
+            cols = colunas or COLUNAS_TABELAS.get(tabela)
+            if not cols:
+                raise ValueError(f"Colunas de {tabela} desconhecidas (dump sem lista de colunas).")
+            with Carga(backend, tabela, cols[:len(primeira)], pasta,
+                       esvaziar and tabela not in totais, linhas_por_lote) as carga:
+                carga.adicionar(primeira)
+                for _, _, tupla in grupo:
+                    carga.adicionar(tupla)
+            totais[tabela] = totais.get(tabela, 0) + carga.linhas
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    if "endereco" in totais:
+        _nova_versao_enderecos(backend)
+    if "imoveis_df" in totais:
+        # anúncios trocados em massa: a API (LAUDO_MUDANCAS=1) descarta todos os caches
+        with backend.transacao() as cur:
+            mudancas.registrar_carga(cur)
+    return totais
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga em massa (endereco / dump SQL) com índices adiados.")
+    ap.add_argument("--enderecos", nargs="?", const=ENDERECOS_JSON, metavar="JSON",
+                    help="Carrega a tabela endereco a partir do todos_os_enderecos.json.")
+    ap.add_argument("--dump", metavar="SQL", help="Restaura os INSERT de um dump (mysqldump/phpMyAdmin).")
+    ap.add_argument("--tabelas", help="Tabelas do dump a restaurar, separadas por vírgula (padrão: todas).")
+    ap.add_argument("--lote", type=int, default=LINHAS_POR_LOTE, help="Linhas por arquivo TSV.")
+    ap.add_argument("--sem-esvaziar", action="store_true", help="Não apaga o conteúdo atual das tabelas.")
+    args = ap.parse_args()
+
+    if not args.enderecos and not args.dump:
+        ap.print_help()
+        return
+
+    backend = get_backend()
+    esvaziar = not args.sem_esvaziar
+    t0 = time.perf_counter()
+    if args.enderecos:
+        n = carregar_enderecos(backend, args.enderecos, esvaziar, args.lote)
+        print(f"[OK] {n} endereço(s) carregado(s) de {args.enderecos} ({time.perf_counter() - t0:.1f}s)")
+    if args.dump:
+        tabelas = {t.strip() for t in args.tabelas.split(",") if t.strip()} if args.tabelas else None
+        totais = restaurar_dump(backend, args.dump, tabelas, esvaziar, args.lote)
+        for tabela, n in totais.items():
+            print(f"[OK] {tabela}: {n} linha(s)")
+        if "imoveis_df" in totais:
+            print("[INFO] Reconstrua as tabelas derivadas: python -m utils.rollups --reconstruir, "
+                  "utils.dedup --reconstruir, utils.historico --inicializar")
+        print(f"[OK] Dump restaurado em {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+coalescencia.py
+Single-flight: requisições simultâneas com a mesma chave compartilham um único
+cálculo em andamento. O primeiro (líder) executa; os demais (seguidores)
+esperam o resultado dele.
+
+Funciona nos dois caminhos de handler do FastAPI:
+  - sync  (def, threadpool)  -> executar(chave, fn, ...)       seguidor bloqueia a thread no Event
+  - async (async def, loop)  -> await executar_async(chave, coro_fn, ...)
+                                seguidor aguarda um Future, sem ocupar thread
+Um voo iniciado por um caminho atende seguidores do outro.
+"""
+
+import asyncio
+import threading
+
+
+def chave_normalizada(nome: str, **params) -> tuple:
+    """Chave estável: strings sem espaços extras e em CAIXA ALTA, '*' tratado como vazio."""
+    itens = []
+    for k in sorted(params):
+        v = params[k]
+        if isinstance(v, str):
+            v = " ".join(v.split()).upper()
+            if v in ("", "*"):
+                v = None
+        itens.append((k, v))
+    return (nome, tuple(itens))
+
+
+class _Voo:
+    __slots__ = ("evento", "resultado", "erro", "aguardando")
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.aguardando = []  # [(loop, future)] dos seguidores async
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._voos: dict = {}
+        self.lideres = 0
+        self.coalescidas = 0
+
+    def _entrar(self, chave):
+        with self._lock:
+            voo = self._voos.get(chave)
+            if voo is None:
+                voo = self._voos[chave] = _Voo()
+                self.lideres += 1
+                return voo, True
+            self.coalescidas += 1
+            return voo, False
+
+    def _concluir(self, chave, voo: _Voo):
+        with self._lock:
+            self._voos.pop(chave, None)
+            voo.evento.set()
+            aguardando, voo.aguardando = voo.aguardando, []
+        for loop, fut in aguardando:
+            loop.call_soon_threadsafe(_resolver, fut, voo)
+
+    def executar(self, chave, fn, *args, **kwargs):
+        voo, lider = self._entrar(chave)
+        if not lider:
+            voo.evento.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado
+        try:
+            voo.resultado = fn(*args, **kwargs)
+            return voo.resultado
+        except BaseException as e:
+            voo.erro = e
+            raise
+        finally:
+            self._concluir(chave, voo)
+
+    async def executar_async(self, chave, coro_fn, *args, **kwargs):
+        voo, lider = self._entrar(chave)
+        if not lider:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            with self._lock:
+                pronto = voo.evento.is_set()
+                if not pronto:
+                    voo.aguardando.append((loop, fut))
+            if pronto:
+                _resolver(fut, voo)
+            return await fut
+        try:
+            voo.resultado = await coro_fn(*args, **kwargs)
+            return voo.resultado
+        except BaseException as e:
+            voo.erro = e
+            raise
+        finally:
+            self._concluir(chave, voo)
+
+    def metricas(self) -> dict:
+        with self._lock:
+            em_voo = len(self._voos)
+        return {"lideres": self.lideres, "coalescidas": self.coalescidas, "em_voo": em_voo}
+
+
+def _resolver(fut, voo: _Voo):
+    if fut.done():
+        return
+    if voo.erro is not None:
+        fut.set_exception(voo.erro)
+    else:
+        fut.set_result(voo.resultado)
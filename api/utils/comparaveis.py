@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+"""
+comparaveis.py
+Núcleo do cálculo do m² por comparáveis, compartilhado pela API
+(api_laudo.calcular_estimativa) e pela avaliação em lote
+(utils/consultas_imoveis.py):
+
+  - parse_metragem_param / apply_like_tokens: filtros de entrada
+  - media_m2_comparaveis: cascata endereço -> bairro -> bairros vizinhos ->
+    cidade por janelas de recência (ou k-NN, utils/knn.py), com trim de
+    outliers e ponderação
+  - m2_por_agregados: média aparada do segmento em rollup_m2
+  - calcular_comparaveis: escolhe entre agregado e comparáveis
+  - metragem_alvo / valorar: metragem usada e valor estimado (ajuste por
+    estado de conservação, arredondamento, faixa de negociação)
+
+Sem print nem E/S além do cursor recebido: quem chama decide o que mostrar
+(consultas interrompidas pelo tempo máximo vão para a lista `avisos`).
+"""
+
+import re
+import time
+from datetime import datetime, timedelta
+from statistics import mean
+from typing import Optional, Tuple, List, Dict, Any
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float, parse_data_busca_to_epoch
+from utils.storage import get_backend
+from utils import rollups, knn, localidades
+from utils.dedup import FILTRO_REPRESENTANTE
+
+# ajuste do valor por estado de conservação: estado -> (ajuste, descrição)
+AJUSTES_ESTADO = {
+    "reformado": (0.10, "em excelente estado de conservação"),
+    "original": (-0.10, "necessitando de reforma/manutenção"),
+}
+ESTADO_PADRAO = (0.0, "em bom estado de conservação")
+FAIXA_NEGOCIACAO = 0.05  # ±5% em torno do valor estimado
+
+
+# =========================
+# Parsers / filtros
+# =========================
+def arredondar_milhar(v: float) -> float:
+    return round(v / 1000.0) * 1000.0
+
+
+def parse_metragem_param(valor) -> Optional[Tuple[float, float] or float]:
+    """'200-250' -> (200.0, 250.0); '220' -> 220.0; vazio ou '*' -> None."""
+    if not valor or valor == "*":
+        return None
+    s = str(valor).strip().lower().replace("m²", "")
+    s = re.sub(r"[^\d\-,]", "", s)
+    if "-" in s:
+        a, b = s.split("-", 1)
+        try:
+            return (float(a), float(b))
+        except ValueError:
+            return None
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def tokens_from_text(texto: str) -> List[str]:
+    """
+    Quebra o endereço em tokens alfanuméricos úteis para LIKE.
+    Ex.: 'QS 5 Rua 400 - Residencial Montana' -> ['QS', '5', 'RUA', '400', 'RESIDENCIAL', 'MONTANA']
+    """
+    toks = re.findall(r"[A-Za-z0-9]+", str(texto or "").upper())
+    return [t for t in toks if t]
+
+
+def apply_like_tokens(sql_base: str, params: list, campo: str, texto: str):
+    """Para cada token, adiciona 'AND campo LIKE %token%' (AND entre os tokens)."""
+    toks = tokens_from_text(texto)
+    for t in toks:
+        sql_base += f" AND {campo} LIKE %s"
+        params.append(f"%{t}%")
+    return sql_base, params
+
+
+# =========================
+# Cascata de comparáveis
+# =========================
+# Recência: janelas de data_da_busca lidas da mais nova para a mais antiga
+# (meses; None = todo o restante do histórico). A leitura de um nível para
+# assim que junta AMOSTRA_SUFICIENTE comparáveis.
+JANELAS_RECENCIA_MESES = (6, 24, None)
+AMOSTRA_SUFICIENTE = 200
+
+
+def cortes_recencia(janelas_meses) -> List[Optional[str]]:
+    """Datas de corte ('YYYY-MM-DD HH:MM:SS', mesmo formato de data_da_busca) de cada janela."""
+    agora = datetime.now()
+    return [(agora - timedelta(days=30 * m)).strftime("%Y-%m-%d %H:%M:%S") if m else None
+            for m in janelas_meses]
+
+
+def media_m2_comparaveis(cursor,
+                         bairro: Optional[str],
+                         cidade: Optional[str],
+                         endereco: Optional[str],
+                         quartos: Optional[int],
+                         suites: Optional[int],
+                         vagas: Optional[int],
+                         tipo: Optional[str],
+                         metragem_alvo: Optional[float],
+                         metragem_intervalo: Optional[Tuple[float, float]],
+                         tipo_negocio: str = "Venda",
+                         tolerancia_pct: float = 0.10,
+                         trim_quantil: float = 0.10,
+                         comparables_limit: int = 2000,
+                         min_amostra_local: int = 5,
+                         backend=None,
+                         modo: str = "cascata",
+                         k_vizinhos: int = 50,
+                         colapsar_duplicados: bool = True,
+                         janelas_meses=JANELAS_RECENCIA_MESES,
+                         amostra_suficiente: int = AMOSTRA_SUFICIENTE,
+                         meia_vida_dias: Optional[float] = None,
+                         tempo_max_ms: Optional[int] = None,
+                         avisos: Optional[list] = None,
+                         pesos_usados: Optional[list] = None):
+    """
+    Retorna (valor_m2_robusto, n_usados, nivel, parsed_trim)
+    nivel ∈ {'endereco','bairro','bairros_vizinhos','cidade','knn'}
+    parsed_trim = lista [(m, v, pm2, id, epoch_busca)]
+    modo='knn': k vizinhos mais próximos no índice em memória da cidade
+    (utils/knn.py); se a amostra não bastar, cai na cascata.
+    colapsar_duplicados: usa só o representante de cada grupo_duplicado (utils/dedup.py).
+    janelas_meses: em cada nível lê os anúncios mais recentes primeiro (ver
+    JANELAS_RECENCIA_MESES); vazio/None = todo o histórico numa consulta.
+    meia_vida_dias: se enviado, o peso de cada comparável decai 50% a cada meia-vida.
+    tempo_max_ms: limite de cada consulta da cascata; a consulta interrompida
+    (ex.: LIKE de endereço varrendo a tabela) encerra o nível e a cascata segue;
+    o aviso vai para `avisos`, se enviada (a função não imprime nada).
+    pesos_usados: se enviada, recebe os pesos da média do nível escolhido,
+    alinhados com parsed_trim (distância no k-NN; proximidade x recência na
+    cascata; 1.0 na média simples), para o intervalo bootstrap.
+    bairros_vizinhos: com bairro e cidade do índice de localidades, antes da
+    cidade inteira lê o bairro e seus vizinhos (localidades.vizinhos_bairro)
+    com (CIDADE = %s AND BAIRRO = %s) OR ... por par, pelos índices de imoveis_df.
+    A comparação é exata com os nomes canônicos do índice: no SQLite (sem a
+    collation acento/caixa do MySQL) linhas antigas gravadas fora da forma
+    canônica não entram nesse nível.
+    """
+    if modo == "knn" and metragem_alvo and cidade and cidade != "*":
+        res = media_m2_vizinhos(cursor, bairro=bairro, cidade=cidade, quartos=quartos,
+                                suites=suites, vagas=vagas, tipo=tipo,
+                                metragem_alvo=metragem_alvo, tipo_negocio=tipo_negocio,
+                                k=k_vizinhos, trim_quantil=trim_quantil,
+                                meia_vida_dias=meia_vida_dias, pesos_usados=pesos_usados)
+        if res[0] is not None:
+            return res
+
+    backend = backend or get_backend()
+    expr_metragem = backend.expr_metragem
+    cortes = cortes_recencia(janelas_meses or (None,))
+    # bairro sem amostra: o bairro e seus vizinhos antes da cidade inteira
+    vizinhos = localidades.vizinhos_bairro(cidade, bairro) if (bairro and cidade and cidade != "*") else []
+
+    def montar(nivel: str, desde: Optional[str], ate: Optional[str], limite: int):
+        base = "SELECT ID, Metragem, VALOR, data_da_busca FROM imoveis_df WHERE 1=1"
+        params = []
+        if nivel == "endereco" and endereco:
+            base, params = apply_like_tokens(base, params, "endereco", endereco)
+        elif nivel == "bairro" and bairro:
+            base += " AND BAIRRO LIKE %s"; params.append(f"%{bairro}%")
+        elif nivel == "bairros_vizinhos" and vizinhos:
+            # um par (cidade, bairro) por vez: BAIRRO IN + CIDADE IN pegaria o produto cartesiano
+            base += " AND (" + " OR ".join(["(CIDADE = %s AND BAIRRO = %s)"] * len(vizinhos)) + ")"
+            for c, b in vizinhos:
+                params.extend([c, b])
+        elif nivel == "cidade" and cidade:
+            base += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
+        else:
+            return None, None
+
+        if tipo:
+            base += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
+        if quartos is not None:
+            base += " AND QUARTOS = %s"; params.append(quartos)
+        if suites is not None:
+            base += " AND SUITES = %s"; params.append(suites)
+        if vagas is not None:
+            base += " AND VAGAS = %s"; params.append(vagas)
+        if tipo_negocio:
+            base += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
+
+        if metragem_intervalo and len(metragem_intervalo) == 2:
+            a, b = metragem_intervalo
+            base += f" AND {expr_metragem} BETWEEN %s AND %s"
+            params.extend([a, b])
+        elif metragem_alvo:
+            a = metragem_alvo * (1 - tolerancia_pct)
+            b = metragem_alvo * (1 + tolerancia_pct)
+            base += f" AND {expr_metragem} BETWEEN %s AND %s"
+            params.extend([a, b])
+
+        if colapsar_duplicados:
+            base += FILTRO_REPRESENTANTE
+
+        # janela [desde, ate) de data_da_busca; a mais antiga inclui datas nulas
+        if desde:
+            base += " AND data_da_busca >= %s"; params.append(desde)
+        if ate:
+            base += " AND data_da_busca < %s" if desde else " AND (data_da_busca < %s OR data_da_busca IS NULL)"
+            params.append(ate)
+
+        base += f" ORDER BY data_da_busca DESC LIMIT {limite}"
+        return base, params
+
+    nivel_ordem = []
+    if endereco:
+        nivel_ordem.append("endereco")
+    nivel_ordem.append("bairro")
+    if vizinhos:
+        nivel_ordem.append("bairros_vizinhos")
+    nivel_ordem.append("cidade")
+
+    parsed = []
+    nivel_usado = None
+
+    for nv in nivel_ordem:
+        comps = []
+        ate = None
+        for desde in cortes:
+            sqlx, parx = montar(nv, desde, ate, comparables_limit - len(comps))
+            if not sqlx:
+                break
+            try:
+                with backend.tempo_maximo(cursor, tempo_max_ms):
+                    cursor.execute(sqlx, parx)
+                    linhas = cursor.fetchall()
+            except Exception as e:
+                if not backend.tempo_esgotado(e):
+                    raise
+                if avisos is not None:
+                    avisos.append(f"consulta do nível {nv} interrompida após {tempo_max_ms} ms")
+                break
+            for r in linhas:
+                m = parse_metragem_str_to_float(r["Metragem"])
+                v = parse_valor_str_to_float(r["VALOR"])
+                if m and m > 0 and v and v > 0:
+                    comps.append((m, v, v / m, r["ID"], parse_data_busca_to_epoch(r.get("data_da_busca"))))
+            # janela mais nova já basta: não lê o histórico mais antigo
+            if len(comps) >= min(amostra_suficiente, comparables_limit):
+                break
+            ate = desde
+
+        if (nv == "endereco" and len(comps) >= min_amostra_local) or (nv != "endereco" and len(comps) >= 3):
+            nivel_usado = nv
+            parsed = comps
+            break
+        parsed = comps
+
+    if not parsed:
+        return None, 0, (nivel_usado or "cidade"), []
+
+    if len(parsed) < 3:
+        return None, len(parsed), (nivel_usado or "cidade"), parsed
+
+    # trim outliers
+    per_m2 = sorted(x[2] for x in parsed)
+    if len(per_m2) > 10:
+        ql = per_m2[int(len(per_m2) * trim_quantil)]
+        qh = per_m2[int(len(per_m2) * (1 - trim_quantil)) - 1]
+        parsed_trim = [x for x in parsed if ql <= x[2] <= qh] or parsed
+    else:
+        parsed_trim = parsed
+
+    # ponderação por proximidade (e recência, se pedida)
+    if metragem_alvo or meia_vida_dias:
+        pesos = pesos_comparaveis(parsed_trim, metragem_alvo, meia_vida_dias)
+        valor_m2 = media_ponderada([x[2] for x in parsed_trim], pesos)
+    else:
+        pesos = [1.0] * len(parsed_trim)
+        valor_m2 = mean(x[2] for x in parsed_trim)
+    if pesos_usados is not None:
+        pesos_usados[:] = pesos
+
+    return valor_m2, len(parsed_trim), (nivel_usado or "cidade"), parsed_trim
+
+
+def pesos_proximidade(comps, metragem_alvo: float) -> List[float]:
+    """Peso 1/(1+|m - alvo|) de cada comparável (m, v, pm2, id, ...)."""
+    return [1.0 / (1.0 + abs(c[0] - metragem_alvo)) for c in comps]
+
+
+def pesos_recencia(comps, meia_vida_dias: float) -> List[float]:
+    """
+    Decaimento exponencial 0.5 ** ((idade - idade do mais novo) / meia-vida):
+    o comparável mais recente tem peso 1 mesmo com meia-vida curta ou amostra
+    antiga (sem underflow de todos os pesos para 0); data desconhecida = peso 1.
+    """
+    agora = time.time()
+    idades = [max(0.0, (agora - c[4]) / 86400.0) if len(c) > 4 and c[4] else None for c in comps]
+    idade_min = min((i for i in idades if i is not None), default=0.0)
+    return [1.0 if i is None else 0.5 ** ((i - idade_min) / meia_vida_dias) for i in idades]
+
+
+def media_ponderada(valores: list, pesos: list) -> float:
+    """Média ponderada; se os pesos somarem 0, média simples."""
+    total = sum(pesos)
+    if total <= 0:
+        return mean(valores)
+    return sum(p * v for p, v in zip(pesos, valores)) / total
+
+
+def pesos_comparaveis(comps, metragem_alvo: Optional[float], meia_vida_dias: Optional[float] = None) -> List[float]:
+    """Proximidade de metragem x recência (cada fator só quando aplicável)."""
+    pesos = pesos_proximidade(comps, metragem_alvo) if metragem_alvo else [1.0] * len(comps)
+    if meia_vida_dias:
+        pesos = [a * b for a, b in zip(pesos, pesos_recencia(comps, meia_vida_dias))]
+    return pesos
+
+
+def media_m2_vizinhos(cursor, bairro, cidade, quartos, suites, vagas, tipo,
+                      metragem_alvo: float, tipo_negocio: str, k: int = 50,
+                      trim_quantil: float = 0.10, meia_vida_dias: Optional[float] = None,
+                      pesos_usados: Optional[list] = None):
+    """
+    m² ponderado pelos k vizinhos mais próximos (mesma tupla de media_m2_comparaveis).
+    pesos_usados: se enviada, recebe os pesos (distância x recência) da média.
+    """
+    indice = knn.obter_indice(cursor, tipo_negocio, tipo, cidade)
+    viz = indice.vizinhos(metragem_alvo, quartos, suites, vagas, bairro, k)
+    if len(viz) < 3:
+        return None, len(viz), "knn", [c for _, c in viz]
+
+    # trim outliers (mesma regra da cascata)
+    per_m2 = sorted(c[2] for _, c in viz)
+    if len(per_m2) > 10:
+        ql = per_m2[int(len(per_m2) * trim_quantil)]
+        qh = per_m2[int(len(per_m2) * (1 - trim_quantil)) - 1]
+        viz = [(d, c) for d, c in viz if ql <= c[2] <= qh] or viz
+
+    pesos = knn.pesos_por_distancia([d for d, _ in viz])
+    if meia_vida_dias:
+        pesos = [a * b for a, b in zip(pesos, pesos_recencia([c for _, c in viz], meia_vida_dias))]
+    valor_m2 = media_ponderada([c[2] for _, c in viz], pesos)
+    if pesos_usados is not None:
+        pesos_usados[:] = pesos
+    return valor_m2, len(viz), "knn", [c for _, c in viz]
+
+
+def m2_por_agregados(cursor, cidade, bairro, tipo, quartos, suites, vagas,
+                     metragem_alvo, tipo_negocio, min_amostra: int = 5):
+    """
+    Média aparada do R$/m² a partir de rollup_m2 (mesma faixa de metragem do alvo).
+    Tenta o bairro e depois a cidade. Retorna a mesma tupla de media_m2_comparaveis
+    (sem lista de comparáveis) ou (None, 0, None, []) se a amostra não bastar.
+    """
+    filtros = {
+        "tipo_negocio": tipo_negocio, "cidade": cidade, "tipo": tipo,
+        "quartos": quartos, "suites": suites, "vagas": vagas,
+        "faixa_metragem": rollups.faixa_metragem(metragem_alvo),
+    }
+    niveis = []
+    if bairro and bairro != "*":
+        niveis.append(("agregado_bairro", dict(filtros, bairro=bairro)))
+    niveis.append(("agregado_cidade", filtros))
+
+    for nivel, f in niveis:
+        agg = rollups.consultar(cursor, f).get(())
+        if agg and agg["amostras"] >= min_amostra and agg["media_aparada_m2"]:
+            return agg["media_aparada_m2"], agg["amostras"], nivel, []
+    return None, 0, None, []
+
+
+def calcular_comparaveis(cursor, backend, cidade, bairro, endereco, tipo, quartos, suites, vagas,
+                         tipo_negocio, metragem_alvo, metragem_intervalo, tolerancia_m2_pct,
+                         usar_agregados: bool = False, modo_comparaveis: str = "cascata",
+                         k_vizinhos: int = 50, meia_vida_dias: Optional[float] = None,
+                         tempo_max_ms: Optional[int] = None, avisos: Optional[list] = None) -> Dict[str, Any]:
+    """
+    Base de m² da estimativa (agregado do segmento ou comparáveis), no formato
+    guardado em cache_comparaveis da API: {valor_m2, n_usados, nivel, comps, pesos}.
+    pesos: os da média do nível escolhido, alinhados com comps (o intervalo
+    bootstrap tem de reamostrar o mesmo estimador que deu valor_m2).
+    """
+    pesos = []
+    # Caminho rápido: agregado do segmento (sem ponderação por comparável)
+    valor_m2 = None
+    if usar_agregados and metragem_alvo and cidade and cidade != "*":
+        valor_m2, n_usados, nivel, comps = m2_por_agregados(
+            cursor, cidade=cidade, bairro=bairro, tipo=tipo,
+            quartos=quartos, suites=suites, vagas=vagas,
+            metragem_alvo=metragem_alvo, tipo_negocio=tipo_negocio,
+        )
+
+    # Cálculo do m² ponderado — usa 2000 comparáveis (igual ao script)
+    if valor_m2 is None:
+        valor_m2, n_usados, nivel, comps = media_m2_comparaveis(
+            cursor,
+            bairro=bairro, cidade=cidade, endereco=endereco,
+            quartos=quartos, suites=suites, vagas=vagas, tipo=tipo,
+            metragem_alvo=metragem_alvo,
+            metragem_intervalo=metragem_intervalo,
+            tipo_negocio=tipo_negocio,
+            tolerancia_pct=tolerancia_m2_pct,
+            trim_quantil=0.10,
+            comparables_limit=2000,
+            backend=backend,
+            modo=modo_comparaveis,
+            k_vizinhos=k_vizinhos,
+            meia_vida_dias=meia_vida_dias,
+            tempo_max_ms=tempo_max_ms,
+            avisos=avisos,
+            pesos_usados=pesos,
+        )
+    return {"valor_m2": valor_m2, "n_usados": n_usados, "nivel": nivel, "comps": comps, "pesos": pesos}
+
+
+def fmt_brl(v: Optional[float]) -> Optional[str]:
+    if v is None:
+        return None
+    s = f"R$ {v:,.0f}"
+    return s.replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+# =========================
+# Metragem alvo e valor estimado
+# =========================
+def metragem_alvo(pm, metragem_para_estimativa=None, metragem_primeiro: Optional[str] = None):
+    """
+    (metragem_alvo, metragem_intervalo) pela política da estimativa:
+      1) 'metragem_para_estimativa' enviada -> usa ela
+      2) 'metragem' intervalo -> Metragem do primeiro imóvel listado (metragem_primeiro)
+      3) 'metragem' número -> usa esse número
+      4) senão -> None
+    pm: saída de parse_metragem_param.
+    """
+    if isinstance(metragem_para_estimativa, (int, float)):
+        return float(metragem_para_estimativa), None
+    if isinstance(pm, tuple):
+        return parse_metragem_str_to_float(metragem_primeiro), pm
+    if isinstance(pm, float):
+        return pm, None
+    return None, None
+
+
+def valorar(metragem: float, valor_m2: float, estado_conservacao: Optional[str] = "Padrão") -> Dict[str, Any]:
+    """Valor base, ajuste por estado, valor estimado (arredondado ao milhar) e faixa de negociação."""
+    valor_base = float(metragem) * float(valor_m2)
+    estado = (estado_conservacao or "Padrão").strip().lower()
+    ajuste_pct, desc_estado = AJUSTES_ESTADO.get(estado, ESTADO_PADRAO)
+    valor_estimado = arredondar_milhar(valor_base * (1 + ajuste_pct))
+    return {
+        "valor_base": valor_base,
+        "ajuste_pct": ajuste_pct,
+        "descricao_estado": desc_estado,
+        "valor_estimado": valor_estimado,
+        "faixa_min": valor_estimado * (1 - FAIXA_NEGOCIACAO),
+        "faixa_max": valor_estimado * (1 + FAIXA_NEGOCIACAO),
+    }
@@ -1,352 +1,374 @@
 # -*- coding: utf-8 -*-
 """
-consultas_imoveis.py (precisa + tipo/endereco + busca por endereço)
-- Filtros por cidade, bairro, endereco (tokenizado), tipo, quartos, suites, vagas, metragem
-- Lista resultados com endereco
-- Estimativa baseada em comparáveis (mesmos filtros, inclusive endereco se informado)
+consultas_imoveis.py
+Consulta e avaliação por comparáveis na linha de comando, com o mesmo núcleo
+da API (utils/comparaveis.py).
+
+Consulta única (lista os imóveis e mostra a estimativa e os comparáveis):
+  python -m utils.consultas_imoveis --cidade "VICENTE PIRES" --bairro "VICENTE PIRES" \\
+      --endereco "Rua 8" --tipo Casa --quartos 6 --suites 0 --vagas 6 --metragem 500-1250
+
+Avaliação em lote de uma carteira (CSV ou JSONL, um imóvel por linha):
+  python -m utils.consultas_imoveis --entrada carteira.csv --saida avaliacao.csv [--processos 8] [--lote 200]
+
+  Colunas reconhecidas: id, cidade, bairro, endereco, tipo, quartos, suites,
+  vagas, metragem ('220' ou '200-250'), metragem_para_estimativa,
+  estado_conservacao, tipo_negocio. As demais colunas são repetidas na saída.
+  Saída (CSV ou JSONL, pela extensão): colunas de entrada + metragem_alvo,
+  valor_m2, nivel_base, comparaveis_usados, valor_base, ajuste_pct,
+  valor_estimado, faixa_min, faixa_max, erro.
+
+  Cada processo abre uma conexão com o banco e guarda os comparáveis já
+  calculados (imóveis do mesmo segmento não repetem a cascata). A entrada é
+  lida e a saída gravada em lotes, na ordem da entrada.
 """
 
-import mysql.connector
-import re
-from statistics import mean
-
-# ===== Config MySQL =====
-config = {
-    "user": "",
-    "password": "",
-    "host": "",
-    "database": "quadr767_laudo-db",
-    "port": 3306
-}
-
-def conectar():
-    return mysql.connector.connect(**config)
-
-# ---------- Parsers ----------
-def parse_metragem_str_to_float(m_str: str):
-    if m_str is None:
-        return None
-    s = str(m_str).strip().lower().replace("m²", "")
-    s = re.sub(r"[^\d,\.]", "", s)
-    if not s:
-        return None
-    if "," in s and "." in s:
-        s = s.replace(".", "").replace(",", ".")
-    elif "," in s:
-        s = s.replace(",", ".")
-    try:
-        return float(s)
-    except ValueError:
-        return None
-
-def parse_valor_str_to_float(v_str: str):
-    if v_str is None:
-        return None
-    s = re.sub(r"[^\d]", "", str(v_str))
-    if not s:
-        return None
-    try:
-        return float(s)
-    except ValueError:
-        return None
-
-def arredondar_milhar(v: float) -> float:
-    return round(v / 1000.0) * 1000.0
-
-def parse_metragem_param(valor):
-    if not valor or valor == "*":
-        return None
-    s = str(valor).strip().lower().replace("m²", "")
-    s = re.sub(r"[^\d\-,]", "", s)
-    if "-" in s:
-        a, b = s.split("-", 1)
-        try:
-            return (float(a), float(b))
-        except:
-            return None
-    try:
-        return float(s)
-    except:
-        return None
+import os
+import sys
+import csv
+import json
+import time
+import atexit
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# permite rodar direto (python utils/consultas_imoveis.py) importando o pacote utils
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.storage import get_backend
+from utils.listagem import filtros_imoveis
+from utils.cache import CacheTTL
+from utils.coalescencia import chave_normalizada
+from utils.comparaveis import (
+    parse_metragem_param, calcular_comparaveis, metragem_alvo as escolher_metragem_alvo, valorar, fmt_brl,
+)
+
+TAMANHO_LOTE = 200
+ITENS_CACHE = 4096
+
+CAMPOS_INT = ("quartos", "suites", "vagas")
+CAMPOS_FLOAT = ("metragem_para_estimativa",)
+CAMPOS_RESULTADO = [
+    "metragem_alvo", "valor_m2", "nivel_base", "comparaveis_usados", "valor_base", "ajuste_pct",
+    "valor_estimado", "faixa_min", "faixa_max", "erro",
+]
+
+
+def _fmt_m2(v: float) -> str:
+    return f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+# =========================
+# Avaliação de um imóvel
+# =========================
+def primeira_metragem(cursor, backend, item: dict, pm) -> str | None:
+    """Metragem do primeiro imóvel da listagem (mesmos filtros e ordem da estimativa)."""
+    where, params = filtros_imoveis(
+        backend, metragem=pm, quartos=item.get("quartos"), suites=item.get("suites"), vagas=item.get("vagas"),
+        cidade=item.get("cidade"), bairro=item.get("bairro"), endereco=item.get("endereco"),
+        tipo=item.get("tipo"), tipo_negocio=item.get("tipo_negocio") or "Venda",
+    )
+    cursor.execute(f"SELECT Metragem FROM imoveis_df WHERE {where} "
+                   f"ORDER BY {backend.expr_valor} DESC, ID DESC LIMIT 1", params)
+    row = cursor.fetchone()
+    return row["Metragem"] if row else None
 
-# ---------- Helpers de LIKE ----------
-def tokens_from_text(texto: str):
-    """
-    Quebra o endereço em tokens alfanuméricos úteis para LIKE.
-    Ex.: 'QS 5 Rua 400 - Residencial Montana' -> ['QS', '5', 'RUA', '400', 'RESIDENCIAL', 'MONTANA']
-    """
-    toks = re.findall(r"[A-Za-z0-9]+", str(texto or "").upper())
-    return [t for t in toks if t]
 
-def apply_like_tokens(sql_base: str, params: list, campo: str, texto: str):
-    """
-    Para cada token, adiciona 'AND campo LIKE %token%' (AND entre os tokens).
+def avaliar(cursor, backend, item: dict, cache: CacheTTL | None = None, tolerancia_m2_pct: float = 0.10,
+            usar_agregados: bool = False, modo_comparaveis: str = "cascata", k_vizinhos: int = 50,
+            meia_vida_dias: float | None = None, tempo_max_ms: int | None = None) -> dict:
     """
-    toks = tokens_from_text(texto)
-    for t in toks:
-        sql_base += f" AND {campo} LIKE %s"
-        params.append(f"%{t}%")
-    return sql_base, params
-
-# ---------- Cálculo robusto do m² ----------
-def media_m2_comparaveis(cursor,
-                         bairro: str | None,
-                         cidade: str | None,
-                         endereco: str | None,
-                         quartos: int | None,
-                         suites: int | None,
-                         vagas: int | None,
-                         tipo: str | None,
-                         metragem_alvo: float | None,
-                         metragem_intervalo: tuple[float, float] | None,
-                         tipo_negocio: str = "Venda",
-                         tolerancia_pct: float = 0.10,
-                         trim_quantil: float = 0.10,
-                         comparables_limit: int = 2000,
-                         min_amostra_local: int = 5):  # NOVO parâmetro
+    Estimativa de um imóvel (campos de CAMPOS_RESULTADO). Mesma política de
+    metragem alvo e mesmo cálculo de /api/laudo/estimativa.
     """
-    Retorna (valor_m2_robusto, n_usados, nivel) onde nivel ∈ {'endereco','bairro','cidade'}
-    Estratégia:
-      1) Tenta por ENDEREÇO (se informado); se <min_amostra_local comps válidos, afrouxa p/ BAIRRO; se <3, cai p/ CIDADE.
-      2) Filtros por Q/S/V e TIPO
-      3) Faixa de metragem (alvo ± tolerância) ou intervalo informado
-      4) Remoção de outliers por trim de quantis
-      5) Média ponderada por proximidade de metragem
-    """
-    def montar(nivel: str):
-        base = "SELECT ID, Metragem, VALOR FROM imoveis_df WHERE 1=1"
-        params = []
-        if nivel == "endereco" and endereco:
-            base, params = apply_like_tokens(base, params, "endereco", endereco)
-        elif nivel == "bairro" and bairro:
-            base += " AND BAIRRO LIKE %s"; params.append(f"%{bairro}%")
-        elif nivel == "cidade" and cidade:
-            base += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
-        else:
-            return None, None
-
-        if tipo:
-            base += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
-        if quartos is not None:
-            base += " AND QUARTOS = %s"; params.append(quartos)
-        if suites is not None:
-            base += " AND SUITES = %s"; params.append(suites)
-        if vagas is not None:
-            base += " AND VAGAS = %s"; params.append(vagas)
-        if tipo_negocio:
-            base += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
-
-        if metragem_intervalo and len(metragem_intervalo) == 2:
-            a, b = metragem_intervalo
-            base += " AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') AS DECIMAL(10,2)) BETWEEN %s AND %s"
-            params.extend([a, b])
-        elif metragem_alvo:
-            a = metragem_alvo * (1 - tolerancia_pct)
-            b = metragem_alvo * (1 + tolerancia_pct)
-            base += " AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') AS DECIMAL(10,2)) BETWEEN %s AND %s"
-            params.extend([a, b])
-
-        base += f" LIMIT {comparables_limit}"
-        return base, params
-
-    # 1) Endereço (se fornecido)
-    nivel_ordem = []
-    if endereco:
-        nivel_ordem.append("endereco")
-    nivel_ordem += ["bairro", "cidade"]
-
-    rows = []
-    nivel_usado = None
-    for nv in nivel_ordem:
-        sqlx, parx = montar(nv)
-        if not sqlx:
-            continue
-        cursor.execute(sqlx, parx)
-        rows = cursor.fetchall()
-        # Converte
-        comps = []
-        for r in rows:
-            m = parse_metragem_str_to_float(r["Metragem"])
-            v = parse_valor_str_to_float(r["VALOR"])
-            if m and m > 0 and v and v > 0:
-                comps.append((m, v, v / m, r["ID"]))
-        # Se for endereço, exige min_amostra_local, senão exige pelo menos 3
-        if (nv == "endereco" and len(comps) >= min_amostra_local) or (nv != "endereco" and len(comps) >= 3):
-            nivel_usado = nv
-            rows = [r for r in rows if r["ID"] in [c[3] for c in comps]]
-            break
-
-    if not rows:
-        return None, 0, (nivel_usado or "cidade")
-
-    parsed = []
-    for r in rows:
-        m = parse_metragem_str_to_float(r["Metragem"])
-        v = parse_valor_str_to_float(r["VALOR"])
-        if m and m > 0 and v and v > 0:
-            parsed.append((m, v, v / m, r["ID"]))
-
-    if len(parsed) < 3:
-        return None, len(parsed), (nivel_usado or "cidade")
-
-    # trim outliers
-    per_m2 = sorted(x[2] for x in parsed)
-    if len(per_m2) > 10:
-        ql = per_m2[int(len(per_m2) * trim_quantil)]
-        qh = per_m2[int(len(per_m2) * (1 - trim_quantil)) - 1]
-        parsed_trim = [x for x in parsed if ql <= x[2] <= qh] or parsed
-    else:
-        parsed_trim = parsed
-
-    # Mostra os comparáveis usados
-    print("\n🔎 Comparáveis usados no cálculo:")
-    for m, v, pm2, id_ in parsed_trim:
-        print(f"ID: {id_} | {m:.2f} m² | R$ {v:,.0f} | R$ {pm2:,.2f}/m²")
-
-    # ponderação por proximidade
-    if metragem_alvo:
-        pesos, valores = [], []
-        for (m, v, pm2, _) in parsed_trim:
-            dist = abs(m - metragem_alvo)
-            peso = 1.0 / (1.0 + dist)
-            pesos.append(peso); valores.append(pm2)
-        valor_m2 = sum(p * x for p, x in zip(pesos, valores)) / sum(pesos)
+    pm = parse_metragem_param(item.get("metragem"))
+    primeiro = None
+    if isinstance(pm, tuple) and item.get("metragem_para_estimativa") is None:
+        primeiro = primeira_metragem(cursor, backend, item, pm)
+    alvo, intervalo = escolher_metragem_alvo(pm, item.get("metragem_para_estimativa"), primeiro)
+
+    filtros = dict(
+        cidade=item.get("cidade"), bairro=item.get("bairro"), endereco=item.get("endereco"),
+        tipo=item.get("tipo"), quartos=item.get("quartos"), suites=item.get("suites"), vagas=item.get("vagas"),
+        tipo_negocio=item.get("tipo_negocio") or "Venda",
+        metragem_alvo=alvo, metragem_intervalo=intervalo, tolerancia_m2_pct=tolerancia_m2_pct,
+        usar_agregados=usar_agregados, modo_comparaveis=modo_comparaveis, k_vizinhos=k_vizinhos,
+        meia_vida_dias=meia_vida_dias,
+    )
+    chave = chave_normalizada("comparaveis", **filtros)
+    comp = cache.get(chave) if cache is not None else None
+    avisos = []
+    if comp is None:
+        comp = calcular_comparaveis(cursor, backend, tempo_max_ms=tempo_max_ms, avisos=avisos, **filtros)
+        if cache is not None:
+            cache.set(chave, comp)
+
+    res = dict.fromkeys(CAMPOS_RESULTADO)
+    res.update(metragem_alvo=alvo, valor_m2=comp["valor_m2"], nivel_base=comp["nivel"],
+               comparaveis_usados=comp["n_usados"], comps=comp["comps"])
+    if comp["valor_m2"] and alvo:
+        v = valorar(alvo, comp["valor_m2"], item.get("estado_conservacao"))
+        res.update(valor_base=v["valor_base"], ajuste_pct=v["ajuste_pct"], valor_estimado=v["valor_estimado"],
+                   faixa_min=v["faixa_min"], faixa_max=v["faixa_max"])
     else:
-        valor_m2 = mean(pm2 for (_, _, pm2, _) in parsed_trim)
+        res["erro"] = "; ".join(avisos) or "amostra insuficiente ou metragem alvo não definida"
+    return res
 
-    return valor_m2, len(parsed_trim), (nivel_usado or "cidade")
 
-# ---------- Busca + Estimativa ----------
+# =========================
+# Consulta única (saída no terminal)
+# =========================
 def buscar_imoveis(metragem=None, quartos=None, suites=None, vagas=None,
                    cidade=None, bairro=None, endereco=None, tipo=None, limite=20,
                    estado_conservacao="Padrão",
                    metragem_para_estimativa=None,
                    tolerancia_m2_pct=0.10,
-                   tipo_negocio="Venda"):  # NOVO
-    conn = conectar()
-    cursor = conn.cursor(dictionary=True)
-
-    sql = "SELECT * FROM imoveis_df WHERE 1=1"
-    params = []
-
-    pm = parse_metragem_param(metragem)
-    if isinstance(pm, tuple):
-        sql += " AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') AS DECIMAL(10,2)) BETWEEN %s AND %s"
-        params.extend([pm[0], pm[1]])
-    elif isinstance(pm, float):
-        sql += " AND CAST(REPLACE(REPLACE(Metragem, ' m²', ''), ',', '.') AS DECIMAL(10,2)) >= %s"
-        params.append(pm)
-
-    if quartos is not None:
-        sql += " AND QUARTOS = %s"; params.append(quartos)
-    if suites is not None:
-        sql += " AND SUITES = %s"; params.append(suites)
-    if vagas is not None:
-        sql += " AND VAGAS = %s"; params.append(vagas)
-    if cidade and cidade != "*":
-        sql += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
-    if bairro and bairro != "*":
-        sql += " AND BAIRRO LIKE %s"; params.append(f"%{bairro}%")
-    if tipo:
-        sql += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
-    if endereco:
-        # aplica tokens no SELECT de listagem
-        sql, params = apply_like_tokens(sql, params, "endereco", endereco)
-    if tipo_negocio:
-        sql += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
-
-    sql += " ORDER BY CAST(REPLACE(REPLACE(VALOR, '.', ''), ',', '') AS UNSIGNED) DESC LIMIT %s"
-    params.append(limite)
-
-    cursor.execute(sql, params)
-    resultados = cursor.fetchall()
-
-    # Listagem
-    if not resultados:
-        print("⚠️ Nenhum imóvel encontrado com esses filtros.")
-    else:
-        print(f"\n✅ {len(resultados)} resultado(s) encontrado(s):\n")
-        for r in resultados:
-            print(f"ID: {r['ID']}")
-            print(f"🏙️ {r['CIDADE']} — {r['BAIRRO']}")
-            print(f"📍 {r.get('endereco','') or '-'}")
-            print(f"🏢 Tipo: {r.get('tipo','') or '-'}")
-            print(f"📏 {r['Metragem']} | 🛏️ {r['QUARTOS']}Q | 🛁 {r['SUITES']}S | 🚗 {r['VAGAS']}V")
-            print(f"💰 Valor: {r['VALOR']}")
-            print(f"📌 Título: {r['Titulo']}")
-            print("-" * 60)
-
-    # Estimativa
-    if isinstance(metragem_para_estimativa, (int, float)):
-        metragem_alvo = float(metragem_para_estimativa)
-    else:
-        if isinstance(pm, float):
-            metragem_alvo = pm
-        elif resultados:
-            metragem_alvo = parse_metragem_str_to_float(resultados[0].get("Metragem"))
+                   tipo_negocio="Venda"):
+    backend = get_backend()
+    conn = backend.conectar()
+    cursor = backend.novo_cursor(conn)
+    try:
+        pm = parse_metragem_param(metragem)
+        where, params = filtros_imoveis(
+            backend, metragem=pm, quartos=quartos, suites=suites, vagas=vagas,
+            cidade=cidade, bairro=bairro, endereco=endereco, tipo=tipo, tipo_negocio=tipo_negocio,
+        )
+        cursor.execute(f"SELECT * FROM imoveis_df WHERE {where} ORDER BY {backend.expr_valor} DESC, ID DESC LIMIT %s",
+                       params + [limite])
+        resultados = cursor.fetchall()
+
+        # Listagem
+        if not resultados:
+            print("⚠️ Nenhum imóvel encontrado com esses filtros.")
         else:
-            metragem_alvo = None
-
-    valor_m2, n_usados, nivel = media_m2_comparaveis(
-        cursor,
-        bairro=bairro, cidade=cidade, endereco=endereco,
-        quartos=quartos, suites=suites, vagas=vagas, tipo=tipo,
-        metragem_alvo=metragem_alvo,
-        metragem_intervalo=(pm if isinstance(pm, tuple) else None),
-        tipo_negocio=tipo_negocio,  # NOVO
-        tolerancia_pct=tolerancia_m2_pct, trim_quantil=0.10, comparables_limit=2000
-    )
+            print(f"\n✅ {len(resultados)} resultado(s) encontrado(s):\n")
+            for r in resultados:
+                print(f"ID: {r['ID']}")
+                print(f"🏙️ {r['CIDADE']} — {r['BAIRRO']}")
+                print(f"📍 {r.get('endereco','') or '-'}")
+                print(f"🏢 Tipo: {r.get('tipo','') or '-'}")
+                print(f"📏 {r['Metragem']} | 🛏️ {r['QUARTOS']}Q | 🛁 {r['SUITES']}S | 🚗 {r['VAGAS']}V")
+                print(f"💰 Valor: {r['VALOR']}")
+                print(f"📌 Título: {r['Titulo']}")
+                print("-" * 60)
+
+        item = dict(cidade=cidade, bairro=bairro, endereco=endereco, tipo=tipo, quartos=quartos,
+                    suites=suites, vagas=vagas, metragem=metragem, tipo_negocio=tipo_negocio,
+                    metragem_para_estimativa=metragem_para_estimativa, estado_conservacao=estado_conservacao)
+        res = avaliar(cursor, backend, item, tolerancia_m2_pct=tolerancia_m2_pct)
+    finally:
+        cursor.close()
+        conn.close()
+
+    if res["valor_estimado"] is None:
+        print(f"\n⚠️ Amostra insuficiente para calcular valor_m2 com os comparáveis definidos ({res['erro']}).")
+        return res
 
-    if valor_m2 and metragem_alvo:
-        print(
-            f"\n📐 Base do cálculo: m² ponderado no {nivel} "
-            f"(comparáveis: {n_usados}, tol ±{int(tolerancia_m2_pct*100)}%): "
-            f"R$ {valor_m2:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-        )
+    print("\n🔎 Comparáveis usados no cálculo:")
+    for c in res["comps"]:
+        print(f"ID: {c[3]} | {c[0]:.2f} m² | R$ {c[1]:,.0f} | R$ {c[2]:,.2f}/m²")
+    print(f"\n📐 Base do cálculo: m² ponderado no {res['nivel_base']} "
+          f"(comparáveis: {res['comparaveis_usados']}, tol ±{int(tolerancia_m2_pct*100)}%): {_fmt_m2(res['valor_m2'])}")
+    print("\n🧮 Estimativa de Valor de Mercado")
+    print(f"- Metragem alvo: {res['metragem_alvo']:.2f} m²")
+    print(f"- Valor base (m² médio x metragem): {fmt_brl(res['valor_base'])}")
+    print(f"- Ajuste por estado: {('+' if res['ajuste_pct'] >= 0 else '')}{int(res['ajuste_pct']*100)}%")
+    print(f"- Valor estimado (arredondado ao milhar): {fmt_brl(res['valor_estimado'])}")
+    print(f"- Faixa de negociação (±5%): {fmt_brl(res['faixa_min'])} a {fmt_brl(res['faixa_max'])}")
+    return res
+
+
+# =========================
+# Lote: entrada / saída
+# =========================
+def _normalizar(linha: dict) -> dict:
+    item = {}
+    for k, v in linha.items():
+        k = (k or "").strip().lower()
+        if isinstance(v, str):
+            v = v.strip() or None
+        if v is not None and k in CAMPOS_INT:
+            v = int(float(v))
+        elif v is not None and k in CAMPOS_FLOAT:
+            v = float(str(v).replace(",", "."))
+        item[k] = v
+    return item
+
+
+def ler_entrada(caminho: str, delimitador: str = ","):
+    """Imóveis do CSV/JSONL, um a um (sem carregar o arquivo inteiro)."""
+    with open(caminho, encoding="utf-8-sig", newline="") as f:
+        if caminho.lower().endswith((".jsonl", ".ndjson")):
+            for linha in f:
+                if linha.strip():
+                    yield json.loads(linha)
+        else:
+            yield from csv.DictReader(f, delimiter=delimitador)
+
+
+def em_lotes(itens, tamanho: int):
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class EscritorSaida:
+    """CSV (colunas da primeira linha de entrada + CAMPOS_RESULTADO) ou JSONL, pela extensão."""
+
+    def __init__(self, caminho: str, delimitador: str = ","):
+        self.jsonl = caminho.lower().endswith((".jsonl", ".ndjson"))
+        self.delimitador = delimitador
+        self._f = open(caminho, "w", encoding="utf-8", newline="")
+        self._csv = None
+        self.n = 0
+
+    def escrever(self, linhas: list):
+        for linha in linhas:
+            if self.jsonl:
+                self._f.write(json.dumps(linha, ensure_ascii=False, default=str) + "\n")
+                continue
+            if self._csv is None:
+                campos = [k for k in linha if k not in CAMPOS_RESULTADO] + CAMPOS_RESULTADO
+                self._csv = csv.DictWriter(self._f, fieldnames=campos, delimiter=self.delimitador,
+                                           extrasaction="ignore")
+                self._csv.writeheader()
+            self._csv.writerow(linha)
+        self.n += len(linhas)
+        self._f.flush()
+
+    def fechar(self):
+        self._f.close()
+
+
+# =========================
+# Lote: processos
+# =========================
+_worker: dict = {}
+
+
+def _fechar_worker():
+    for nome in ("cursor", "conn"):
+        try:
+            _worker.pop(nome).close()
+        except Exception:
+            pass
 
-        valor_base = metragem_alvo * valor_m2
-
-        estado = (estado_conservacao or "Padrão").strip().lower()
-        ajuste_pct = 0.0
-        desc_estado = "em bom estado de conservação"
-        if estado == "reformado":
-            ajuste_pct = 0.10; desc_estado = "em excelente estado de conservação"
-        elif estado == "original":
-            ajuste_pct = -0.10; desc_estado = "necessitando de reforma/manutenção"
-
-        valor_ajustado = valor_base * (1 + ajuste_pct)
-        valor_estimado = arredondar_milhar(valor_ajustado)
-        faixa_min = valor_estimado * 0.95
-        faixa_max = valor_estimado * 1.05
-
-        def fmt(v): return f"R$ {v:,.0f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-        print("\n🧮 Estimativa de Valor de Mercado")
-        print(f"- Metragem alvo: {metragem_alvo:.2f} m²")
-        print(f"- Valor base (m² médio x metragem): {fmt(valor_base)}")
-        print(f"- Ajuste por estado ({desc_estado}): {('+' if ajuste_pct>=0 else '')}{int(ajuste_pct*100)}%")
-        print(f"- Valor estimado (arredondado ao milhar): {fmt(valor_estimado)}")
-        print(f"- Faixa de negociação (±5%): {fmt(faixa_min)} a {fmt(faixa_max)}")
-    else:
-        print("\n⚠️ Amostra insuficiente para calcular valor_m2 com os comparáveis definidos.")
 
-    cursor.close()
-    conn.close()
+def _iniciar_worker(opcoes: dict):
+    """Uma conexão por processo, aberta uma vez e reaproveitada em todos os lotes."""
+    backend = get_backend()
+    conn = backend.conectar()
+    _worker.update(backend=backend, conn=conn, cursor=backend.novo_cursor(conn), opcoes=opcoes,
+                   cache=CacheTTL(max_itens=ITENS_CACHE, ttl=float("inf")))
+    atexit.register(_fechar_worker)
 
-# ===== Exemplo =====
-if __name__ == "__main__":
-    # Ex.: endereço padronizado (tokens "QS", "5", "RUA", "400" vão ser aplicados em ANDs)
+
+def _arredondar(res: dict) -> dict:
+    return {k: (round(v, 2) if isinstance(v, float) else v) for k, v in res.items()}
+
+
+def avaliar_lote(linhas: list) -> list:
+    """Avalia um lote no processo atual; erro em um imóvel não derruba o lote."""
+    w = _worker
+    saida = []
+    for linha in linhas:
+        try:
+            res = avaliar(w["cursor"], w["backend"], _normalizar(linha), cache=w["cache"], **w["opcoes"])
+            res.pop("comps")
+        except Exception as e:
+            res = dict.fromkeys(CAMPOS_RESULTADO)
+            res["erro"] = f"{type(e).__name__}: {e}"
+        saida.append(dict(linha, **_arredondar(res)))
+    return saida
+
+
+def avaliar_arquivo(entrada: str, saida: str, processos: int = 1, lote: int = TAMANHO_LOTE,
+                    delimitador: str = ",", **opcoes) -> int:
+    """Avalia todos os imóveis de `entrada` e grava em `saida` na mesma ordem. Retorna nº de imóveis."""
+    escritor = EscritorSaida(saida, delimitador)
+    t0 = time.perf_counter()
+
+    def progresso():
+        dt = time.perf_counter() - t0
+        print(f"[INFO] {escritor.n} imóvel(is) avaliado(s) em {dt:.1f}s ({escritor.n / dt if dt else 0:.1f}/s)")
+
+    lotes = em_lotes(ler_entrada(entrada, delimitador), lote)
+    try:
+        if processos <= 1:
+            _iniciar_worker(opcoes)
+            for itens in lotes:
+                escritor.escrever(avaliar_lote(itens))
+                progresso()
+            _fechar_worker()
+        else:
+            # no máximo 2 lotes por processo em voo: a entrada não é lida inteira para a memória
+            with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker,
+                                     initargs=(opcoes,)) as ex:
+                pendentes = deque()
+                for itens in lotes:
+                    pendentes.append(ex.submit(avaliar_lote, itens))
+                    if len(pendentes) >= 2 * processos:
+                        escritor.escrever(pendentes.popleft().result())
+                        progresso()
+                while pendentes:
+                    escritor.escrever(pendentes.popleft().result())
+                    progresso()
+    finally:
+        escritor.fechar()
+    return escritor.n
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Consulta e avaliação por comparáveis (mesmo núcleo da API).")
+    g = ap.add_argument_group("consulta única")
+    for campo in ("cidade", "bairro", "endereco", "tipo", "metragem"):
+        g.add_argument(f"--{campo}")
+    for campo in CAMPOS_INT:
+        g.add_argument(f"--{campo}", type=int)
+    g.add_argument("--metragem-para-estimativa", type=float)
+    g.add_argument("--estado-conservacao", default="Padrão", help="reformado | original | Padrão")
+    g.add_argument("--tipo-negocio", default="Venda")
+    g.add_argument("--limite", type=int, default=20, help="Imóveis listados.")
+
+    g = ap.add_argument_group("lote")
+    g.add_argument("--entrada", help="CSV ou JSONL com um imóvel por linha.")
+    g.add_argument("--saida", help="CSV ou JSONL de saída (padrão: <entrada>_avaliacao.csv).")
+    g.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="Processos (1 = sem pool).")
+    g.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Imóveis por lote (leitura/escrita).")
+    g.add_argument("--delimitador", default=",", help="Delimitador dos CSV (padrão: ,).")
+    g.add_argument("--modo", default="cascata", choices=("cascata", "knn"))
+    g.add_argument("--k-vizinhos", type=int, default=50)
+    g.add_argument("--agregados", action="store_true", help="Usa a média aparada de rollup_m2 quando houver amostra.")
+    g.add_argument("--meia-vida-dias", type=float)
+    g.add_argument("--tempo-max-ms", type=int, help="Tempo máximo de cada consulta da cascata.")
+
+    ap.add_argument("--tolerancia", type=float, default=0.10, help="Tolerância da metragem (padrão: 0.10).")
+    args = ap.parse_args()
+
+    if args.entrada:
+        saida = args.saida or os.path.splitext(args.entrada)[0] + "_avaliacao.csv"
+        n = avaliar_arquivo(
+            args.entrada, saida, processos=args.processos, lote=args.lote, delimitador=args.delimitador,
+            tolerancia_m2_pct=args.tolerancia, usar_agregados=args.agregados, modo_comparaveis=args.modo,
+            k_vizinhos=args.k_vizinhos, meia_vida_dias=args.meia_vida_dias, tempo_max_ms=args.tempo_max_ms,
+        )
+        print(f"[OK] {n} imóvel(is) -> {saida}")
+        return
+
+    if not (args.cidade or args.bairro or args.endereco):
+        ap.error("informe --entrada (lote) ou ao menos --cidade/--bairro/--endereco (consulta única)")
     buscar_imoveis(
-        cidade="VICENTE PIRES",
-        bairro="VICENTE PIRES",
-        endereco="Rua 8",
-        tipo="Casa",
-        limite=10,
-        quartos=6,        
-        vagas=6,
-        suites=0,
-        metragem="500-1250",
-        estado_conservacao="Padrão",
-        tolerancia_m2_pct=0.10,
-        tipo_negocio="Venda"  
+        cidade=args.cidade, bairro=args.bairro, endereco=args.endereco, tipo=args.tipo, limite=args.limite,
+        quartos=args.quartos, suites=args.suites, vagas=args.vagas, metragem=args.metragem,
+        metragem_para_estimativa=args.metragem_para_estimativa, estado_conservacao=args.estado_conservacao,
+        tolerancia_m2_pct=args.tolerancia, tipo_negocio=args.tipo_negocio,
     )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+dedup.py
+Detecção de anúncios duplicados (mesmo imóvel publicado por imobiliárias
+diferentes) com MinHash + LSH.
+
+  - tokens: palavras e bigramas de endereco/Titulo/BAIRRO/CIDADE/tipo normalizados
+  - MinHash com NUM_PERM permutações, dividido em BANDAS x LINHAS
+  - LSH: anúncios que coincidem em pelo menos uma banda são candidatos
+  - confirmação: Jaccard dos tokens >= JACCARD_MIN, mesmo tipo_negocio,
+    mesmos quartos e metragem/valor próximos
+
+Cada grupo recebe grupo_duplicado = menor ID do grupo (o representante).
+As consultas de comparáveis usam só representantes:
+    AND (grupo_duplicado IS NULL OR grupo_duplicado = ID)
+
+Tabela dedup_lsh (banda, hash, ID) guarda as bandas para o ingest incremental
+(getdf.py) achar candidatos sem varrer imoveis_df.
+
+Reconstrução completa (dentro de api/):
+  python -m utils.dedup --reconstruir
+"""
+
+import re
+import argparse
+import hashlib
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float
+from utils.localidades import normalizar_nome
+from utils.storage import StorageBackend, get_backend
+
+NUM_PERM = 64
+BANDAS = 16
+LINHAS = NUM_PERM // BANDAS
+JACCARD_MIN = 0.5
+TOL_METRAGEM = 0.03
+TOL_VALOR = 0.10
+# teto de comparações por balde LSH (baldes enormes = texto genérico demais)
+LIMITE_BALDE = 200
+
+_PRIMO = (1 << 61) - 1
+# coeficientes fixos (determinísticos entre execuções e processos)
+_COEF = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _PRIMO | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIMO)
+    for i in range(NUM_PERM)
+]
+
+FILTRO_REPRESENTANTE = " AND (grupo_duplicado IS NULL OR grupo_duplicado = ID)"
+
+
+# =========================
+# MinHash / LSH
+# =========================
+def tokens_do_imovel(row: dict) -> set:
+    texto = " ".join(normalizar_nome(row.get(c)) for c in ("endereco", "Titulo", "BAIRRO", "CIDADE", "tipo"))
+    palavras = re.findall(r"[A-Z0-9]+", texto)
+    return set(palavras) | {f"{a}_{b}" for a, b in zip(palavras, palavras[1:])}
+
+
+def _h64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+
+def assinatura(tokens: set) -> list:
+    hs = [_h64(t) for t in tokens] or [0]
+    return [min((a * h + b) % _PRIMO for h in hs) for a, b in _COEF]
+
+
+def bandas(assin: list) -> list:
+    """[(banda, hash_hex)] — uma entrada por banda da assinatura."""
+    saida = []
+    for i in range(BANDAS):
+        trecho = ",".join(str(x) for x in assin[i * LINHAS:(i + 1) * LINHAS])
+        saida.append((i, hashlib.blake2b(trecho.encode(), digest_size=8).hexdigest()))
+    return saida
+
+
+def _proximo(a, b, tol) -> bool:
+    if not a or not b:
+        return False
+    return abs(a - b) / max(a, b) <= tol
+
+
+def sao_duplicados(a: dict, b: dict, tok_a: set | None = None, tok_b: set | None = None) -> bool:
+    if normalizar_nome(a.get("tipo_negocio")) != normalizar_nome(b.get("tipo_negocio")):
+        return False
+    if a.get("QUARTOS") != b.get("QUARTOS"):
+        return False
+    if not _proximo(parse_metragem_str_to_float(a.get("Metragem")),
+                    parse_metragem_str_to_float(b.get("Metragem")), TOL_METRAGEM):
+        return False
+    if not _proximo(parse_valor_str_to_float(a.get("VALOR")),
+                    parse_valor_str_to_float(b.get("VALOR")), TOL_VALOR):
+        return False
+    tok_a = tok_a if tok_a is not None else tokens_do_imovel(a)
+    tok_b = tok_b if tok_b is not None else tokens_do_imovel(b)
+    uniao = tok_a | tok_b
+    return bool(uniao) and len(tok_a & tok_b) / len(uniao) >= JACCARD_MIN
+
+
+# =========================
+# Ingest incremental
+# =========================
+COLUNAS_CANDIDATO = "ID, CIDADE, BAIRRO, endereco, Titulo, tipo, Metragem, QUARTOS, VALOR, tipo_negocio, grupo_duplicado"
+
+
+def _sair_do_grupo(cur, id_: int, grupo: int):
+    """
+    O anúncio deixou o grupo: os demais membros passam ao menor ID restante
+    (ou ficam sem grupo, se sobrar um só). Membros que só se ligavam pelo
+    anúncio continuam juntos até a próxima reconstrução.
+    """
+    cur.execute("SELECT ID FROM imoveis_df WHERE grupo_duplicado = %s AND ID <> %s", (grupo, id_))
+    restantes = [r["ID"] for r in cur.fetchall()]
+    novo = min(restantes) if len(restantes) > 1 else None
+    cur.execute("UPDATE imoveis_df SET grupo_duplicado = %s WHERE grupo_duplicado = %s AND ID <> %s",
+                (novo, grupo, id_))
+
+
+def registrar(cur, backend: StorageBackend, row: dict) -> int | None:
+    """
+    Atualiza as bandas LSH do anúncio e define seu grupo_duplicado
+    (None se não houver duplicado). Se ele deixou de casar com o grupo
+    anterior, o grupo é refeito sem ele. Mesma transação do upsert.
+    """
+    id_ = int(row["ID"])
+    cur.execute("SELECT grupo_duplicado FROM imoveis_df WHERE ID = %s", (id_,))
+    atual = cur.fetchone()
+    anterior = atual["grupo_duplicado"] if atual else None
+    cur.execute("DELETE FROM dedup_lsh WHERE ID = %s", (id_,))
+    if not normalizar_nome(row.get("endereco")):
+        # sem endereço só sobram bairro/cidade/tipo: evidência fraca demais
+        if anterior is not None:
+            _sair_do_grupo(cur, id_, anterior)
+        cur.execute("UPDATE imoveis_df SET grupo_duplicado = NULL WHERE ID = %s", (id_,))
+        return None
+
+    tok = tokens_do_imovel(row)
+    bs = bandas(assinatura(tok))
+    cond = " OR ".join(["(banda = %s AND hash = %s)"] * len(bs))
+    cur.execute(f"SELECT DISTINCT ID FROM dedup_lsh WHERE {cond} LIMIT {LIMITE_BALDE}", [x for par in bs for x in par])
+    ids = [r["ID"] for r in cur.fetchall()]
+
+    grupos = set()
+    if ids:
+        marks = ", ".join(["%s"] * len(ids))
+        cur.execute(f"SELECT {COLUNAS_CANDIDATO} FROM imoveis_df WHERE ID IN ({marks})", ids)
+        for cand in cur.fetchall():
+            if sao_duplicados(row, cand, tok_a=tok):
+                grupos.add(cand["grupo_duplicado"] or cand["ID"])
+
+    cur.executemany("INSERT INTO dedup_lsh (banda, hash, ID) VALUES (%s, %s, %s)",
+                    [(b, h, id_) for b, h in bs])
+
+    # nenhum candidato do grupo anterior casou: o grupo fica sem o anúncio
+    if anterior is not None and anterior not in grupos:
+        _sair_do_grupo(cur, id_, anterior)
+
+    if not grupos:
+        cur.execute("UPDATE imoveis_df SET grupo_duplicado = NULL WHERE ID = %s", (id_,))
+        return None
+
+    # une grupos (o anúncio pode ligar dois grupos existentes)
+    grupo = min(grupos | {id_})
+    outros = [g for g in grupos | {id_} if g != grupo]
+    # representante re-ingerido e só casando com o próprio grupo: nada a unir
+    # (IN () é erro de sintaxe no MySQL e derrubaria a transação do upsert)
+    if outros:
+        marks = ", ".join(["%s"] * len(outros))
+        cur.execute(f"UPDATE imoveis_df SET grupo_duplicado = %s WHERE ID IN ({marks}) OR grupo_duplicado IN ({marks})",
+                    [grupo] + outros + outros)
+    cur.execute("UPDATE imoveis_df SET grupo_duplicado = %s WHERE ID = %s", (grupo, grupo))
+    return grupo
+
+
+# =========================
+# Reconstrução em lote
+# =========================
+def reconstruir(backend: StorageBackend, lote: int = 5000) -> dict:
+    """Recalcula grupos e bandas de toda a base (union-find em memória)."""
+    pai: dict = {}
+
+    def achar(x):
+        while pai.setdefault(x, x) != x:
+            pai[x] = pai[pai[x]]
+            x = pai[x]
+        return x
+
+    baldes: dict = {}
+    linhas: dict = {}
+    registros_lsh = []
+    with backend.cursor() as cur:
+        cur.execute(f"SELECT {COLUNAS_CANDIDATO} FROM imoveis_df")
+        while True:
+            rows = cur.fetchmany(lote)
+            if not rows:
+                break
+            for r in rows:
+                id_ = int(r["ID"])
+                if not normalizar_nome(r.get("endereco")):
+                    continue
+                tok = tokens_do_imovel(r)
+                linhas[id_] = (r, tok)
+                for b, h in bandas(assinatura(tok)):
+                    registros_lsh.append((b, h, id_))
+                    for outro in baldes.setdefault((b, h), [])[-LIMITE_BALDE:]:
+                        if achar(outro) != achar(id_) and sao_duplicados(r, linhas[outro][0], tok, linhas[outro][1]):
+                            ra, rb = achar(outro), achar(id_)
+                            pai[max(ra, rb)] = min(ra, rb)
+                    baldes[(b, h)].append(id_)
+
+    grupos: dict = {}
+    for id_ in linhas:
+        grupos.setdefault(achar(id_), []).append(id_)
+    atualizacoes = [(min(ids), i) for ids in grupos.values() if len(ids) > 1 for i in ids]
+
+    with backend.transacao() as cur:
+        cur.execute("UPDATE imoveis_df SET grupo_duplicado = NULL")
+        cur.executemany("UPDATE imoveis_df SET grupo_duplicado = %s WHERE ID = %s", atualizacoes)
+        cur.execute("DELETE FROM dedup_lsh")
+        cur.executemany("INSERT INTO dedup_lsh (banda, hash, ID) VALUES (%s, %s, %s)", registros_lsh)
+        # grupos refeitos em toda a base: evento global para os caches da API
+        # (import tardio: utils.mudancas chega a este módulo via comparaveis -> knn -> snapshot_mmap)
+        from utils import mudancas
+        mudancas.registrar_carga(cur)
+
+    n_grupos = sum(1 for ids in grupos.values() if len(ids) > 1)
+    return {"anuncios": len(linhas), "grupos": n_grupos, "duplicados": len(atualizacoes) - n_grupos}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Deduplicação de anúncios (MinHash/LSH).")
+    ap.add_argument("--reconstruir", action="store_true", help="Recalcula grupo_duplicado e dedup_lsh.")
+    args = ap.parse_args()
+    if args.reconstruir:
+        info = reconstruir(get_backend())
+        print(f"[OK] {info['anuncios']} anúncios | {info['grupos']} grupos | {info['duplicados']} duplicados colapsáveis")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+enderecos.py
+Sincronização incremental da tabela endereco a partir dos anúncios coletados.
+
+O getdf.py entrega cada anúncio gravado ao SincronizadorEnderecos, que
+extrai a tupla normalizada (uf, cidade, bairro, endereco) — mesma regra da
+carga em massa (utils/carga_bulk.py --enderecos) — e, em lotes:
+  - insere só as tuplas novas (INSERT IGNORE sobre uq_endereco)
+  - incrementa endereco_versao.versao das UFs que ganharam endereços
+
+A rota /api/laudo/enderecos/{uf} usa a versão da UF como ETag e como chave
+do cache em memória: a resposta só é remontada quando a UF muda.
+
+Endereços que deixam de aparecer nos anúncios continuam na tabela (ela é o
+catálogo do formulário, não um espelho de imoveis_df).
+
+Dentro de api/:
+  python -m utils.enderecos --sincronizar     # tuplas de imoveis_df ainda ausentes
+  python -m utils.enderecos --versoes
+"""
+
+import argparse
+from datetime import datetime
+from collections import defaultdict
+
+from utils.localidades import limpar_caixa_alta, uf_da_cidade
+from utils.storage import StorageBackend, get_backend
+
+TAMANHO_LOTE = 500
+SEM_VALOR = ("N/D", "ND")
+
+
+def tupla_endereco(row: dict | None) -> tuple | None:
+    """(uf, cidade, bairro, endereco) normalizados de uma linha de imoveis_df, ou None se incompleta."""
+    if not row:
+        return None
+    c = limpar_caixa_alta(row.get("CIDADE"))
+    b = limpar_caixa_alta(row.get("BAIRRO"))
+    e = limpar_caixa_alta(row.get("endereco"))
+    if not (c and b and e) or c in SEM_VALOR or b in SEM_VALOR:
+        return None
+    return (uf_da_cidade(c) or "ND", c, b, e)
+
+
+# =========================
+# Escrita
+# =========================
+def incrementar_versao(cur, uf: str):
+    agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cur.execute("UPDATE endereco_versao SET versao = versao + 1, atualizado_em = %s WHERE uf = %s", (agora, uf))
+    if cur.rowcount == 0:
+        cur.execute("INSERT INTO endereco_versao (uf, versao, atualizado_em) VALUES (%s, 1, %s)", (uf, agora))
+
+
+def gravar(backend: StorageBackend, tuplas) -> dict:
+    """Insere as tuplas ausentes e incrementa a versão das UFs alteradas. Retorna {uf: nº inseridas}."""
+    por_uf = defaultdict(list)
+    for t in tuplas:
+        por_uf[t[0]].append(t)
+    inseridas = {}
+    with backend.transacao() as cur:
+        for uf, linhas in por_uf.items():
+            cur.executemany(
+                f"{backend.prefixo_insert_ignore} INTO endereco (uf, cidade, bairro, endereco) "
+                "VALUES (%s, %s, %s, %s)",
+                linhas,
+            )
+            # linhas ignoradas (já existentes) não contam em rowcount
+            if cur.rowcount > 0:
+                inseridas[uf] = cur.rowcount
+                incrementar_versao(cur, uf)
+    return inseridas
+
+
+def versao(cur, uf: str) -> int:
+    cur.execute("SELECT versao FROM endereco_versao WHERE uf = %s", (uf,))
+    r = cur.fetchone()
+    return int(r["versao"]) if r else 0
+
+
+class SincronizadorEnderecos:
+    """
+    Acumula as tuplas de anúncios novos ou com endereço alterado e grava em
+    lotes de `lote`. Usar como context manager (ou chamar descarregar() no
+    fim) para não perder o último lote.
+    """
+
+    def __init__(self, backend: StorageBackend, lote: int = TAMANHO_LOTE):
+        self.backend = backend
+        self.lote = lote
+        self._pendentes: list = []
+        self._vistas: set = set()
+        self.inseridas = 0
+
+    def registrar(self, antigo: dict | None, novo: dict | None):
+        t = tupla_endereco(novo)
+        if t is None or t == tupla_endereco(antigo) or t in self._vistas:
+            return
+        self._vistas.add(t)
+        self._pendentes.append(t)
+        if len(self._pendentes) >= self.lote:
+            self.descarregar()
+
+    def descarregar(self) -> dict:
+        if not self._pendentes:
+            return {}
+        pendentes, self._pendentes = self._pendentes, []
+        inseridas = gravar(self.backend, pendentes)
+        self.inseridas += sum(inseridas.values())
+        return inseridas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.descarregar()
+
+
+def sincronizar(backend: StorageBackend, lote: int = 5000) -> int:
+    """Grava as tuplas de imoveis_df ainda ausentes em endereco. Retorna nº inseridas."""
+    # lê tudo antes de escrever: no SQLite, um SELECT aberto impede o commit das escritas
+    with backend.cursor() as cur:
+        cur.execute("SELECT DISTINCT CIDADE, BAIRRO, endereco FROM imoveis_df")
+        rows = cur.fetchall()
+    with SincronizadorEnderecos(backend, lote=lote) as sinc:
+        for r in rows:
+            sinc.registrar(None, r)
+    return sinc.inseridas
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sincronização da tabela endereco com imoveis_df.")
+    ap.add_argument("--sincronizar", action="store_true", help="Grava as tuplas de imoveis_df ausentes em endereco.")
+    ap.add_argument("--versoes", action="store_true", help="Mostra a versão de endereços de cada UF.")
+    args = ap.parse_args()
+
+    backend = get_backend()
+    if args.sincronizar:
+        n = sincronizar(backend)
+        print(f"[OK] {n} endereço(s) novo(s)")
+    if args.versoes:
+        with backend.cursor() as cur:
+            cur.execute("SELECT uf, versao, atualizado_em FROM endereco_versao ORDER BY uf")
+            for r in cur.fetchall():
+                print(f"{r['uf']}  v{r['versao']}  {r['atualizado_em']}")
+    if not (args.sincronizar or args.versoes):
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
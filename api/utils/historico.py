@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+historico.py
+Histórico append-only dos anúncios (tabela imoveis_historico).
+
+O upsert do getdf.py sobrescreve VALOR/valor_m2 em imoveis_df; aqui cada
+mudança de preço ou de atributo vira uma nova versão:
+  - hash (blake2b) dos CAMPOS_HISTORICO: versão igual à última não é gravada,
+    então o crescimento acompanha as mudanças, não a frequência de coleta
+  - versões numeradas por anúncio (seq); a cada KEYFRAME_A_CADA versões um
+    quadro completo ('K'), nas demais só os campos alterados ('D', delta JSON)
+  - colunas de localização normalizadas + valor_m2 numérico em cada versão,
+    para séries de R$/m² por bairro sem decodificar os deltas
+
+Usado por:
+  getdf.py (registrar, na mesma transação do upsert)
+  GET /api/laudo/historico/{id}
+  GET /api/laudo/tendencia/{uf}/{cidade}[/{bairro}]
+
+Primeira carga de uma base existente (dentro de api/):
+  python -m utils.historico --inicializar
+"""
+
+import json
+import hashlib
+import argparse
+from datetime import datetime, timedelta
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float
+from utils.localidades import normalizar_nome, uf_da_cidade
+from utils.storage import StorageBackend, get_backend
+from utils.rollups import SketchM2, resumo
+
+KEYFRAME_A_CADA = 10
+
+CAMPOS_HISTORICO = [
+    "CIDADE", "BAIRRO", "endereco", "tipo", "Titulo", "Metragem",
+    "QUARTOS", "SUITES", "VAGAS", "VALOR", "tipo_negocio",
+]
+
+COLUNAS_HISTORICO = ("ID, seq, data_da_busca, hash, quadro, dados, "
+                     "uf, cidade, bairro, tipo_negocio, tipo, valor_m2")
+
+
+# =========================
+# Codificação
+# =========================
+def campos(row: dict) -> dict:
+    return {c: row.get(c) for c in CAMPOS_HISTORICO}
+
+
+def hash_imovel(row: dict) -> str:
+    bruto = json.dumps(campos(row), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(bruto.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _delta(anterior: dict, atual: dict) -> dict:
+    return {c: atual.get(c) for c in CAMPOS_HISTORICO if anterior.get(c) != atual.get(c)}
+
+
+def decodificar(linhas: list) -> list:
+    """
+    Versões completas a partir das linhas do histórico de um anúncio
+    (ordenadas por seq, começando em um quadro 'K').
+    """
+    versoes, estado = [], None
+    for r in linhas:
+        dados = json.loads(r["dados"])
+        if r["quadro"] == "K" or estado is None:
+            estado = dict(dados)
+        else:
+            estado = dict(estado, **dados)
+        versoes.append(dict(estado, seq=r["seq"], data_da_busca=r["data_da_busca"]))
+    return versoes
+
+
+# =========================
+# Ingest
+# =========================
+def _inserir(cur, row: dict, seq: int, anterior: dict | None, data: str | None):
+    atual = campos(row)
+    keyframe = anterior is None or seq % KEYFRAME_A_CADA == 0
+    dados = atual if keyframe else _delta(anterior, atual)
+    m = parse_metragem_str_to_float(row.get("Metragem"))
+    v = parse_valor_str_to_float(row.get("VALOR"))
+    cur.execute(
+        f"INSERT INTO imoveis_historico ({COLUNAS_HISTORICO}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        (
+            int(row["ID"]), seq, data, hash_imovel(row), "K" if keyframe else "D",
+            json.dumps(dados, ensure_ascii=False, separators=(",", ":"), default=str),
+            uf_da_cidade(row.get("CIDADE")) or "ND",
+            normalizar_nome(row.get("CIDADE")) or "ND",
+            normalizar_nome(row.get("BAIRRO")) or "ND",
+            normalizar_nome(row.get("tipo_negocio")) or "ND",
+            normalizar_nome(row.get("tipo")) or "ND",
+            v / m if (m and m > 0 and v and v > 0) else None,
+        ),
+    )
+
+
+def _ultima_versao(cur, id_: int) -> dict | None:
+    """Última versão completa do anúncio (lê no máximo KEYFRAME_A_CADA linhas)."""
+    cur.execute(
+        "SELECT seq, data_da_busca, hash, quadro, dados FROM imoveis_historico "
+        f"WHERE ID = %s ORDER BY seq DESC LIMIT {KEYFRAME_A_CADA}",
+        (id_,),
+    )
+    linhas = cur.fetchall()
+    if not linhas:
+        return None
+    linhas.reverse()
+    ini = max(i for i, r in enumerate(linhas) if r["quadro"] == "K")
+    ultima = decodificar(linhas[ini:])[-1]
+    ultima["hash"] = linhas[-1]["hash"]
+    return ultima
+
+
+def registrar(cur, backend: StorageBackend, antigo: dict | None, novo: dict) -> bool:
+    """
+    Acrescenta uma versão se `novo` difere da última registrada. Na primeira
+    vez de um anúncio que já existia, grava antes a versão anterior (`antigo`),
+    para não perder o preço que o upsert acabou de sobrescrever.
+    Retorna True se gravou algo. Mesma transação do upsert.
+    """
+    id_ = int(novo["ID"])
+    ultima = _ultima_versao(cur, id_)
+    h = hash_imovel(novo)
+
+    if ultima is None:
+        if antigo and hash_imovel(antigo) != h:
+            _inserir(cur, antigo, 0, None, antigo.get("data_da_busca"))
+            _inserir(cur, novo, 1, campos(antigo), novo.get("data_da_busca"))
+        else:
+            _inserir(cur, novo, 0, None, novo.get("data_da_busca"))
+        return True
+
+    if ultima["hash"] == h:
+        return False
+    _inserir(cur, novo, ultima["seq"] + 1, ultima, novo.get("data_da_busca"))
+    return True
+
+
+def inicializar(backend: StorageBackend, lote: int = 5000) -> int:
+    """Quadro inicial para cada anúncio de imoveis_df ainda sem histórico (lotes por ID)."""
+    n, ultimo_id = 0, -1
+    while True:
+        with backend.cursor() as cur:
+            cur.execute(
+                "SELECT i.* FROM imoveis_df i WHERE i.ID > %s "
+                "AND NOT EXISTS (SELECT 1 FROM imoveis_historico h WHERE h.ID = i.ID) "
+                f"ORDER BY i.ID LIMIT {lote}",
+                (ultimo_id,),
+            )
+            rows = cur.fetchall()
+        if not rows:
+            return n
+        with backend.transacao() as cur:
+            for r in rows:
+                _inserir(cur, r, 0, None, r.get("data_da_busca"))
+        n += len(rows)
+        ultimo_id = rows[-1]["ID"]
+
+
+# =========================
+# Consulta
+# =========================
+def versoes(cur, id_: int) -> list:
+    cur.execute(
+        "SELECT seq, data_da_busca, quadro, dados FROM imoveis_historico WHERE ID = %s ORDER BY seq",
+        (id_,),
+    )
+    return decodificar(cur.fetchall())
+
+
+def tendencia(cur, filtros: dict, meses: int = 24) -> list:
+    """
+    Série mensal de R$/m² das versões registradas (anúncios novos ou com
+    preço/atributo alterado no mês). filtros: uf, cidade, bairro,
+    tipo_negocio, tipo (None = qualquer).
+    """
+    desde = (datetime.now() - timedelta(days=31 * meses)).strftime("%Y-%m")
+    sql = ("SELECT SUBSTR(data_da_busca, 1, 7) AS mes, valor_m2 FROM imoveis_historico "
+           "WHERE valor_m2 IS NOT NULL AND data_da_busca >= %s")
+    params = [desde]
+    for c in ("uf", "cidade", "bairro", "tipo_negocio", "tipo"):
+        v = filtros.get(c)
+        if v:
+            sql += f" AND {c} = %s"
+            params.append(normalizar_nome(v))
+    cur.execute(sql, params)
+
+    grupos: dict = {}
+    for r in cur.fetchall():
+        n, soma, sk = grupos.get(r["mes"]) or (0, 0.0, SketchM2())
+        pm2 = float(r["valor_m2"])
+        sk.adicionar(pm2)
+        grupos[r["mes"]] = (n + 1, soma + pm2, sk)
+
+    serie, anterior = [], None
+    for mes in sorted(grupos):
+        item = dict(resumo(*grupos[mes]), mes=mes)
+        if anterior and anterior["mediana"] and item["mediana"]:
+            item["variacao_mediana_pct"] = round((item["mediana"] / anterior["mediana"] - 1) * 100, 2)
+        else:
+            item["variacao_mediana_pct"] = None
+        serie.append(item)
+        anterior = item
+    return serie
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Histórico append-only de imoveis_df.")
+    ap.add_argument("--inicializar", action="store_true",
+                    help="Grava o quadro inicial dos anúncios que ainda não têm histórico.")
+    args = ap.parse_args()
+    if args.inicializar:
+        n = inicializar(get_backend())
+        print(f"[OK] {n} anúncio(s) com quadro inicial em imoveis_historico.")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+knn.py
+Comparáveis por vizinhos mais próximos (KD-tree em memória).
+
+Um índice por (tipo_negocio, tipo, cidade), com os mesmos filtros LIKE da
+cascata de media_m2_comparaveis. Atributos normalizados (z-score no segmento)
+e pesados:
+  - log(metragem)
+  - quartos, suítes, vagas
+  - bairro: embedding 1D = log da mediana de R$/m² do bairro (bairros de
+    preço parecido ficam próximos; bairro desconhecido = mediana da cidade)
+
+A consulta devolve os k anúncios mais próximos em O(log n) médio, sem as
+várias consultas SQL da cascata endereço -> bairro -> cidade.
+
+LAUDO_KNN_TTL: segundos até reconstruir um índice (padrão 600).
+Com LAUDO_MMAP_PATH (utils/snapshot_mmap.py) a KD-tree de cada segmento já vem
+pronta no snapshot mapeado, compartilhada entre workers (IndiceMapeado); filtros
+que não batem com um valor exato das colunas montam o índice em memória a partir
+das colunas mapeadas. Os índices são refeitos quando a geração muda.
+"""
+
+import os
+import math
+import time
+import heapq
+import weakref
+import threading
+from array import array
+from statistics import median
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float, parse_data_busca_to_epoch
+from utils.localidades import normalizar_nome
+from utils import snapshot_mmap
+from utils.dedup import FILTRO_REPRESENTANTE
+
+TTL_INDICE = float(os.getenv("LAUDO_KNN_TTL", "600"))
+
+# peso de cada dimensão: [log_metragem, quartos, suites, vagas, bairro]
+PESOS = [1.0, 0.6, 0.4, 0.3, 1.0]
+
+
+# =========================
+# KD-tree
+# =========================
+class KDTree:
+    """
+    KD-tree estática; pontos num vetor plano (dim valores por ponto) e nós em
+    vetores paralelos (sem objeto por nó). Os vetores podem ser arrays do
+    processo ou memoryviews tipadas do snapshot mmap; -1 = sem filho.
+    """
+
+    def __init__(self, pontos, dim: int, idx, esq, dir, eixo, raiz: int = 0):
+        self.pontos, self.dim = pontos, dim
+        self.idx, self.esq, self.dir, self.eixo = idx, esq, dir, eixo
+        self.raiz = raiz
+
+    @classmethod
+    def construir(cls, pontos: list) -> "KDTree":
+        """Árvore em memória a partir de uma lista de pontos (raiz = nó 0)."""
+        dim = len(pontos[0]) if pontos else 0
+        idx, esq, dir, eixo = array("i"), array("i"), array("i"), array("h")
+
+        def montar(ids: list, prof: int) -> int:
+            if not ids:
+                return -1
+            e = prof % dim
+            ids.sort(key=lambda i: pontos[i][e])
+            meio = len(ids) // 2
+            no = len(idx)
+            idx.append(ids[meio]); eixo.append(e)
+            esq.append(-1); dir.append(-1)
+            esq[no] = montar(ids[:meio], prof + 1)
+            dir[no] = montar(ids[meio + 1:], prof + 1)
+            return no
+
+        raiz = montar(list(range(len(pontos))), 0)
+        plano = array("d", (x for p in pontos for x in p))
+        return cls(plano, dim, idx, esq, dir, eixo, raiz)
+
+    def consultar(self, alvo: list, k: int) -> list:
+        """[(distancia, indice_do_ponto)] dos k mais próximos, crescente."""
+        P, dim = self.pontos, self.dim
+        heap = []  # max-heap via distância negativa
+        pilha = [self.raiz]
+        while pilha:
+            no = pilha.pop()
+            if no < 0:
+                continue
+            i = self.idx[no]
+            base = i * dim
+            d2 = 0.0
+            for j in range(dim):
+                d = alvo[j] - P[base + j]
+                d2 += d * d
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, i))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, i))
+
+            e = self.eixo[no]
+            diff = alvo[e] - P[base + e]
+            perto, longe = (self.esq[no], self.dir[no]) if diff < 0 else (self.dir[no], self.esq[no])
+            # o lado distante só é visitado se o plano de corte estiver dentro do raio atual
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                pilha.append(longe)
+            pilha.append(perto)
+        return sorted((math.sqrt(-d), i) for d, i in heap)
+
+
+# =========================
+# Índice por segmento
+# =========================
+def _zscore(valores: list) -> tuple:
+    mu = sum(valores) / len(valores)
+    var = sum((x - mu) ** 2 for x in valores) / len(valores)
+    return mu, (math.sqrt(var) or 1.0)
+
+
+def _normalizar(bruto, escalas) -> list:
+    return [w * (x - mu) / sd for w, x, (mu, sd) in zip(PESOS, bruto, escalas)]
+
+
+def preparar_segmento(ms: list, vs: list, qs: list, ss: list, vgs: list, bairros: list) -> dict | None:
+    """
+    Parâmetros e pontos normalizados de um segmento (listas alinhadas; Q/S/V
+    None = ausente; bairro = qualquer chave hashable). Usado pelo índice em
+    memória e pelo gerador do snapshot mmap. None se o segmento estiver vazio.
+    """
+    if not ms:
+        return None
+    por_bairro: dict = {}
+    for m, v, b in zip(ms, vs, bairros):
+        por_bairro.setdefault(b, []).append(math.log(v / m))
+    bairro_emb = {b: median(xs) for b, xs in por_bairro.items()}
+    # valores ausentes de Q/S/V viram a mediana do segmento
+    medianas = [median([x for x in c if x is not None] or [0]) for c in (qs, ss, vgs)]
+    cols = [
+        [math.log(m) for m in ms],
+        *[[x if x is not None else med for x in c] for c, med in zip((qs, ss, vgs), medianas)],
+        [bairro_emb[b] for b in bairros],
+    ]
+    escalas = [_zscore(c) for c in cols]
+    return {
+        "bairro_emb": bairro_emb,
+        "emb_neutro": median(bairro_emb.values()),
+        "medianas": medianas,
+        "escalas": escalas,
+        "pontos": [_normalizar(linha, escalas) for linha in zip(*cols)],
+    }
+
+
+class IndiceComparaveis:
+    def __init__(self, linhas: list, geracao: int | None = None):
+        """linhas: dicts do banco com ID, BAIRRO, Metragem, VALOR, QUARTOS, SUITES, VAGAS e data_da_busca."""
+        self.geracao = geracao
+        self.comps = []   # (m, v, pm2, id, epoch_busca)
+        attrs = []        # (q, s, vg, bairro)
+        for r in linhas:
+            m = parse_metragem_str_to_float(r.get("Metragem"))
+            v = parse_valor_str_to_float(r.get("VALOR"))
+            if not (m and m > 0 and v and v > 0):
+                continue
+            self.comps.append((m, v, v / m, r["ID"], parse_data_busca_to_epoch(r.get("data_da_busca"))))
+            attrs.append((r.get("QUARTOS"), r.get("SUITES"), r.get("VAGAS"), normalizar_nome(r.get("BAIRRO"))))
+        qs, ss, vgs, bairros = (list(c) for c in zip(*attrs)) if attrs else ([], [], [], [])
+        self._montar([c[0] for c in self.comps], [c[1] for c in self.comps], qs, ss, vgs, bairros)
+
+    @classmethod
+    def do_snapshot(cls, snap, sel: list, geracao: int | None = None) -> "IndiceComparaveis":
+        """
+        Índice em memória a partir das colunas tipadas do snapshot mmap
+        (posições em `sel`), sem dict por linha; caminho dos segmentos sem
+        árvore pré-calculada (ver IndiceMapeado). O gerador já descartou
+        metragem/valor inválidos e normalizou os bairros; nulos: -1 em Q/S/V
+        e 0 em data_da_busca.
+        """
+        ind = cls.__new__(cls)
+        ind.geracao = geracao
+        col = snap.colunas
+        ms, vs, ids, datas = ([col[c][i] for i in sel] for c in ("metragem", "valor", "ID", "data_da_busca"))
+        qs, ss, vgs = ([None if x < 0 else x for x in (col[c][i] for i in sel)]
+                       for c in ("quartos", "suites", "vagas"))
+        nomes = snap.dicionario("BAIRRO")
+        bairros = [nomes[col["BAIRRO"][i]] for i in sel]
+        ind.comps = [(m, v, v / m, id_, d or None) for m, v, id_, d in zip(ms, vs, ids, datas)]
+        ind._montar(ms, vs, qs, ss, vgs, bairros)
+        return ind
+
+    def _montar(self, ms, vs, qs, ss, vgs, bairros):
+        self.criado_em = time.time()
+        self.tree = None
+        seg = preparar_segmento(ms, vs, qs, ss, vgs, bairros)
+        if seg is None:
+            return
+        self.bairro_emb, self.emb_neutro = seg["bairro_emb"], seg["emb_neutro"]
+        self.medianas, self.escalas = seg["medianas"], seg["escalas"]
+        self.tree = KDTree.construir(seg["pontos"])
+
+    def comparavel(self, i: int) -> tuple:
+        """(m, v, pm2, id, epoch_busca) do ponto i da árvore."""
+        return self.comps[i]
+
+    def vetor_alvo(self, metragem: float, quartos, suites, vagas, bairro: str | None) -> list:
+        q, s, vg = (x if x is not None else med for x, med in zip((quartos, suites, vagas), self.medianas))
+        emb = self.bairro_emb.get(normalizar_nome(bairro), self.emb_neutro)
+        return _normalizar((math.log(metragem), q, s, vg, emb), self.escalas)
+
+    def vizinhos(self, metragem: float, quartos, suites, vagas, bairro, k: int) -> list:
+        """[(distancia, (m, v, pm2, id, epoch_busca))] dos k comparáveis mais próximos."""
+        if not self.tree:
+            return []
+        alvo = self.vetor_alvo(metragem, quartos, suites, vagas, bairro)
+        return [(d, self.comparavel(i)) for d, i in self.tree.consultar(alvo, k)]
+
+
+class IndiceMapeado(IndiceComparaveis):
+    """
+    Índice de um segmento pré-calculado no snapshot mmap: pontos, nós da
+    KD-tree e parâmetros de normalização são lidos direto do arquivo mapeado
+    (memoryviews tipadas), e os comparáveis são montados só para os vizinhos
+    devolvidos. No processo fica apenas o dicionário bairro -> embedding.
+    Mantém um uso do snapshot enquanto existir (o mapa antigo só é fechado
+    depois que o último índice dele é descartado).
+    """
+
+    def __init__(self, snap, seg: dict):
+        snap.adquirir()
+        weakref.finalize(self, snap.liberar)
+        self._snap = snap
+        self.geracao = snap.geracao
+        self.criado_em = time.time()
+        col = snap.colunas
+        self.tree = KDTree(col["seg_pontos"], len(PESOS), col["seg_idx"], col["seg_esq"],
+                           col["seg_dir"], col["seg_eixo"], raiz=seg["raiz"])
+        self.escalas, self.medianas, self.emb_neutro = seg["escalas"], seg["medianas"], seg["emb_neutro"]
+        nomes = snap.dicionario("BAIRRO")
+        self.bairro_emb = {nomes[c]: e for c, e in seg["bairro_emb"]}
+
+    def comparavel(self, i: int) -> tuple:
+        col = self._snap.colunas
+        p = col["seg_pos"][i]
+        m, v = col["metragem"][p], col["valor"][p]
+        return (m, v, v / m, col["ID"][p], col["data_da_busca"][p] or None)
+
+
+def pesos_por_distancia(distancias: list) -> list:
+    """Kernel gaussiano com banda adaptativa (mediana das distâncias)."""
+    h = median(distancias) if distancias else 0.0
+    if h <= 0:
+        return [1.0] * len(distancias)
+    return [math.exp(-0.5 * (d / h) ** 2) for d in distancias]
+
+
+# =========================
+# Cache de índices
+# =========================
+_indices: dict = {}
+_geracao = None   # geração do snapshot mmap dos índices em _indices
+_lock = threading.Lock()
+
+
+def carregar_linhas(cursor, tipo_negocio, tipo, cidade) -> list:
+    sql = "SELECT ID, BAIRRO, Metragem, VALOR, QUARTOS, SUITES, VAGAS, data_da_busca FROM imoveis_df WHERE 1=1"
+    params = []
+    if cidade:
+        sql += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
+    if tipo:
+        sql += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
+    if tipo_negocio:
+        sql += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
+    sql += FILTRO_REPRESENTANTE
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def obter_indice(cursor, tipo_negocio, tipo, cidade) -> IndiceComparaveis:
+    global _geracao
+    chave = (normalizar_nome(tipo_negocio), normalizar_nome(tipo), normalizar_nome(cidade))
+    with snapshot_mmap.em_uso() as snap:
+        geracao = snap.geracao if snap else None
+        with _lock:
+            if snap is not None and geracao != _geracao:
+                # snapshot novo: índices da geração anterior soltam o mapa antigo
+                _indices.clear()
+                _geracao = geracao
+            ind = _indices.get(chave)
+        if ind is not None:
+            if snap is not None and ind.geracao == geracao:
+                return ind
+            if snap is None and time.time() - ind.criado_em < TTL_INDICE:
+                return ind
+        if snap is not None:
+            seg = snap.segmento_indexado(cidade=cidade, tipo=tipo, tipo_negocio=tipo_negocio)
+            if seg is not None:
+                ind = IndiceMapeado(snap, seg)
+            else:
+                sel = snap.segmento(cidade=cidade, tipo=tipo, tipo_negocio=tipo_negocio)
+                ind = IndiceComparaveis.do_snapshot(snap, sel, geracao=geracao)
+        else:
+            ind = IndiceComparaveis(carregar_linhas(cursor, tipo_negocio, tipo, cidade))
+    with _lock:
+        _indices[chave] = ind
+    return ind
+
+
+def invalidar(tipo_negocio=None, tipo=None, cidade=None):
+    """Descarta índices do segmento (None = qualquer valor)."""
+    alvo = (tipo_negocio, tipo, cidade)
+    with _lock:
+        for chave in list(_indices):
+            if all(a is None or normalizar_nome(a) == c for a, c in zip(alvo, chave)):
+                del _indices[chave]
+
+
+def invalidar_se(predicado) -> int:
+    """Descarta os índices cuja chave satisfaz predicado({tipo_negocio, tipo, cidade})."""
+    with _lock:
+        alvo = [chave for chave in _indices
+                if predicado(dict(zip(("tipo_negocio", "tipo", "cidade"), chave)))]
+        for chave in alvo:
+            del _indices[chave]
+    return len(alvo)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+laudos.py
+Fila assíncrona de geração de laudos (POST /api/laudo/gerar).
+
+Etapas de um job:
+  1) calculando  -> estimativa do imóvel (função síncrona, roda em thread)
+  2) na_fila     -> aguarda vaga no semáforo do LLM (LAUDO_LLM_CONCORRENCIA)
+  3) gerando     -> template de ai/prompts com {DADOS_DO_IMOVEL} preenchido,
+                    enviado ao cliente de utils/llm.py (timeout + tentativas)
+  4) concluido | erro
+
+O progresso de cada job é uma lista de eventos consumida por SSE
+(GET /api/laudo/gerar/{job}/eventos). Tudo roda no event loop: chamadas
+lentas ao LLM não ocupam threads do servidor.
+
+Laudos prontos ficam em cache pelo hash do prompt renderizado + modelo;
+jobs simultâneos com o mesmo hash compartilham uma única chamada
+(SingleFlight.executar_async).
+
+Os jobs vivem na memória do processo (com vários workers, consultar o job
+no mesmo worker — sticky session — ou usar um só worker para esta rota).
+
+LAUDO_PROMPTS_DIR: diretório dos templates .md (padrão ../../ai/prompts).
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from functools import lru_cache
+from collections import OrderedDict
+
+from utils.cache import CacheTTL
+from utils.coalescencia import SingleFlight
+from utils.llm import ClienteLLM, ErroLLM, criar_cliente
+
+PROMPTS_DIR = os.getenv(
+    "LAUDO_PROMPTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ai", "prompts"),
+)
+MARCADOR_DADOS = "{DADOS_DO_IMOVEL}"
+
+CONCORRENCIA_LLM = int(os.getenv("LAUDO_LLM_CONCORRENCIA", "4"))
+JOBS_MAX = 1000
+JOB_TTL = 3600.0          # segundos que um job concluído continua consultável
+INTERVALO_PING = 15.0     # comentário SSE para manter a conexão viva
+
+ESTADOS_FINAIS = ("concluido", "erro")
+
+
+# =========================
+# Template
+# =========================
+@lru_cache(maxsize=16)
+def carregar_template(nome: str) -> str:
+    if not re.fullmatch(r"[a-z0-9_]+", nome or ""):
+        raise ValueError(f"Template inválido: {nome!r}")
+    caminho = os.path.join(PROMPTS_DIR, f"{nome}.md")
+    if not os.path.exists(caminho):
+        raise ValueError(f"Template não encontrado: {nome}")
+    with open(caminho, "r", encoding="utf-8") as f:
+        texto = f.read()
+    if MARCADOR_DADOS not in texto:
+        raise ValueError(f"Template {nome} não tem o marcador {MARCADOR_DADOS}")
+    return texto
+
+
+def dados_do_imovel(estimativa: dict) -> dict:
+    """JSON de entrada do template (mesmas chaves do exemplo em nat_update.md) + estimativa calculada."""
+    e, r = estimativa["entrada"], estimativa["resultado"]
+    local = ", ".join(x for x in (e.get("endereco"), e.get("bairro"), e.get("cidade")) if x)
+    return {
+        "metragem": r["metragem_alvo"],
+        "tipo_imovel": (e.get("tipo") or "").lower(),
+        "endereco_full": local,
+        "qnt_quartos": e.get("quartos"),
+        "qnt_suites": e.get("suites"),
+        "qnt_vagas": e.get("vagas"),
+        "padrao_imovel": r["descricao_estado"],
+        "bairro": e.get("bairro"),
+        "cidade": e.get("cidade"),
+        "estimativa_mercado": {
+            "valor_m2": r["valor_m2_ponderado"],
+            "valor_estimado": r["valor_estimado"],
+            "faixa_negociacao_min": r["faixa_negociacao_min"],
+            "faixa_negociacao_max": r["faixa_negociacao_max"],
+            "comparaveis_usados": r["comparaveis_usados"],
+            "nivel_base": r["nivel_base"],
+            "fonte": "anúncios DF Imóveis (base imogo)",
+        },
+    }
+
+
+def renderizar(template: str, dados: dict) -> str:
+    return template.replace(MARCADOR_DADOS, json.dumps(dados, ensure_ascii=False, indent=3))
+
+
+def chave_laudo(prompt: str, modelo: str) -> str:
+    return hashlib.sha256(f"{modelo}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def extrair_json(texto: str):
+    """JSON da resposta (aceita bloco ```json ... ```); None se não for JSON válido."""
+    m = re.search(r"```(?:json)?\s*(.*?)```", texto or "", re.S)
+    try:
+        return json.loads(m.group(1) if m else texto)
+    except (TypeError, ValueError):
+        return None
+
+
+# =========================
+# Job
+# =========================
+class Job:
+    def __init__(self, template: str):
+        self.id = uuid.uuid4().hex
+        self.template = template
+        self.status = "criado"
+        self.criado_em = time.time()
+        self.concluido_em = None
+        self.resultado = None
+        self.erro = None
+        self.eventos = []   # [(tipo, dados)]
+        self._cond = asyncio.Condition()
+
+    def publicar(self, tipo: str, dados: dict):
+        """Registra um evento e acorda os leitores SSE (chamar no event loop)."""
+        self.eventos.append((tipo, dict(dados, job=self.id, t=round(time.time() - self.criado_em, 3))))
+        asyncio.ensure_future(self._notificar())
+
+    async def _notificar(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def mudar_status(self, status: str, **extra):
+        self.status = status
+        if status in ESTADOS_FINAIS:
+            self.concluido_em = time.time()
+        self.publicar("estado", dict(extra, status=status))
+
+    @property
+    def finalizado(self) -> bool:
+        return self.status in ESTADOS_FINAIS
+
+    async def stream_sse(self, desde: int = 0):
+        """Eventos no formato text/event-stream, até o job terminar."""
+        i = desde
+        while True:
+            while i < len(self.eventos):
+                tipo, dados = self.eventos[i]
+                yield f"id: {i}\nevent: {tipo}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+                i += 1
+            if self.finalizado:
+                return
+            async with self._cond:
+                if i >= len(self.eventos) and not self.finalizado:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), timeout=INTERVALO_PING)
+                    except asyncio.TimeoutError:
+                        yield ": ping\n\n"
+
+    def resumo(self) -> dict:
+        return {
+            "job": self.id, "status": self.status, "template": self.template,
+            "criado_em": self.criado_em, "concluido_em": self.concluido_em,
+            "resultado": self.resultado, "erro": self.erro,
+        }
+
+
+# =========================
+# Gerador
+# =========================
+class GeradorLaudos:
+    def __init__(self, fabrica_cliente=criar_cliente, concorrencia: int = CONCORRENCIA_LLM,
+                 cache: CacheTTL | None = None, coalescedor: SingleFlight | None = None):
+        self._fabrica = fabrica_cliente
+        self._cliente: ClienteLLM | None = None
+        self._concorrencia = concorrencia
+        self._sem = None  # criado no event loop, no primeiro job
+        self.cache = cache or CacheTTL(max_itens=512, ttl=24 * 3600)
+        self.coalescedor = coalescedor or SingleFlight()
+        self.jobs: OrderedDict = OrderedDict()
+        self._tarefas = set()
+
+    @property
+    def cliente(self) -> ClienteLLM | None:
+        if self._cliente is None:
+            self._cliente = self._fabrica()
+        return self._cliente
+
+    def disponivel(self) -> bool:
+        return self.cliente is not None
+
+    def obter(self, job_id: str) -> Job | None:
+        return self.jobs.get(job_id)
+
+    def _limpar(self):
+        agora = time.time()
+        for jid in [j for j, job in self.jobs.items() if job.finalizado and agora - job.concluido_em > JOB_TTL]:
+            del self.jobs[jid]
+        while len(self.jobs) > JOBS_MAX:
+            self.jobs.popitem(last=False)
+
+    def enfileirar(self, calcular_estimativa, template: str = "nat_update") -> Job:
+        """
+        Cria o job e agenda sua execução no event loop corrente.
+        calcular_estimativa: função síncrona sem argumentos que devolve a
+        resposta de /api/laudo/estimativa.
+        """
+        carregar_template(template)  # valida antes de aceitar o job
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self._concorrencia)
+        self._limpar()
+        job = Job(template)
+        self.jobs[job.id] = job
+        job.mudar_status("na_fila")
+        tarefa = asyncio.create_task(self._executar(job, calcular_estimativa))
+        self._tarefas.add(tarefa)
+        tarefa.add_done_callback(self._tarefas.discard)
+        return job
+
+    async def _executar(self, job: Job, calcular_estimativa):
+        try:
+            job.mudar_status("calculando")
+            estimativa = await asyncio.to_thread(calcular_estimativa)
+            if not estimativa.get("ok"):
+                job.erro = estimativa.get("mensagem") or "Estimativa indisponível."
+                job.mudar_status("erro", erro=job.erro)
+                return
+            job.publicar("estimativa", {"resultado": {k: v for k, v in estimativa["resultado"].items()
+                                                      if k != "comparaveis_detalhados"}})
+
+            prompt = renderizar(carregar_template(job.template), dados_do_imovel(estimativa))
+            chave = chave_laudo(prompt, self.cliente.modelo)
+            pronto = self.cache.get(chave)
+            if pronto is None:
+                pronto = await self.coalescedor.executar_async(("laudo", chave), self._gerar, job, prompt)
+                self.cache.set(chave, pronto)
+                em_cache = False
+            else:
+                em_cache = True
+
+            job.resultado = dict(pronto, hash_entrada=chave, em_cache=em_cache)
+            job.publicar("resultado", job.resultado)
+            job.mudar_status("concluido")
+        except (ErroLLM, ValueError) as e:
+            job.erro = str(e)
+            job.mudar_status("erro", erro=job.erro)
+        except Exception as e:
+            job.erro = f"Erro inesperado: {e!r}"
+            job.mudar_status("erro", erro=job.erro)
+
+    async def _gerar(self, job: Job, prompt: str) -> dict:
+        async with self._sem:
+            job.mudar_status("gerando", modelo=self.cliente.modelo)
+            t0 = time.perf_counter()
+            texto = await self.cliente.completar(
+                [{"role": "user", "content": prompt}],
+                ao_tentar=lambda n, erro: job.publicar("tentativa", {"tentativa": n, "erro": erro}),
+            )
+        return {
+            "laudo": extrair_json(texto),
+            "texto": texto,
+            "modelo": self.cliente.modelo,
+            "gerado_em_s": round(time.perf_counter() - t0, 2),
+        }
+
+    def metricas(self) -> dict:
+        por_status: dict = {}
+        for job in self.jobs.values():
+            por_status[job.status] = por_status.get(job.status, 0) + 1
+        return {"jobs": len(self.jobs), "por_status": por_status,
+                "cache": self.cache.metricas(), "coalescencia": self.coalescedor.metricas()}
+
+    async def fechar(self):
+        if self._cliente is not None:
+            await self._cliente.fechar()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+listagem.py
+Listagem de imóveis com os filtros da estimativa e paginação por cursor
+(keyset) em (valor_num, ID).
+
+Cada página é "WHERE <filtros> AND (valor_num, ID) < (cursor) ORDER BY
+valor_num DESC, ID DESC LIMIT n": o banco percorre o índice idx_valor_id a
+partir do cursor, então a página 500 custa o mesmo que a primeira (com
+OFFSET, o banco leria e descartaria todas as linhas anteriores).
+
+Usado por:
+  GET /api/laudo/imoveis          (paginação + projeção de colunas)
+  calcular_estimativa (api_laudo) e consultas_imoveis.py (mesmos filtros)
+
+No MySQL, valor_num/metragem_num são colunas geradas (schema_dfdb.sql /
+migracoes.sql); no SQLite, colunas preenchidas no upsert.
+"""
+
+import re
+import json
+import base64
+
+from utils.storage import COLUNAS_IMOVEL, StorageBackend
+from utils.dedup import FILTRO_REPRESENTANTE
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+# colunas aceitas em ?campos= (ID entra sempre: faz parte do cursor)
+CAMPOS_PROJECAO = COLUNAS_IMOVEL + ["metragem_num", "valor_num", "grupo_duplicado"]
+
+
+class CursorInvalido(ValueError):
+    """Cursor de paginação malformado ou de outra ordenação."""
+
+
+# =========================
+# Filtros
+# =========================
+def _tokens(texto: str) -> list:
+    return [t for t in re.findall(r"[A-Za-z0-9]+", str(texto or "").upper()) if t]
+
+
+def filtros_imoveis(backend: StorageBackend, metragem=None, quartos=None, suites=None, vagas=None,
+                    cidade=None, bairro=None, endereco=None, tipo=None, tipo_negocio=None,
+                    colapsar_duplicados: bool = False) -> tuple:
+    """
+    (trecho WHERE, params) com os filtros da listagem da estimativa.
+    metragem: (min, max), mínimo (float) ou None — já interpretada
+    (parse_metragem_param).
+    """
+    sql, params = "1=1", []
+    if isinstance(metragem, tuple):
+        sql += f" AND {backend.expr_metragem} BETWEEN %s AND %s"
+        params.extend([metragem[0], metragem[1]])
+    elif isinstance(metragem, float):
+        sql += f" AND {backend.expr_metragem} >= %s"
+        params.append(metragem)
+
+    if quartos is not None:
+        sql += " AND QUARTOS = %s"; params.append(quartos)
+    if suites is not None:
+        sql += " AND SUITES = %s"; params.append(suites)
+    if vagas is not None:
+        sql += " AND VAGAS = %s"; params.append(vagas)
+    if cidade and cidade != "*":
+        sql += " AND CIDADE LIKE %s"; params.append(f"%{cidade}%")
+    if bairro and bairro != "*":
+        sql += " AND BAIRRO LIKE %s"; params.append(f"%{bairro}%")
+    if tipo:
+        sql += " AND tipo LIKE %s"; params.append(f"%{tipo}%")
+    for t in _tokens(endereco):
+        sql += " AND endereco LIKE %s"; params.append(f"%{t}%")
+    if tipo_negocio:
+        sql += " AND tipo_negocio LIKE %s"; params.append(f"%{tipo_negocio}%")
+    if colapsar_duplicados:
+        sql += FILTRO_REPRESENTANTE
+    return sql, params
+
+
+# =========================
+# Cursor
+# =========================
+def codificar_cursor(valor, id_: int, ordem: str) -> str:
+    bruto = json.dumps([valor, id_, ordem], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str, ordem: str) -> tuple:
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valor, id_, ordem_cursor = json.loads(bruto)
+        valor, id_ = float(valor), int(id_)
+    except (ValueError, TypeError):
+        raise CursorInvalido("Cursor inválido.")
+    if ordem_cursor != ordem:
+        raise CursorInvalido("Cursor gerado com outra ordenação.")
+    return valor, id_
+
+
+# =========================
+# Página
+# =========================
+def pagina(cur, backend: StorageBackend, where: str, params: list, campos: list | None = None,
+           limite: int = LIMITE_PADRAO, apos: str | None = None, ordem: str = "desc") -> dict:
+    """
+    Uma página da listagem. Imóveis sem valor numérico ficam de fora (não
+    têm posição na ordenação). Retorna {"imoveis", "proximo_cursor"}.
+    """
+    if ordem not in ("asc", "desc"):
+        raise ValueError("ordem deve ser asc ou desc")
+    cols = [c for c in (campos or COLUNAS_IMOVEL) if c in CAMPOS_PROJECAO]
+    if not cols:
+        raise ValueError(f"Nenhum campo válido; use: {', '.join(CAMPOS_PROJECAO)}")
+    cols = list(dict.fromkeys(["ID"] + cols))
+
+    valor = backend.expr_valor
+    sql = (f"SELECT {', '.join(cols)}, {valor} AS _valor_cursor FROM imoveis_df "
+           f"WHERE {where} AND {valor} IS NOT NULL")
+    params = list(params)
+    if apos:
+        v, i = decodificar_cursor(apos, ordem)
+        op = "<" if ordem == "desc" else ">"
+        # OR expandido em vez de (valor, ID) < (v, i): o MySQL 5.7 não usa índice em comparação de tuplas
+        sql += f" AND ({valor} {op} %s OR ({valor} = %s AND ID {op} %s))"
+        params.extend([v, v, i])
+    direcao = "DESC" if ordem == "desc" else "ASC"
+    sql += f" ORDER BY {valor} {direcao}, ID {direcao} LIMIT {int(limite) + 1}"
+
+    cur.execute(sql, params)
+    linhas = cur.fetchall()
+    tem_mais = len(linhas) > limite
+    linhas = linhas[:limite]
+
+    proximo = None
+    if tem_mais and linhas:
+        ultimo = linhas[-1]
+        proximo = codificar_cursor(float(ultimo["_valor_cursor"]), int(ultimo["ID"]), ordem)
+    imoveis = [{c: r[c] for c in cols} for r in linhas]
+    return {"imoveis": imoveis, "proximo_cursor": proximo}
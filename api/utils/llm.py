@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+llm.py
+Cliente de LLM plugável para a geração de laudos (utils/laudos.py).
+
+  - ClienteLLM                 -> interface: async completar(mensagens) -> texto
+  - ClienteOpenAICompativel    -> POST {url}/chat/completions (OpenAI, Azure,
+                                  vLLM, Ollama, ... ou o servidor falso de
+                                  api/test/fake_llm.py), via httpx assíncrono
+  - criar_cliente()            -> a partir das variáveis LAUDO_LLM_*
+
+Variáveis:
+  LAUDO_LLM_URL       base da API (ex: https://api.openai.com/v1)
+  LAUDO_LLM_MODELO    nome do modelo
+  LAUDO_LLM_API_KEY   chave (opcional para servidores locais)
+  LAUDO_LLM_TIMEOUT   segundos por tentativa (padrão 120)
+  LAUDO_LLM_TENTATIVAS nº máximo de tentativas (padrão 3)
+
+Requer httpx (pip install httpx).
+"""
+
+import os
+import random
+import asyncio
+
+
+class ErroLLM(Exception):
+    """Falha definitiva na chamada ao LLM (após as tentativas)."""
+
+
+class ClienteLLM:
+    nome = "base"
+    modelo = ""
+
+    async def completar(self, mensagens: list, ao_tentar=None) -> str:
+        raise NotImplementedError
+
+    async def fechar(self):
+        pass
+
+
+class ClienteOpenAICompativel(ClienteLLM):
+    nome = "openai"
+
+    # respostas que valem nova tentativa (limite de taxa / indisponibilidade)
+    STATUS_REPETIR = {408, 409, 425, 429, 500, 502, 503, 504}
+
+    def __init__(self, url: str, modelo: str, api_key: str | None = None,
+                 timeout: float = 120.0, tentativas: int = 3, temperatura: float = 0.2):
+        import httpx  # import tardio: só quem gera laudo precisa do httpx
+
+        self.url = url.rstrip("/")
+        self.modelo = modelo
+        self.tentativas = max(1, tentativas)
+        self.temperatura = temperatura
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self._httpx = httpx
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            headers=headers,
+        )
+
+    async def completar(self, mensagens: list, ao_tentar=None) -> str:
+        """
+        Envia as mensagens e devolve o texto da primeira escolha.
+        ao_tentar(n, erro) é chamado antes de cada nova tentativa (progresso).
+        """
+        corpo = {"model": self.modelo, "messages": mensagens, "temperature": self.temperatura}
+        ultimo_erro = None
+        for n in range(1, self.tentativas + 1):
+            try:
+                r = await self._http.post(f"{self.url}/chat/completions", json=corpo)
+                if r.status_code in self.STATUS_REPETIR:
+                    raise ErroLLM(f"HTTP {r.status_code}")
+                r.raise_for_status()
+                return r.json()["choices"][0]["message"]["content"]
+            except (self._httpx.TimeoutException, self._httpx.TransportError, ErroLLM) as e:
+                ultimo_erro = e
+            except (self._httpx.HTTPStatusError, KeyError, IndexError, ValueError) as e:
+                raise ErroLLM(f"Resposta inválida do LLM: {e}") from e
+
+            if n < self.tentativas:
+                if ao_tentar:
+                    ao_tentar(n + 1, str(ultimo_erro) or type(ultimo_erro).__name__)
+                # backoff exponencial com jitter
+                await asyncio.sleep(min(30.0, 2 ** (n - 1)) * (0.5 + random.random()))
+        raise ErroLLM(f"LLM indisponível após {self.tentativas} tentativa(s): {ultimo_erro!r}")
+
+    async def fechar(self):
+        await self._http.aclose()
+
+
+def criar_cliente() -> ClienteLLM | None:
+    """Cliente configurado por LAUDO_LLM_*; None se LAUDO_LLM_URL não estiver definido."""
+    url = os.getenv("LAUDO_LLM_URL")
+    if not url:
+        return None
+    return ClienteOpenAICompativel(
+        url=url,
+        modelo=os.getenv("LAUDO_LLM_MODELO", "gpt-4o-mini"),
+        api_key=os.getenv("LAUDO_LLM_API_KEY"),
+        timeout=float(os.getenv("LAUDO_LLM_TIMEOUT", "120")),
+        tentativas=int(os.getenv("LAUDO_LLM_TENTATIVAS", "3")),
+    )
@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""
+localidades.py
+Consulta aos metadados de localização do DF Imóveis (webscraping/dfimoveis/metadata).
+Nomes são comparados em CAIXA ALTA, sem acento e sem espaços duplicados.
+
+Os JSON (cidades/{uf}.json, bairros/{CIDADE}.json com caixa de nome variada,
+todos_os_enderecos.json) são compilados num índice SQLite somente leitura,
+metadata/localidades.sqlite, com nomes normalizados e índices por nível:
+uf -> cidades -> bairros -> endereços. Abrir o índice leva milissegundos e cada
+consulta lê só o ramo pedido. O índice é recompilado sozinho quando algum JSON
+é mais novo que ele (ou de outra VERSAO_INDICE); para compilar manualmente
+(dentro de api/):
+  python -m utils.localidades --compilar
+
+O índice guarda também o grafo de bairros vizinhos (nível "bairros_vizinhos"
+da cascata de comparáveis): bairros da mesma cidade são vizinhos entre si
+quando a cidade tem até MAX_IRMAOS bairros; os demais pares (cidades
+grandes e pares entre cidades) vêm da curadoria em vizinhos/vizinhos.json.
+Vai para a memória uma vez por processo (grafo_vizinhos), com a assinatura
+dos JSON de origem:
+  python -m utils.localidades --vizinhos BRASILIA "ASA SUL"
+
+LAUDO_METADATA_DIR sobrescreve o diretório padrão dos metadados.
+LAUDO_LOCALIDADES_PATH sobrescreve o caminho do índice compilado.
+"""
+
+import os
+import json
+import glob
+import hashlib
+import sqlite3
+import tempfile
+import argparse
+import threading
+import unicodedata
+from functools import lru_cache
+
+METADATA_DIR = os.getenv(
+    "LAUDO_METADATA_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "webscraping", "dfimoveis", "metadata"),
+)
+
+# DF primeiro: o DF Imóveis lista cidades do entorno (ex.: AGUAS LINDAS DE GOIAS) também sob DF
+UF_PRIORIDADE = ["DF"]
+
+
+def normalizar_nome(s: str | None) -> str:
+    s = unicodedata.normalize("NFD", s or "")
+    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+    return " ".join(s.replace("+", " ").split()).upper()
+
+
+def limpar_caixa_alta(s: str | None) -> str:
+    """Regra das rotas de endereço da API: sem espaços duplicados, CAIXA ALTA, acentos mantidos."""
+    return " ".join((s or "").split()).upper()
+
+
+INDICE_PATH = os.getenv("LAUDO_LOCALIDADES_PATH", os.path.join(METADATA_DIR, "localidades.sqlite"))
+VERSAO_INDICE = "2"
+VIZINHOS_PATH = os.path.join(METADATA_DIR, "vizinhos", "vizinhos.json")
+
+# cidades com até MAX_IRMAOS bairros: todos vizinhos entre si (acima disso, só a curadoria)
+MAX_IRMAOS = 8
+
+# opções de formulário que vieram junto na coleta dos metadados
+NOMES_IGNORADOS = {"SELECIONE", ""}
+
+SCHEMA_INDICE = """
+CREATE TABLE meta (chave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE cidade (id INTEGER PRIMARY KEY, uf TEXT NOT NULL, nome TEXT NOT NULL, nome_norm TEXT NOT NULL, prioridade INTEGER NOT NULL);
+CREATE TABLE bairro (id INTEGER PRIMARY KEY, cidade_id INTEGER NOT NULL, nome TEXT NOT NULL, nome_norm TEXT NOT NULL);
+CREATE TABLE endereco (bairro_id INTEGER NOT NULL, nome TEXT NOT NULL, nome_norm TEXT NOT NULL);
+CREATE TABLE vizinho (bairro_id INTEGER NOT NULL, vizinho_id INTEGER NOT NULL, origem TEXT NOT NULL,
+                      PRIMARY KEY (bairro_id, vizinho_id));
+CREATE UNIQUE INDEX idx_cidade ON cidade (nome_norm, uf);
+CREATE INDEX idx_cidade_uf ON cidade (uf, nome_norm);
+CREATE UNIQUE INDEX idx_bairro ON bairro (cidade_id, nome_norm);
+CREATE INDEX idx_endereco ON endereco (bairro_id, nome_norm);
+"""
+
+
+# =========================
+# Compilação
+# =========================
+def _fontes() -> list:
+    return sorted(glob.glob(os.path.join(METADATA_DIR, "**", "*.json"), recursive=True)
+                  + glob.glob(os.path.join(METADATA_DIR, "**", "*.JSON"), recursive=True))
+
+
+def _ler_json(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def assinatura_fontes() -> str:
+    """Resumo (blake2b) do conteúdo dos JSON de metadados: versão dos dados do índice."""
+    h = hashlib.blake2b(digest_size=8)
+    for path in _fontes():
+        h.update(os.path.relpath(path, METADATA_DIR).encode("utf-8"))
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _arestas_vizinhos(bairros: dict, cidade_existente) -> tuple:
+    """
+    {(bairro_id, vizinho_id): origem} (simétrico) e a lista de nomes da
+    curadoria que não existem no índice.
+    """
+    arestas: dict = {}
+    por_cidade: dict = {}
+    for (cid, _), (bid, _) in bairros.items():
+        por_cidade.setdefault(cid, []).append(bid)
+    for ids in por_cidade.values():
+        if len(ids) <= MAX_IRMAOS:
+            for a in ids:
+                for b in ids:
+                    if a != b:
+                        arestas[(a, b)] = "cidade"
+
+    def localizar(nome: str) -> int | None:
+        cidade, _, bairro = nome.partition("/")
+        cid = cidade_existente(cidade)
+        item = bairros.get((cid, normalizar_nome(bairro)))
+        return item[0] if item else None
+
+    ausentes = []
+    if os.path.exists(VIZINHOS_PATH):
+        for origem, lista in _ler_json(VIZINHOS_PATH).get("vizinhos", {}).items():
+            a = localizar(origem)
+            if a is None:
+                ausentes.append(origem)
+                continue
+            for nome in lista:
+                b = localizar(nome)
+                if b is None:
+                    ausentes.append(nome)
+                elif a != b:
+                    arestas[(a, b)] = arestas[(b, a)] = "curadoria"
+    return arestas, ausentes
+
+
+def compilar(destino: str = INDICE_PATH) -> dict:
+    """Lê todos os JSON de metadados e grava o índice (arquivo temporário + troca atômica)."""
+    # uf de cada cidade (DF primeiro; cidades.json é a lista antiga do DF)
+    arquivos_uf = {}
+    for path in glob.glob(os.path.join(METADATA_DIR, "cidades", "*.json")):
+        uf = os.path.splitext(os.path.basename(path))[0].upper()
+        if len(uf) == 2:
+            arquivos_uf[uf] = path
+    ordem_uf = [uf for uf in UF_PRIORIDADE if uf in arquivos_uf]
+    ordem_uf += sorted(uf for uf in arquivos_uf if uf not in UF_PRIORIDADE)
+
+    cidades: dict = {}   # (nome_norm, uf) -> [id, nome, prioridade]
+    uf_principal: dict = {}
+    for prioridade, uf in enumerate(ordem_uf):
+        for nome in _ler_json(arquivos_uf[uf]).get("cidades", []):
+            norm = normalizar_nome(nome)
+            if norm in NOMES_IGNORADOS or (norm, uf) in cidades:
+                continue
+            cidades[(norm, uf)] = [len(cidades) + 1, nome, prioridade]
+            uf_principal.setdefault(norm, uf)
+
+    def cidade_id(nome: str) -> int | None:
+        norm = normalizar_nome(nome)
+        if norm in NOMES_IGNORADOS:
+            return None
+        uf = uf_principal.get(norm)
+        if uf is None:
+            uf = uf_principal[norm] = "ND"
+            cidades[(norm, uf)] = [len(cidades) + 1, nome, len(ordem_uf)]
+        return cidades[(norm, uf)][0]
+
+    bairros: dict = {}    # (cidade_id, nome_norm) -> [id, nome]
+    enderecos: dict = {}  # (bairro_id, nome_norm) -> nome (primeira grafia vista)
+
+    def bairro_id(cid: int, nome: str) -> int | None:
+        norm = normalizar_nome(nome)
+        if cid is None or norm in NOMES_IGNORADOS:
+            return None
+        if (cid, norm) not in bairros:
+            bairros[(cid, norm)] = [len(bairros) + 1, nome]
+        return bairros[(cid, norm)][0]
+
+    # bairros/{CIDADE}.json (nome do arquivo com '+' e extensão em caixa variada)
+    for path in glob.glob(os.path.join(METADATA_DIR, "bairros", "*")):
+        base, ext = os.path.splitext(os.path.basename(path))
+        if ext.lower() != ".json":
+            continue
+        cid = cidade_id(base)
+        for nome in _ler_json(path).get("bairros", []):
+            bairro_id(cid, nome)
+
+    # todos_os_enderecos.json: {CIDADE: {BAIRRO: [endereços]}}
+    todos = os.path.join(METADATA_DIR, "todos_os_enderecos.json")
+    if os.path.exists(todos):
+        for cidade, por_bairro in _ler_json(todos).items():
+            cid = cidade_id(cidade)
+            for bairro, lista in (por_bairro or {}).items():
+                bid = bairro_id(cid, bairro)
+                if bid is None:
+                    continue
+                for end in lista or []:
+                    norm = normalizar_nome(end)
+                    if norm not in NOMES_IGNORADOS:
+                        enderecos.setdefault((bid, norm), " ".join(str(end).split()))
+
+    def cidade_existente(nome: str) -> int | None:
+        norm = normalizar_nome(nome)
+        item = cidades.get((norm, uf_principal.get(norm)))
+        return item[0] if item else None
+
+    arestas, ausentes = _arestas_vizinhos(bairros, cidade_existente)
+
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    tmp = destino + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA_INDICE)
+        conn.executemany("INSERT INTO cidade VALUES (?, ?, ?, ?, ?)",
+                         [(i, uf, nome, norm, pr) for (norm, uf), (i, nome, pr) in cidades.items()])
+        conn.executemany("INSERT INTO bairro VALUES (?, ?, ?, ?)",
+                         [(i, cid, nome, norm) for (cid, norm), (i, nome) in bairros.items()])
+        conn.executemany("INSERT INTO endereco VALUES (?, ?, ?)",
+                         [(bid, nome, norm) for (bid, norm), nome in sorted(enderecos.items())])
+        conn.executemany("INSERT INTO vizinho VALUES (?, ?, ?)",
+                         [(a, b, origem) for (a, b), origem in sorted(arestas.items())])
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [("versao", VERSAO_INDICE), ("assinatura", assinatura_fontes())])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp, destino)
+    return {"caminho": os.path.abspath(destino), "cidades": len(cidades), "bairros": len(bairros),
+            "enderecos": len(enderecos), "vizinhos": len(arestas) // 2, "vizinhos_ausentes": ausentes}
+
+
+def _versao_arquivo(caminho: str) -> str | None:
+    try:
+        conn = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True)
+        try:
+            linha = conn.execute("SELECT valor FROM meta WHERE chave = 'versao'").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+    return linha[0] if linha else None
+
+
+def _desatualizado(caminho: str) -> bool:
+    if not os.path.exists(caminho):
+        return True
+    mtime = os.path.getmtime(caminho)
+    if any(os.path.getmtime(f) > mtime for f in _fontes()):
+        return True
+    return _versao_arquivo(caminho) != VERSAO_INDICE
+
+
+# =========================
+# Consulta
+# =========================
+class IndiceLocalidades:
+    """Leitura do índice compilado (conexão somente leitura, compartilhada entre threads)."""
+
+    def __init__(self, caminho: str = INDICE_PATH):
+        self.caminho = caminho
+        self._conn = sqlite3.connect(f"file:{caminho}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        versao = self._um("SELECT valor FROM meta WHERE chave = 'versao'")
+        if versao != VERSAO_INDICE:
+            raise ValueError(f"Índice de localidades em versão diferente ({versao}): {caminho}")
+
+    def _todos(self, sql: str, params=()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _um(self, sql: str, params=()):
+        linhas = self._todos(sql, params)
+        return linhas[0][0] if linhas else None
+
+    def _cidade_id(self, uf: str | None, cidade: str) -> int | None:
+        if uf:
+            return self._um("SELECT id FROM cidade WHERE nome_norm = ? AND uf = ?",
+                            (normalizar_nome(cidade), normalizar_nome(uf)))
+        return self._um("SELECT id FROM cidade WHERE nome_norm = ? ORDER BY prioridade LIMIT 1",
+                        (normalizar_nome(cidade),))
+
+    def _bairro_id(self, uf: str | None, cidade: str, bairro: str) -> int | None:
+        cid = self._cidade_id(uf, cidade)
+        if cid is None:
+            return None
+        return self._um("SELECT id FROM bairro WHERE cidade_id = ? AND nome_norm = ?", (cid, normalizar_nome(bairro)))
+
+    def ufs(self) -> list:
+        return [r[0] for r in self._todos("SELECT DISTINCT uf FROM cidade ORDER BY uf")]
+
+    def cidades(self, uf: str) -> list:
+        return [r[0] for r in self._todos("SELECT nome_norm FROM cidade WHERE uf = ? ORDER BY nome_norm",
+                                          (normalizar_nome(uf),))]
+
+    def bairros(self, uf: str | None, cidade: str) -> list:
+        cid = self._cidade_id(uf, cidade)
+        if cid is None:
+            return []
+        return [r[0] for r in self._todos("SELECT nome_norm FROM bairro WHERE cidade_id = ? ORDER BY nome_norm", (cid,))]
+
+    def enderecos(self, uf: str | None, cidade: str, bairro: str, prefixo: str | None = None,
+                  limite: int | None = None) -> list:
+        """Endereços do bairro (grafia original); prefixo filtra pelo nome normalizado."""
+        bid = self._bairro_id(uf, cidade, bairro)
+        if bid is None:
+            return []
+        sql, params = "SELECT nome FROM endereco WHERE bairro_id = ?", [bid]
+        if prefixo:
+            sql += " AND nome_norm >= ? AND nome_norm < ?"
+            p = normalizar_nome(prefixo)
+            params += [p, p + "\uffff"]
+        sql += " ORDER BY nome_norm"
+        if limite:
+            sql += f" LIMIT {int(limite)}"
+        return [r[0] for r in self._todos(sql, params)]
+
+    def uf_da_cidade(self, cidade: str | None) -> str | None:
+        uf = self._um("SELECT uf FROM cidade WHERE nome_norm = ? ORDER BY prioridade LIMIT 1",
+                      (normalizar_nome(cidade),))
+        return uf if uf != "ND" else None
+
+    def canonico(self, cidade: str | None, bairro: str | None) -> tuple:
+        """(cidade, bairro) na grafia normalizada do índice; mantém o original se não achar."""
+        cid = self._cidade_id(None, cidade or "")
+        if cid is None:
+            return cidade, bairro
+        cidade_n = normalizar_nome(cidade)
+        if not bairro:
+            return cidade_n, bairro
+        achou = self._um("SELECT nome_norm FROM bairro WHERE cidade_id = ? AND nome_norm = ?",
+                         (cid, normalizar_nome(bairro)))
+        return cidade_n, (achou or bairro)
+
+    def mapa_cidade_uf(self) -> dict:
+        mapa = {}
+        for norm, uf in self._todos("SELECT nome_norm, uf FROM cidade WHERE uf <> 'ND' ORDER BY prioridade"):
+            mapa.setdefault(norm, uf)
+        return mapa
+
+    def assinatura(self) -> str | None:
+        return self._um("SELECT valor FROM meta WHERE chave = 'assinatura'")
+
+    def vizinhos(self) -> dict:
+        """{(CIDADE, BAIRRO): [(CIDADE, BAIRRO), ...]} de todo o grafo (nomes normalizados)."""
+        grafo: dict = {}
+        for c1, b1, c2, b2 in self._todos(
+            "SELECT c1.nome_norm, b1.nome_norm, c2.nome_norm, b2.nome_norm FROM vizinho v "
+            "JOIN bairro b1 ON b1.id = v.bairro_id JOIN cidade c1 ON c1.id = b1.cidade_id "
+            "JOIN bairro b2 ON b2.id = v.vizinho_id JOIN cidade c2 ON c2.id = b2.cidade_id "
+            "ORDER BY c1.nome_norm, b1.nome_norm, c2.nome_norm, b2.nome_norm"
+        ):
+            grafo.setdefault((c1, b1), []).append((c2, b2))
+        return grafo
+
+
+_indice: IndiceLocalidades | None = None
+_indice_lock = threading.Lock()
+
+
+def indice() -> IndiceLocalidades:
+    """Índice do processo; compila na primeira vez (ou se os JSON mudaram)."""
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            caminho = INDICE_PATH
+            if _desatualizado(caminho):
+                try:
+                    compilar(caminho)
+                except OSError:
+                    # diretório de metadados somente leitura: compila no temp
+                    caminho = os.path.join(tempfile.gettempdir(), "imogo-localidades.sqlite")
+                    if _desatualizado(caminho):
+                        compilar(caminho)
+            _indice = IndiceLocalidades(caminho)
+        return _indice
+
+
+@lru_cache(maxsize=1)
+def mapa_cidade_uf() -> dict:
+    """{CIDADE: UF} (dict em memória: usado por linha nos agregados e snapshots)."""
+    return indice().mapa_cidade_uf()
+
+
+def uf_da_cidade(cidade: str | None) -> str | None:
+    return mapa_cidade_uf().get(normalizar_nome(cidade))
+
+
+@lru_cache(maxsize=1)
+def grafo_vizinhos() -> dict:
+    """Grafo de bairros vizinhos do índice, carregado uma vez (ver IndiceLocalidades.vizinhos)."""
+    return indice().vizinhos()
+
+
+def vizinhos_bairro(cidade: str | None, bairro: str | None) -> list:
+    """
+    [(CIDADE, BAIRRO)] do próprio bairro seguido dos vizinhos; vazio se o
+    par não estiver no índice ou não tiver vizinhos.
+    """
+    chave = (normalizar_nome(cidade), normalizar_nome(bairro))
+    vizinhos = grafo_vizinhos().get(chave)
+    return [chave] + vizinhos if vizinhos else []
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Índice compilado dos metadados de localização.")
+    ap.add_argument("--compilar", action="store_true", help="Recompila o índice a partir dos JSON.")
+    ap.add_argument("--destino", default=INDICE_PATH, help=f"Arquivo do índice (padrão: {INDICE_PATH}).")
+    ap.add_argument("--vizinhos", nargs=2, metavar=("CIDADE", "BAIRRO"), help="Lista os bairros vizinhos.")
+    args = ap.parse_args()
+    if args.compilar:
+        info = compilar(args.destino)
+        print(f"[OK] {info['cidades']} cidades | {info['bairros']} bairros | {info['enderecos']} endereços | "
+              f"{info['vizinhos']} pares de vizinhos -> {info['caminho']}")
+        for nome in info["vizinhos_ausentes"]:
+            print(f"[WARN] vizinhos.json: {nome} não existe nos metadados")
+    elif args.vizinhos:
+        lista = vizinhos_bairro(*args.vizinhos)
+        print(f"[INFO] índice {indice().assinatura()}")
+        if not lista:
+            print("[WARN] bairro sem vizinhos no índice")
+        for cidade, bairro in lista[1:]:
+            print(f"{cidade} / {bairro}")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
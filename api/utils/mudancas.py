@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+mudancas.py
+Canal de mudanças do ingest para os caches da API (tabela mudanca_imovel).
+
+O getdf.py grava, na mesma transação do upsert, um evento por segmento
+afetado (antes e depois da mudança, se o anúncio trocou de bairro/tipo):
+  versao (autoincremento), ID, uf, cidade, bairro, endereco, tipo,
+  tipo_negocio (normalizados) e criado_em
+Só gera evento a mudança de algum dos CAMPOS_COMPARAVEIS (uma nova coleta
+com o mesmo anúncio não gera). Cargas em massa (utils/carga_bulk.py) e a
+reconstrução do dedup (utils/dedup.py --reconstruir) gravam um evento
+global (colunas nulas): a API descarta tudo.
+
+A API (LAUDO_MUDANCAS=1) lê a tabela pela versão em uma thread (Assinante)
+e invalida só as entradas de cache e os índices k-NN cujo segmento pode ter
+consultado o anúncio (ver afeta); com LAUDO_AQUECER=1 recalcula os
+segmentos quentes afetados. Os agregados (rollup_m2) já são atualizados
+na transação do upsert.
+
+Versões de transações desfeitas ficam como lacunas (MySQL não reaproveita
+o autoincremento); o assinante espera PRAZO_LACUNA segundos por uma versão
+faltante antes de seguir adiante, para não perder eventos de transações
+que confirmaram fora de ordem.
+
+Dentro de api/:
+  python -m utils.mudancas --versao
+  python -m utils.mudancas --ultimas 20
+  python -m utils.mudancas --podar 7
+"""
+
+import time
+import threading
+import argparse
+from datetime import datetime, timedelta
+
+from utils.localidades import normalizar_nome, uf_da_cidade, vizinhos_bairro
+from utils.comparaveis import tokens_from_text
+from utils.storage import StorageBackend, get_backend
+
+# campos que mudam o resultado dos comparáveis (data_da_busca sozinha não conta);
+# grupo_duplicado vem do dedup.registrar da mesma transação (ver getdf.insert_or_update)
+CAMPOS_COMPARAVEIS = ("CIDADE", "BAIRRO", "endereco", "tipo", "tipo_negocio",
+                      "Metragem", "VALOR", "QUARTOS", "SUITES", "VAGAS", "grupo_duplicado")
+
+COLUNAS_SEGMENTO = ("uf", "cidade", "bairro", "endereco", "tipo", "tipo_negocio")
+
+INTERVALO_PADRAO = 2.0     # segundos entre leituras
+LIMITE_LEITURA = 1000      # eventos por leitura
+PRAZO_LACUNA = 60.0        # segundos esperando uma versão faltante
+MAX_SEGMENTOS_ALVO = 200   # acima disso num ciclo, invalida tudo de uma vez
+
+
+# =========================
+# Publicação (ingest)
+# =========================
+def segmento(row: dict) -> tuple:
+    """(uf, cidade, bairro, endereco, tipo, tipo_negocio) normalizados do anúncio."""
+    return (
+        uf_da_cidade(row.get("CIDADE")) or "ND",
+        normalizar_nome(row.get("CIDADE")),
+        normalizar_nome(row.get("BAIRRO")),
+        normalizar_nome(row.get("endereco")),
+        normalizar_nome(row.get("tipo")),
+        normalizar_nome(row.get("tipo_negocio")),
+    )
+
+
+def _agora() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def registrar(cur, backend: StorageBackend, antigo: dict | None, novo: dict) -> int:
+    """
+    Eventos da mudança de `antigo` para `novo` (mesma transação do upsert).
+    Retorna quantos foram gravados (0 se nenhum campo dos comparáveis mudou).
+    """
+    if antigo and all(str(antigo.get(c)) == str(novo.get(c)) for c in CAMPOS_COMPARAVEIS):
+        return 0
+    segmentos = [segmento(novo)]
+    if antigo and segmento(antigo) != segmentos[0]:
+        segmentos.append(segmento(antigo))
+    for seg in segmentos:
+        cur.execute(
+            "INSERT INTO mudanca_imovel (ID, uf, cidade, bairro, endereco, tipo, tipo_negocio, criado_em) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            (int(novo["ID"]), *seg, _agora()),
+        )
+    return len(segmentos)
+
+
+def registrar_carga(cur) -> None:
+    """Evento global (todas as colunas de segmento nulas): invalida todos os caches."""
+    cur.execute("INSERT INTO mudanca_imovel (ID, criado_em) VALUES (%s, %s)", (None, _agora()))
+
+
+# =========================
+# Leitura
+# =========================
+def ultima_versao(cur) -> int:
+    cur.execute("SELECT COALESCE(MAX(versao), 0) AS v FROM mudanca_imovel")
+    return int(cur.fetchone()["v"])
+
+
+def ler_desde(cur, versao: int, limite: int = LIMITE_LEITURA) -> list:
+    """Eventos com versao > `versao`, em ordem."""
+    cur.execute(
+        "SELECT versao, ID, uf, cidade, bairro, endereco, tipo, tipo_negocio, criado_em "
+        f"FROM mudanca_imovel WHERE versao > %s ORDER BY versao LIMIT {int(limite)}",
+        (versao,),
+    )
+    return cur.fetchall()
+
+
+def podar(backend: StorageBackend, dias: float) -> int:
+    """Remove eventos mais antigos que `dias` (os assinantes já leram)."""
+    corte = (datetime.now() - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+    with backend.transacao() as cur:
+        cur.execute("DELETE FROM mudanca_imovel WHERE criado_em < %s", (corte,))
+        return cur.rowcount
+
+
+# =========================
+# Quem é afetado
+# =========================
+def _contem(filtro: str | None, valor: str | None) -> bool:
+    # mesma semântica do LIKE %filtro% das consultas (filtro vazio = sem filtro)
+    f = normalizar_nome(filtro)
+    return not f or f in (valor or "")
+
+
+def _endereco_casa(filtro: str | None, valor: str | None) -> bool:
+    # apply_like_tokens: todos os tokens do endereço pedido contidos no endereço do anúncio
+    return all(normalizar_nome(t) in (valor or "") for t in tokens_from_text(filtro))
+
+
+def filtros_consultados(seg: dict) -> list:
+    """
+    Filtros de localização que o cálculo guardado em `seg` consultou, na ordem
+    de calcular_comparaveis (agregados -> k-NN -> cascata), até o nível que
+    respondeu. Um anúncio novo em qualquer um deles pode mudar o resultado
+    (inclusive fazendo um nível anterior passar a ter amostra suficiente).
+    """
+    nivel = seg.get("nivel")
+    filtros = []
+    if seg.get("usar_agregados"):
+        if seg.get("bairro") and seg.get("bairro") != "*":
+            filtros.append(("cidade", "bairro"))
+            if nivel == "agregado_bairro":
+                return filtros
+        filtros.append(("cidade",))
+        if nivel == "agregado_cidade":
+            return filtros
+    if seg.get("modo_comparaveis") == "knn" or nivel == "knn":
+        filtros.append(("cidade",))
+        if nivel == "knn":
+            return filtros
+    if seg.get("endereco"):
+        filtros.append(("endereco",))
+        if nivel == "endereco":
+            return filtros
+    filtros.append(("bairro",))
+    if nivel == "bairro":
+        return filtros
+    filtros.append(("vizinhos",))
+    if nivel == "bairros_vizinhos":
+        return filtros
+    filtros.append(("cidade",))
+    return filtros
+
+
+def _casa(campo: str, seg: dict, mudanca: dict) -> bool:
+    if campo == "endereco":
+        return _endereco_casa(seg.get("endereco"), mudanca["endereco"])
+    if campo == "vizinhos":
+        # pares (CIDADE, BAIRRO) do nível bairros_vizinhos (vazio = nível não consultado)
+        alvo = vizinhos_bairro(seg.get("cidade"), seg.get("bairro"))
+        return (mudanca["cidade"], mudanca["bairro"]) in alvo
+    return _contem(seg.get(campo), mudanca[campo])
+
+
+def afeta(seg: dict, mudanca: dict) -> bool:
+    """True se o evento `mudanca` pode alterar a entrada de cache do segmento `seg`."""
+    if mudanca.get("cidade") is None:
+        return True   # evento global (carga em massa)
+    if not (_contem(seg.get("tipo"), mudanca["tipo"]) and _contem(seg.get("tipo_negocio"), mudanca["tipo_negocio"])):
+        return False
+    return any(all(_casa(c, seg, mudanca) for c in campos) for campos in filtros_consultados(seg))
+
+
+# =========================
+# Assinante (API)
+# =========================
+class Assinante:
+    """
+    Thread que lê mudanca_imovel a cada `intervalo` segundos, a partir da
+    última versão existente quando iniciou, e chama ao_mudar(eventos) com os
+    eventos novos (segmentos repetidos no ciclo aparecem uma vez; acima de
+    MAX_SEGMENTOS_ALVO, ou com um evento global, vem uma lista com um só
+    evento global).
+    """
+
+    def __init__(self, ao_mudar, backend: StorageBackend | None = None,
+                 intervalo: float = INTERVALO_PADRAO, prazo_lacuna: float = PRAZO_LACUNA):
+        self.ao_mudar = ao_mudar
+        self.backend = backend
+        self.intervalo = intervalo
+        self.prazo_lacuna = prazo_lacuna
+        self.base = None          # todas as versões <= base já foram tratadas
+        self._vistas: set = set()
+        self._lacunas: dict = {}  # versão faltante -> primeira vez notada
+        self._parar = threading.Event()
+        self._thread = None
+        self.estat = {"ciclos": 0, "eventos": 0, "segmentos": 0, "globais": 0,
+                      "lacunas_ignoradas": 0, "falhas": 0, "ultimo_evento_em": None}
+
+    def _avancar_base(self, agora: float):
+        while True:
+            proxima = self.base + 1
+            if proxima in self._vistas:
+                self._vistas.discard(proxima)
+            elif not self._vistas:
+                break
+            else:
+                # versão faltante com outras já lidas depois dela: espera o prazo
+                desde = self._lacunas.setdefault(proxima, agora)
+                if agora - desde < self.prazo_lacuna:
+                    break
+                self.estat["lacunas_ignoradas"] += 1
+            self._lacunas.pop(proxima, None)
+            self.base = proxima
+
+    def verificar(self) -> int:
+        """Uma leitura; retorna quantos eventos novos foram entregues."""
+        backend = self.backend or get_backend()
+        with backend.cursor() as cur:
+            if self.base is None:
+                self.base = ultima_versao(cur)
+                return 0
+            linhas = [r for r in ler_desde(cur, self.base) if r["versao"] not in self._vistas]
+        self.estat["ciclos"] += 1
+        if not linhas:
+            self._avancar_base(time.time())
+            return 0
+
+        unicos = {}
+        for r in linhas:
+            self._vistas.add(r["versao"])
+            unicos.setdefault(tuple(r[c] for c in COLUNAS_SEGMENTO), r)
+        eventos = list(unicos.values())
+        if len(eventos) > MAX_SEGMENTOS_ALVO or any(e["cidade"] is None for e in eventos):
+            eventos = [dict.fromkeys(COLUNAS_SEGMENTO)]
+            self.estat["globais"] += 1
+        self.ao_mudar(eventos)
+
+        self.estat["eventos"] += len(linhas)
+        self.estat["segmentos"] += len(eventos)
+        self.estat["ultimo_evento_em"] = str(linhas[-1]["criado_em"])
+        self._avancar_base(time.time())
+        return len(linhas)
+
+    def _executar(self):
+        while not self._parar.is_set():
+            try:
+                # leitura cheia: ainda há eventos na fila, lê de novo sem esperar
+                cheia = self.verificar() >= LIMITE_LEITURA
+            except Exception as e:
+                self.estat["falhas"] += 1
+                print(f"[WARN] assinante de mudanças: {e}")
+                cheia = False
+            if not cheia:
+                self._parar.wait(self.intervalo)
+
+    def iniciar(self):
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._executar, name="mudancas", daemon=True)
+        self._thread.start()
+
+    def parar(self, timeout: float = 5.0):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def metricas(self) -> dict:
+        return dict(self.estat, ativo=bool(self._thread and self._thread.is_alive()),
+                    versao=self.base, pendentes=len(self._vistas), intervalo=self.intervalo)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Canal de mudanças de imoveis_df (tabela mudanca_imovel).")
+    ap.add_argument("--versao", action="store_true", help="Mostra a última versão publicada.")
+    ap.add_argument("--ultimas", type=int, metavar="N", help="Lista os N eventos mais recentes.")
+    ap.add_argument("--podar", type=float, metavar="DIAS", help="Remove eventos mais antigos que DIAS.")
+    args = ap.parse_args()
+
+    backend = get_backend()
+    if args.versao:
+        with backend.cursor() as cur:
+            print(f"[INFO] última versão: {ultima_versao(cur)}")
+    if args.ultimas:
+        with backend.cursor() as cur:
+            desde = max(0, ultima_versao(cur) - args.ultimas)
+            for r in ler_desde(cur, desde, args.ultimas):
+                seg = " / ".join(str(r[c]) for c in COLUNAS_SEGMENTO if r[c]) or "(global)"
+                print(f"{r['versao']:>10}  {r['criado_em']}  ID={r['ID']}  {seg}")
+    if args.podar is not None:
+        print(f"[OK] {podar(backend, args.podar)} evento(s) removido(s).")
+    if not (args.versao or args.ultimas or args.podar is not None):
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
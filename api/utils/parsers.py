@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+parsers.py
+Conversão dos campos texto do DF Imóveis (Metragem, VALOR, data_da_busca) para número.
+Usado pela API, pela camada de dados (colunas tipadas) e pelos scripts.
+"""
+
+import re
+from datetime import datetime
+
+
+def parse_metragem_str_to_float(m_str: str):
+    if m_str is None:
+        return None
+    s = str(m_str).strip().lower().replace("m²", "")
+    s = re.sub(r"[^\d,\.]", "", s)
+    if not s:
+        return None
+    if "," in s and "." in s:
+        s = s.replace(".", "").replace(",", ".")
+    elif "," in s:
+        s = s.replace(",", ".")
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def parse_valor_str_to_float(v_str: str):
+    if v_str is None:
+        return None
+    s = re.sub(r"[^\d]", "", str(v_str))
+    if not s:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def parse_data_busca_to_epoch(d_str):
+    """'YYYY-MM-DD HH:MM:SS' (formato gravado pelo getdf.py) -> epoch em segundos."""
+    if d_str is None:
+        return None
+    try:
+        return int(datetime.strptime(str(d_str)[:19], "%Y-%m-%d %H:%M:%S").timestamp())
+    except ValueError:
+        return None
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+perfil.py
+Perfil sob demanda de requisições da API e de execuções dos scrapers.
+
+API (só com LAUDO_ADMIN_TOKEN definido; sem ele nada é instalado e as rotas
+ficam exatamente como eram):
+  GET /api/laudo/estimativa?...&_profile=1[&_formato=html|speedscope|texto]
+  cabeçalho X-Admin-Token: <LAUDO_ADMIN_TOKEN>
+A resposta passa a ser o relatório do perfil daquela requisição (o cálculo
+roda sem cache e sem single-flight). O middleware marca a requisição numa
+ContextVar; as rotas decoradas com @perfilavel ligam o profiler na thread do
+threadpool onde a rota roda.
+
+Motor: pyinstrument (amostragem; pip install pyinstrument) com saída HTML
+(flame graph) ou speedscope JSON; sem ele, cProfile com relatório em texto.
+
+Scrapers (getdf.py / mapear_folder_dfimoveis.py --profile [PREFIXO]):
+  perfilar_execucao(prefixo) perfila a execução inteira e entrega um Etapas
+  para medir fetch/parse/write; grava <prefixo>.html (ou .prof, para
+  snakeviz/pstats) e <prefixo>_etapas.json. Sem --profile, os scripts usam
+  ETAPAS_DESLIGADAS, cujo medir() devolve um contexto vazio.
+"""
+
+import io
+import os
+import hmac
+import json
+import time
+import functools
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+ADMIN_TOKEN = os.getenv("LAUDO_ADMIN_TOKEN")
+ATIVO = bool(ADMIN_TOKEN)
+INTERVALO_AMOSTRAGEM = 0.001  # segundos (pyinstrument)
+LINHAS_TEXTO = 60             # funções no relatório do cProfile
+
+FORMATOS = {
+    "html": "text/html; charset=utf-8",
+    "speedscope": "application/json",
+    "texto": "text/plain; charset=utf-8",
+}
+
+_sessao: contextvars.ContextVar = contextvars.ContextVar("perfil_sessao", default=None)
+
+
+# =========================
+# Motor (pyinstrument ou cProfile)
+# =========================
+def _pyinstrument():
+    try:
+        from pyinstrument import Profiler
+        return Profiler
+    except ImportError:
+        return None
+
+
+class Perfilador:
+    """Liga/desliga o profiler na thread atual e rende o relatório no formato pedido."""
+
+    def __init__(self):
+        Profiler = _pyinstrument()
+        self.motor = "pyinstrument" if Profiler else "cProfile"
+        if Profiler:
+            self._p = Profiler(interval=INTERVALO_AMOSTRAGEM, async_mode="disabled")
+        else:
+            import cProfile
+            self._p = cProfile.Profile()
+
+    def iniciar(self):
+        if self.motor == "pyinstrument":
+            self._p.start()
+        else:
+            self._p.enable()
+
+    def parar(self):
+        if self.motor == "pyinstrument":
+            self._p.stop()
+        else:
+            self._p.disable()
+
+    def relatorio(self, formato: str) -> tuple:
+        """(conteúdo, formato efetivo). Sem pyinstrument, sempre texto."""
+        if self.motor == "pyinstrument":
+            if formato == "html":
+                return self._p.output_html(), "html"
+            if formato == "speedscope":
+                from pyinstrument.renderers import SpeedscopeRenderer
+                return self._p.output(SpeedscopeRenderer()), "speedscope"
+            return self._p.output_text(unicode=True), "texto"
+        import pstats
+        s = io.StringIO()
+        pstats.Stats(self._p, stream=s).sort_stats("cumulative").print_stats(LINHAS_TEXTO)
+        return s.getvalue(), "texto"
+
+    def salvar(self, prefixo: str) -> str:
+        if self.motor == "pyinstrument":
+            caminho = prefixo + ".html"
+            with open(caminho, "w", encoding="utf-8") as f:
+                f.write(self._p.output_html())
+        else:
+            caminho = prefixo + ".prof"
+            self._p.dump_stats(caminho)
+        return caminho
+
+
+# =========================
+# API
+# =========================
+class SessaoPerfil:
+    def __init__(self, formato: str):
+        self.formato = formato if formato in FORMATOS else "html"
+        self.conteudo = None
+        self.motor = None
+
+    def executar(self, fn, *args, **kwargs):
+        p = Perfilador()
+        p.iniciar()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            p.parar()
+            self.conteudo, self.formato = p.relatorio(self.formato)
+            self.motor = p.motor
+
+
+def em_perfil() -> bool:
+    """True dentro de uma requisição com ?_profile=1 autorizada."""
+    return ATIVO and _sessao.get() is not None
+
+
+def perfilavel(fn):
+    """Rota síncrona que pode ser perfilada com ?_profile=1 (sem LAUDO_ADMIN_TOKEN, devolve fn intacta)."""
+    if not ATIVO:
+        return fn
+
+    @functools.wraps(fn)
+    def rota(*args, **kwargs):
+        sessao = _sessao.get()
+        if sessao is None or sessao.conteudo is not None:
+            return fn(*args, **kwargs)
+        return sessao.executar(fn, *args, **kwargs)
+    return rota
+
+
+def instalar(app) -> bool:
+    """Registra o middleware de ?_profile=1 se LAUDO_ADMIN_TOKEN estiver definido."""
+    if not ATIVO:
+        return False
+    from fastapi.responses import JSONResponse, Response
+
+    @app.middleware("http")
+    async def perfil_requisicao(request, call_next):
+        if request.query_params.get("_profile") != "1":
+            return await call_next(request)
+        token = request.headers.get("x-admin-token", "")
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return JSONResponse({"detail": "Perfil restrito a administradores."}, status_code=403)
+
+        sessao = SessaoPerfil(request.query_params.get("_formato", "html"))
+        marca = _sessao.set(sessao)
+        t0 = time.perf_counter()
+        try:
+            resposta = await call_next(request)
+        finally:
+            _sessao.reset(marca)
+        if sessao.conteudo is None:
+            resposta.headers["X-Perfil"] = "rota sem suporte a perfil"
+            return resposta
+        async for _ in resposta.body_iterator:  # descarta o corpo normal
+            pass
+        return Response(sessao.conteudo, media_type=FORMATOS[sessao.formato], headers={
+            "X-Perfil-Motor": sessao.motor,
+            "X-Perfil-Status": str(resposta.status_code),
+            "X-Perfil-Tempo": f"{time.perf_counter() - t0:.3f}s",
+        })
+    return True
+
+
+# =========================
+# Scrapers
+# =========================
+class Etapas:
+    """Tempo acumulado por etapa (fetch/parse/write...): n, total, média e máximo."""
+
+    def __init__(self):
+        self._tempos: dict = {}
+
+    @contextmanager
+    def medir(self, nome: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, time.perf_counter() - t0)
+
+    def registrar(self, nome: str, dt: float):
+        t = self._tempos.setdefault(nome, [0, 0.0, 0.0])
+        t[0] += 1
+        t[1] += dt
+        t[2] = max(t[2], dt)
+
+    def resumo(self) -> dict:
+        return {nome: {"n": n, "total_s": round(total, 4), "media_ms": round(1000 * total / n, 3),
+                       "max_ms": round(1000 * maximo, 3)}
+                for nome, (n, total, maximo) in self._tempos.items()}
+
+
+class _EtapasDesligadas:
+    _nulo = nullcontext()
+
+    def medir(self, nome: str):
+        return self._nulo
+
+    def registrar(self, nome: str, dt: float):
+        pass
+
+    def resumo(self) -> dict:
+        return {}
+
+
+ETAPAS_DESLIGADAS = _EtapasDesligadas()
+
+
+@contextmanager
+def perfilar_execucao(prefixo: str):
+    """Perfila o bloco e grava <prefixo>.html|.prof e <prefixo>_etapas.json."""
+    pasta = os.path.dirname(os.path.abspath(prefixo))
+    os.makedirs(pasta, exist_ok=True)
+    etapas = Etapas()
+    p = Perfilador()
+    t0 = time.perf_counter()
+    p.iniciar()
+    try:
+        yield etapas
+    finally:
+        p.parar()
+        total = time.perf_counter() - t0
+        caminho = p.salvar(prefixo)
+        with open(prefixo + "_etapas.json", "w", encoding="utf-8") as f:
+            json.dump({"motor": p.motor, "total_s": round(total, 3), "etapas": etapas.resumo()},
+                      f, ensure_ascii=False, indent=2)
+        print(f"[INFO] perfil ({p.motor}): {caminho} | etapas: {prefixo}_etapas.json")
+        for nome, r in etapas.resumo().items():
+            print(f"[INFO]   {nome:<8} n={r['n']:<6} total={r['total_s']:.2f}s média={r['media_ms']:.1f}ms "
+                  f"máx={r['max_ms']:.1f}ms")
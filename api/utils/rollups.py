@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+rollups.py
+Agregados de R$/m² por segmento, mantidos incrementalmente pelo ingest (getdf.py).
+
+Segmento = (tipo_negocio, uf, cidade, bairro, tipo, quartos, suites, vagas, faixa_metragem)
+Cada linha da tabela rollup_m2 guarda:
+  - n, soma_m2        -> média exata
+  - sketch            -> histograma logarítmico de R$/m² (erro relativo ~1%),
+                         mergeável e com remoção (o ingest desfaz o valor antigo
+                         quando o anúncio muda de preço ou de segmento)
+  - media_aparada     -> média aparada (trim 10%) estimada pelo sketch
+
+Usado por:
+  GET /api/laudo/mercado/{uf}/{cidade}[/{bairro}]
+  /api/laudo/estimativa?usar_agregados=true (caminho rápido sem comparáveis)
+
+Reconstrução completa (dentro de api/):
+  python -m utils.rollups --reconstruir
+"""
+
+import json
+import math
+import argparse
+from datetime import datetime
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float
+from utils.localidades import normalizar_nome, uf_da_cidade
+from utils.storage import StorageBackend, get_backend
+
+TRIM_QUANTIL = 0.10
+PRECISAO_RELATIVA = 0.01
+
+# limites das faixas de metragem (m²)
+FAIXAS_METRAGEM = [0, 30, 45, 60, 75, 90, 120, 150, 200, 300, 500, 1000]
+
+CAMPOS_SEGMENTO = ["tipo_negocio", "uf", "cidade", "bairro", "tipo", "quartos", "suites", "vagas", "faixa_metragem"]
+
+
+# =========================
+# Sketch de quantis
+# =========================
+class SketchM2:
+    """
+    Histograma em escala logarítmica (mesma ideia do DDSketch): o valor x cai
+    no bucket ceil(log_gamma(x)). Quantis têm erro relativo <= PRECISAO_RELATIVA.
+    """
+    GAMMA = (1 + PRECISAO_RELATIVA) / (1 - PRECISAO_RELATIVA)
+    _LOG_GAMMA = math.log(GAMMA)
+
+    def __init__(self, buckets: dict | None = None):
+        self.buckets = {int(k): int(v) for k, v in (buckets or {}).items() if int(v) > 0}
+
+    @classmethod
+    def _indice(cls, x: float) -> int:
+        return int(math.ceil(math.log(x) / cls._LOG_GAMMA))
+
+    @classmethod
+    def _valor(cls, i: int) -> float:
+        return 2 * cls.GAMMA ** i / (cls.GAMMA + 1)
+
+    @property
+    def n(self) -> int:
+        return sum(self.buckets.values())
+
+    def adicionar(self, x: float, n: int = 1):
+        if x and x > 0:
+            i = self._indice(x)
+            self.buckets[i] = self.buckets.get(i, 0) + n
+            if self.buckets[i] <= 0:
+                del self.buckets[i]
+
+    def remover(self, x: float):
+        self.adicionar(x, -1)
+
+    def mesclar(self, outro: "SketchM2"):
+        for i, c in outro.buckets.items():
+            self.buckets[i] = self.buckets.get(i, 0) + c
+
+    def quantil(self, q: float) -> float | None:
+        total = self.n
+        if total <= 0:
+            return None
+        alvo = q * (total - 1)
+        acumulado = 0
+        for i in sorted(self.buckets):
+            acumulado += self.buckets[i]
+            if acumulado > alvo:
+                return self._valor(i)
+        return self._valor(max(self.buckets))
+
+    def media_aparada(self, trim: float = TRIM_QUANTIL) -> float | None:
+        total = self.n
+        if total <= 0:
+            return None
+        if total <= 10:
+            trim = 0.0  # mesma regra do media_m2_comparaveis
+        ini, fim = total * trim, total * (1 - trim)
+        soma = peso = 0.0
+        pos = 0
+        for i in sorted(self.buckets):
+            c = self.buckets[i]
+            dentro = max(0.0, min(pos + c, fim) - max(pos, ini))
+            if dentro > 0:
+                soma += dentro * self._valor(i)
+                peso += dentro
+            pos += c
+        return soma / peso if peso else None
+
+    def to_json(self) -> str:
+        return json.dumps(self.buckets, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, s: str | None) -> "SketchM2":
+        return cls(json.loads(s) if s else None)
+
+
+# =========================
+# Segmento
+# =========================
+def faixa_metragem(m: float | None) -> str:
+    if not m or m <= 0:
+        return "ND"
+    for a, b in zip(FAIXAS_METRAGEM, FAIXAS_METRAGEM[1:]):
+        if a <= m < b:
+            return f"{a}-{b}"
+    return f"{FAIXAS_METRAGEM[-1]}+"
+
+
+def segmento_do_imovel(row: dict) -> tuple | None:
+    """(segmento, R$/m²) do anúncio, ou None se não tiver metragem/valor válidos."""
+    if not row:
+        return None
+    m = parse_metragem_str_to_float(row.get("Metragem"))
+    v = parse_valor_str_to_float(row.get("VALOR"))
+    if not (m and m > 0 and v and v > 0):
+        return None
+    seg = {
+        "tipo_negocio": normalizar_nome(row.get("tipo_negocio")) or "ND",
+        "uf": uf_da_cidade(row.get("CIDADE")) or "ND",
+        "cidade": normalizar_nome(row.get("CIDADE")) or "ND",
+        "bairro": normalizar_nome(row.get("BAIRRO")) or "ND",
+        "tipo": normalizar_nome(row.get("tipo")) or "ND",
+        "quartos": row.get("QUARTOS") if row.get("QUARTOS") is not None else -1,
+        "suites": row.get("SUITES") if row.get("SUITES") is not None else -1,
+        "vagas": row.get("VAGAS") if row.get("VAGAS") is not None else -1,
+        "faixa_metragem": faixa_metragem(m),
+    }
+    return tuple(seg[c] for c in CAMPOS_SEGMENTO), v / m
+
+
+# =========================
+# Manutenção incremental
+# =========================
+def _aplicar(cur, backend: StorageBackend, segmento: tuple, pm2: float, sinal: int):
+    where = " AND ".join(f"{c} = %s" for c in CAMPOS_SEGMENTO)
+    cur.execute(f"SELECT n, soma_m2, sketch FROM rollup_m2 WHERE {where}{backend.sufixo_lock}", list(segmento))
+    atual = cur.fetchone()
+
+    sketch = SketchM2.from_json(atual["sketch"] if atual else None)
+    sketch.adicionar(pm2, sinal)
+    n = (atual["n"] if atual else 0) + sinal
+    soma = float(atual["soma_m2"] if atual else 0.0) + sinal * pm2
+    agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    if atual and n <= 0:
+        cur.execute(f"DELETE FROM rollup_m2 WHERE {where}", list(segmento))
+    elif atual:
+        cur.execute(
+            f"UPDATE rollup_m2 SET n = %s, soma_m2 = %s, sketch = %s, media_aparada = %s, atualizado_em = %s WHERE {where}",
+            [n, soma, sketch.to_json(), sketch.media_aparada(), agora] + list(segmento),
+        )
+    elif n > 0:
+        cols = ", ".join(CAMPOS_SEGMENTO)
+        marks = ", ".join(["%s"] * (len(CAMPOS_SEGMENTO) + 5))
+        cur.execute(
+            f"INSERT INTO rollup_m2 ({cols}, n, soma_m2, sketch, media_aparada, atualizado_em) VALUES ({marks})",
+            list(segmento) + [n, soma, sketch.to_json(), sketch.media_aparada(), agora],
+        )
+
+
+def atualizar(cur, backend: StorageBackend, antigo: dict | None, novo: dict | None):
+    """
+    Ajusta os agregados após o upsert de um anúncio: tira a contribuição da
+    versão anterior (se houver) e soma a nova. Mesma transação do upsert.
+    """
+    a = segmento_do_imovel(antigo)
+    b = segmento_do_imovel(novo)
+    if a == b:
+        return
+    if a:
+        _aplicar(cur, backend, a[0], a[1], -1)
+    if b:
+        _aplicar(cur, backend, b[0], b[1], +1)
+
+
+def reconstruir(backend: StorageBackend, lote: int = 5000) -> int:
+    """Recalcula rollup_m2 inteira a partir de imoveis_df. Retorna nº de segmentos."""
+    agregados: dict = {}
+    with backend.cursor() as cur:
+        cur.execute("SELECT CIDADE, BAIRRO, tipo, QUARTOS, SUITES, VAGAS, Metragem, VALOR, tipo_negocio FROM imoveis_df")
+        while True:
+            rows = cur.fetchmany(lote)
+            if not rows:
+                break
+            for r in rows:
+                sp = segmento_do_imovel(r)
+                if not sp:
+                    continue
+                seg, pm2 = sp
+                n, soma, sk = agregados.get(seg) or (0, 0.0, SketchM2())
+                sk.adicionar(pm2)
+                agregados[seg] = (n + 1, soma + pm2, sk)
+
+    agora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cols = ", ".join(CAMPOS_SEGMENTO)
+    marks = ", ".join(["%s"] * (len(CAMPOS_SEGMENTO) + 5))
+    with backend.transacao() as cur:
+        cur.execute("DELETE FROM rollup_m2")
+        cur.executemany(
+            f"INSERT INTO rollup_m2 ({cols}, n, soma_m2, sketch, media_aparada, atualizado_em) VALUES ({marks})",
+            [list(seg) + [n, soma, sk.to_json(), sk.media_aparada(), agora] for seg, (n, soma, sk) in agregados.items()],
+        )
+    return len(agregados)
+
+
+# =========================
+# Consulta
+# =========================
+def consultar(cur, filtros: dict, agrupar_por: list | None = None) -> dict:
+    """
+    Mescla os segmentos que batem com `filtros` (igualdade nos campos de
+    CAMPOS_SEGMENTO; valores None são ignorados). Com `agrupar_por`, devolve
+    um resumo por grupo; sem, a chave do grupo é ().
+    """
+    sql = "SELECT * FROM rollup_m2 WHERE 1=1"
+    params = []
+    for c in CAMPOS_SEGMENTO:
+        v = filtros.get(c)
+        if v is None:
+            continue
+        sql += f" AND {c} = %s"
+        params.append(normalizar_nome(v) if isinstance(v, str) else v)
+    cur.execute(sql, params)
+
+    grupos: dict = {}
+    for r in cur.fetchall():
+        chave = tuple(r[c] for c in (agrupar_por or []))
+        n, soma, sk = grupos.get(chave) or (0, 0.0, SketchM2())
+        sk.mesclar(SketchM2.from_json(r["sketch"]))
+        grupos[chave] = (n + int(r["n"]), soma + float(r["soma_m2"]), sk)
+    return {k: resumo(n, soma, sk) for k, (n, soma, sk) in grupos.items()}
+
+
+def resumo(n: int, soma: float, sk: SketchM2) -> dict:
+    def r2(x):
+        return round(x, 2) if x is not None else None
+    return {
+        "amostras": n,
+        "media_m2": r2(soma / n) if n else None,
+        "media_aparada_m2": r2(sk.media_aparada()),
+        "p10": r2(sk.quantil(0.10)),
+        "p25": r2(sk.quantil(0.25)),
+        "mediana": r2(sk.quantil(0.50)),
+        "p75": r2(sk.quantil(0.75)),
+        "p90": r2(sk.quantil(0.90)),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Agregados de R$/m² por segmento.")
+    ap.add_argument("--reconstruir", action="store_true", help="Recalcula rollup_m2 a partir de imoveis_df.")
+    args = ap.parse_args()
+    if args.reconstruir:
+        n = reconstruir(get_backend())
+        print(f"[OK] {n} segmento(s) gravado(s) em rollup_m2.")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
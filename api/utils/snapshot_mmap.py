@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+snapshot_mmap.py
+Snapshot binário de imoveis_df para ser mapeado (mmap, somente leitura) por
+todos os workers do uvicorn/gunicorn: as páginas do arquivo ficam uma única
+vez no page cache do SO, qualquer que seja o número de workers.
+
+Formato (little-endian):
+  cabeçalho   : MAGIC(8) versao(u32) n_colunas(u32) geracao(u64) n_linhas(u64) criado_em(u64)
+  diretório   : por coluna -> nome(24s) tipo(c) pad(7) dados_off(u64) dados_len(u64)
+                              dic_off(u64) dic_len(u64) dic_n(u64)
+  dados       : colunas de largura fixa, alinhadas em 8 bytes
+                  d = float64 | q = int64 | h = int16 (-1 = nulo) | i = código int32 de dicionário
+  dicionários : offsets u32 (dic_n + 1) + bytes UTF-8 concatenados
+  segmentos   : colunas seg_* com a KD-tree do k-NN pronta para cada trio
+                (tipo_negocio, tipo, CIDADE) observado, com as linhas que o
+                LIKE %valor% da cascata selecionaria (utils/knn.py):
+                  seg_chave  i  3 por segmento (códigos de CIDADE, tipo, tipo_negocio)
+                  seg_faixa  q  4 por segmento (raiz, n, início e nº em seg_bairro)
+                  seg_param  d  14 por segmento (5 x (média, desvio), 3 medianas, emb. neutro)
+                  seg_pos    i  linha do snapshot de cada ponto
+                  seg_pontos d  5 por ponto (atributos normalizados)
+                  seg_idx/seg_esq/seg_dir i, seg_eixo h: nós (índices absolutos, -1 = sem filho)
+                  seg_bairro i, seg_emb d: embedding de cada bairro do segmento
+
+Troca atômica: o gerador grava <arquivo>.tmp e faz os.replace(); a geração
+do novo arquivo é a anterior + 1. Leitores já abertos continuam com o mapa
+antigo até a próxima verificação (stat) e então remapeiam; o mapa antigo é
+fechado quando não há mais uso dele (consultas em andamento ou índices k-NN
+que apontam para ele).
+
+Uso (dentro de api/):
+  python -m utils.snapshot_mmap --gerar ../snapshots/imoveis.snap
+Na API: LAUDO_MMAP_PATH=<arquivo> faz o índice k-NN ler daqui em vez do banco
+(só o k-NN; a cascata de comparáveis continua consultando o banco). Por worker
+ficam só os dicionários decodificados e o embedding de bairro dos segmentos
+consultados; segmentos sem árvore pronta (filtro que não é valor exato de
+uma coluna) ainda copiam suas linhas para um índice em memória.
+"""
+
+import os
+import mmap
+import time
+import struct
+import argparse
+import threading
+from array import array
+from itertools import product
+from contextlib import contextmanager
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float, parse_data_busca_to_epoch
+from utils.localidades import normalizar_nome
+from utils.storage import StorageBackend, get_backend
+from utils.dedup import FILTRO_REPRESENTANTE
+
+MAGIC = b"IMOGOSN1"
+VERSAO = 2
+CABECALHO = struct.Struct("<8sIIQQQ")
+COLUNA = struct.Struct("<24sc7xQQQQQ")
+
+MMAP_PATH = os.getenv("LAUDO_MMAP_PATH")
+
+# (nome no snapshot, tipo, coluna de origem)
+COLUNAS = [
+    ("ID", "q", "ID"),
+    ("metragem", "d", "Metragem"),
+    ("valor", "d", "VALOR"),
+    ("quartos", "h", "QUARTOS"),
+    ("suites", "h", "SUITES"),
+    ("vagas", "h", "VAGAS"),
+    ("data_da_busca", "q", "data_da_busca"),
+    ("CIDADE", "i", "CIDADE"),
+    ("BAIRRO", "i", "BAIRRO"),
+    ("tipo", "i", "tipo"),
+    ("tipo_negocio", "i", "tipo_negocio"),
+]
+
+# KD-trees por segmento (nome, tipo); ver _segmentos
+COLUNAS_SEGMENTO = [
+    ("seg_chave", "i"), ("seg_faixa", "q"), ("seg_param", "d"), ("seg_pos", "i"), ("seg_pontos", "d"),
+    ("seg_idx", "i"), ("seg_esq", "i"), ("seg_dir", "i"), ("seg_eixo", "h"),
+    ("seg_bairro", "i"), ("seg_emb", "d"),
+]
+
+
+def _alinhar(n: int) -> int:
+    return (n + 7) & ~7
+
+
+# =========================
+# Gerador
+# =========================
+def gerar(backend: StorageBackend, caminho: str, lote: int = 20000) -> dict:
+    """Lê imoveis_df em lotes, grava o snapshot e troca o arquivo atomicamente."""
+    dados = {nome: array("i" if t == "i" else t) for nome, t, _ in COLUNAS}
+    dicionarios = {nome: {} for nome, t, _ in COLUNAS if t == "i"}
+
+    with backend.cursor() as cur:
+        cur.execute("SELECT ID, CIDADE, BAIRRO, tipo, Metragem, QUARTOS, SUITES, VAGAS, VALOR, "
+                    "tipo_negocio, data_da_busca FROM imoveis_df WHERE 1=1" + FILTRO_REPRESENTANTE)
+        while True:
+            rows = cur.fetchmany(lote)
+            if not rows:
+                break
+            for r in rows:
+                m = parse_metragem_str_to_float(r.get("Metragem"))
+                v = parse_valor_str_to_float(r.get("VALOR"))
+                if not (m and m > 0 and v and v > 0):
+                    continue
+                for nome, t, origem in COLUNAS:
+                    bruto = r.get(origem)
+                    if nome == "metragem":
+                        dados[nome].append(m)
+                    elif nome == "valor":
+                        dados[nome].append(v)
+                    elif nome == "data_da_busca":
+                        dados[nome].append(parse_data_busca_to_epoch(bruto) or 0)
+                    elif t == "i":
+                        dic = dicionarios[nome]
+                        texto = normalizar_nome(bruto)
+                        dados[nome].append(dic.setdefault(texto, len(dic)))
+                    elif t == "h":
+                        dados[nome].append(int(bruto) if bruto is not None else -1)
+                    else:
+                        dados[nome].append(int(bruto))
+
+    dados.update(_segmentos(dados, dicionarios))
+    geracao = (ler_geracao(caminho) or 0) + 1
+    n = len(dados["ID"])
+    tmp = caminho + ".tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+
+    # layout: cabeçalho + diretório, depois colunas e dicionários
+    pos = _alinhar(CABECALHO.size + COLUNA.size * (len(COLUNAS) + len(COLUNAS_SEGMENTO)))
+    blocos, diretorio = [], []
+    for nome, t in [c[:2] for c in COLUNAS] + COLUNAS_SEGMENTO:
+        bruto = dados[nome].tobytes()
+        dados_off, pos = pos, _alinhar(pos + len(bruto))
+        blocos.append((dados_off, bruto))
+        dic_off = dic_len = dic_n = 0
+        if nome in dicionarios:
+            textos = sorted(dicionarios[nome], key=dicionarios[nome].get)
+            codificados = [x.encode("utf-8") for x in textos]
+            offs = array("I", [0])
+            for b in codificados:
+                offs.append(offs[-1] + len(b))
+            corpo = offs.tobytes() + b"".join(codificados)
+            dic_off, dic_len, dic_n = pos, len(corpo), len(textos)
+            pos = _alinhar(pos + len(corpo))
+            blocos.append((dic_off, corpo))
+        diretorio.append(COLUNA.pack(nome.encode(), t.encode(), dados_off, len(bruto), dic_off, dic_len, dic_n))
+
+    with open(tmp, "wb") as f:
+        f.write(CABECALHO.pack(MAGIC, VERSAO, len(diretorio), geracao, n, int(time.time())))
+        f.write(b"".join(diretorio))
+        for off, bruto in blocos:
+            f.seek(off)
+            f.write(bruto)
+        f.truncate(pos)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, caminho)
+    return {"caminho": caminho, "geracao": geracao, "linhas": n, "bytes": pos}
+
+
+def _contidos(dicionario: dict) -> dict:
+    """código -> códigos cujo texto está contido no seu (quem o LIKE %texto% alcançaria)."""
+    textos = sorted(dicionario, key=dicionario.get)
+    return {c: [k for k, t in enumerate(textos) if t in texto] for c, texto in enumerate(textos)}
+
+
+def _segmentos(dados: dict, dicionarios: dict) -> dict:
+    """
+    Colunas seg_*: uma KD-tree por trio (CIDADE, tipo, tipo_negocio) observado,
+    sobre as linhas que segmento() selecionaria para esses textos.
+    """
+    # import tardio: utils.knn importa este módulo
+    from utils.knn import KDTree, preparar_segmento
+
+    cols = ("CIDADE", "tipo", "tipo_negocio")
+    codigos = [dados[c] for c in cols]
+    trios = set(zip(*codigos))
+    contidos = [_contidos(dicionarios[c]) for c in cols]
+    linhas_por_trio: dict = {}
+    for i, cod in enumerate(zip(*codigos)):
+        for chave in product(*(cont[c] for cont, c in zip(contidos, cod))):
+            if chave in trios:
+                linhas_por_trio.setdefault(chave, []).append(i)
+
+    saida = {nome: array(t) for nome, t in COLUNAS_SEGMENTO}
+    nulo = lambda x: None if x < 0 else x
+    for chave in sorted(linhas_por_trio):
+        sel = linhas_por_trio[chave]
+        seg = preparar_segmento(
+            [dados["metragem"][i] for i in sel], [dados["valor"][i] for i in sel],
+            *[[nulo(dados[c][i]) for i in sel] for c in ("quartos", "suites", "vagas")],
+            [dados["BAIRRO"][i] for i in sel],
+        )
+        arvore = KDTree.construir(seg["pontos"])
+        base = len(saida["seg_pos"])
+        saida["seg_chave"].extend(chave)
+        saida["seg_faixa"].extend((base + arvore.raiz, len(sel), len(saida["seg_bairro"]), len(seg["bairro_emb"])))
+        saida["seg_param"].extend([x for par in seg["escalas"] for x in par] + seg["medianas"] + [seg["emb_neutro"]])
+        saida["seg_pos"].extend(sel)
+        saida["seg_pontos"].extend(arvore.pontos)
+        saida["seg_idx"].extend(base + x for x in arvore.idx)
+        saida["seg_esq"].extend(base + x if x >= 0 else -1 for x in arvore.esq)
+        saida["seg_dir"].extend(base + x if x >= 0 else -1 for x in arvore.dir)
+        saida["seg_eixo"].extend(arvore.eixo)
+        saida["seg_bairro"].extend(seg["bairro_emb"])
+        saida["seg_emb"].extend(seg["bairro_emb"].values())
+    return saida
+
+
+def ler_geracao(caminho: str) -> int | None:
+    try:
+        with open(caminho, "rb") as f:
+            magic, _, _, geracao, _, _ = CABECALHO.unpack(f.read(CABECALHO.size))
+        return geracao if magic == MAGIC else None
+    except (OSError, struct.error):
+        return None
+
+
+# =========================
+# Leitor
+# =========================
+class SnapshotMmap:
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        with open(caminho, "rb") as f:
+            self._stat = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, versao, n_col, self.geracao, self.n, self.criado_em = CABECALHO.unpack_from(self._mm, 0)
+        if magic != MAGIC or versao != VERSAO:
+            raise ValueError(f"Snapshot inválido: {caminho}")
+
+        # usos: consultas em andamento (em_uso) + índices k-NN mapeados vivos
+        self._usos, self._superado, self.fechado = 0, False, False
+        self._lock_usos = threading.RLock()
+        self._buf = memoryview(self._mm)
+        self.colunas, self._dic_bruto, self._dic, self._codigos, self._segs = {}, {}, {}, {}, None
+        for j in range(n_col):
+            nome, t, d_off, d_len, c_off, c_len, c_n = COLUNA.unpack_from(self._mm, CABECALHO.size + j * COLUNA.size)
+            nome, t = nome.rstrip(b"\0").decode(), t.decode()
+            # memoryview tipada direto sobre o mapa: nenhuma cópia por worker
+            self.colunas[nome] = self._buf[d_off:d_off + d_len].cast(t)
+            if c_off:
+                self._dic_bruto[nome] = (c_off, c_n)
+
+    def dicionario(self, coluna: str) -> list:
+        """Strings do dicionário da coluna (decodificadas sob demanda)."""
+        if coluna not in self._dic:
+            off, n = self._dic_bruto[coluna]
+            base = off + 4 * (n + 1)
+            with self._buf[off:base].cast("I") as offs:
+                self._dic[coluna] = [self._mm[base + offs[i]:base + offs[i + 1]].decode("utf-8") for i in range(n)]
+        return self._dic[coluna]
+
+    def codigo(self, coluna: str, texto: str | None) -> int | None:
+        """Código do valor exato (normalizado) na coluna; None se não existir."""
+        if coluna not in self._codigos:
+            self._codigos[coluna] = {v: i for i, v in enumerate(self.dicionario(coluna))}
+        return self._codigos[coluna].get(normalizar_nome(texto))
+
+    def codigos_like(self, coluna: str, texto: str | None) -> set | None:
+        """Códigos cujo valor contém `texto` (equivalente ao LIKE %texto%); None = sem filtro."""
+        if not texto:
+            return None
+        alvo = normalizar_nome(texto)
+        return {i for i, v in enumerate(self.dicionario(coluna)) if alvo in v}
+
+    def segmento(self, cidade=None, tipo=None, tipo_negocio=None) -> list:
+        """
+        Posições das linhas do segmento (mesmos filtros LIKE da cascata),
+        comparando códigos direto nas colunas tipadas, sem montar linhas.
+        """
+        sel = None
+        for coluna, texto in (("CIDADE", cidade), ("tipo", tipo), ("tipo_negocio", tipo_negocio)):
+            cods = self.codigos_like(coluna, texto)
+            if cods is None:
+                continue
+            arr = self.colunas[coluna]
+            if sel is None:
+                sel = [i for i, c in enumerate(arr) if c in cods]
+            else:
+                sel = [i for i in sel if arr[i] in cods]
+        return list(range(self.n)) if sel is None else sel
+
+    def segmento_indexado(self, cidade=None, tipo=None, tipo_negocio=None) -> dict | None:
+        """
+        KD-tree pré-calculada pelo gerador para os textos dados (mesmo segmento
+        de segmento()), ou None se algum texto não for valor exato da coluna.
+        raiz e bairro_emb ([(código do bairro, embedding)]) referem-se às colunas seg_*.
+        """
+        if "seg_chave" not in self.colunas:
+            return None
+        if self._segs is None:
+            ch = self.colunas["seg_chave"]
+            self._segs = {(ch[3 * s], ch[3 * s + 1], ch[3 * s + 2]): s for s in range(len(ch) // 3)}
+        chave = (self.codigo("CIDADE", cidade), self.codigo("tipo", tipo), self.codigo("tipo_negocio", tipo_negocio))
+        s = self._segs.get(chave)
+        if s is None:
+            return None
+        raiz, _, b0, nb = self.colunas["seg_faixa"][4 * s:4 * s + 4].tolist()
+        par = self.colunas["seg_param"][14 * s:14 * s + 14].tolist()
+        bairros, embs = self.colunas["seg_bairro"], self.colunas["seg_emb"]
+        return {
+            "raiz": raiz,
+            "escalas": list(zip(par[0:10:2], par[1:10:2])),
+            "medianas": par[10:13],
+            "emb_neutro": par[13],
+            "bairro_emb": [(bairros[i], embs[i]) for i in range(b0, b0 + nb)],
+        }
+
+    # ----- ciclo de vida do mapa -----
+    def adquirir(self):
+        with self._lock_usos:
+            if self.fechado:
+                raise RuntimeError(f"Snapshot já fechado: {self.caminho}")
+            self._usos += 1
+
+    def liberar(self):
+        with self._lock_usos:
+            self._usos -= 1
+            self._fechar_se_livre()
+
+    def superar(self):
+        """Marca o snapshot como substituído; fecha assim que não houver uso."""
+        with self._lock_usos:
+            self._superado = True
+            self._fechar_se_livre()
+
+    def _fechar_se_livre(self):
+        if self._superado and self._usos == 0 and not self.fechado:
+            for v in self.colunas.values():
+                v.release()
+            self._buf.release()
+            self._mm.close()
+            self.fechado = True
+
+    def mudou(self) -> bool:
+        """True se o arquivo no caminho foi trocado desde a abertura."""
+        try:
+            st = os.stat(self.caminho)
+        except OSError:
+            return False
+        return (st.st_ino, st.st_mtime_ns) != (self._stat.st_ino, self._stat.st_mtime_ns)
+
+
+_atual: SnapshotMmap | None = None
+_lock = threading.Lock()
+
+
+def _vigente() -> SnapshotMmap | None:
+    """Chamar com _lock; remapeia quando o arquivo é trocado e solta o mapa anterior."""
+    global _atual
+    if not MMAP_PATH or not os.path.exists(MMAP_PATH):
+        return None
+    if _atual is None or _atual.mudou():
+        anterior, _atual = _atual, SnapshotMmap(MMAP_PATH)
+        if anterior is not None:
+            anterior.superar()
+    return _atual
+
+
+def snapshot_atual() -> SnapshotMmap | None:
+    """
+    Snapshot do processo (LAUDO_MMAP_PATH); remapeia quando o arquivo é trocado.
+    Sem reserva de uso: para ler colunas, use em_uso().
+    """
+    with _lock:
+        return _vigente()
+
+
+@contextmanager
+def em_uso():
+    """Snapshot vigente (ou None), que não é fechado antes do fim do bloco."""
+    with _lock:
+        snap = _vigente()
+        if snap is not None:
+            snap.adquirir()
+    try:
+        yield snap
+    finally:
+        if snap is not None:
+            snap.liberar()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Snapshot mmap de imoveis_df.")
+    ap.add_argument("--gerar", metavar="ARQUIVO", help="Gera (e troca atomicamente) o snapshot.")
+    args = ap.parse_args()
+    if args.gerar:
+        info = gerar(get_backend(), args.gerar)
+        print(f"[OK] geração {info['geracao']}: {info['linhas']} linhas, {info['bytes']} bytes -> {info['caminho']}")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+snapshot_parquet.py
+Exporta imoveis_df para Parquet (colunar, tipado, zstd), particionado por
+uf / CIDADE / tipo_negocio, com Metragem/VALOR já normalizados em número.
+
+Layout do diretório de saída:
+  <destino>/ATUAL                 -> nome do snapshot vigente
+  <destino>/snap-AAAAMMDDTHHMMSS/ -> dataset hive (uf=DF/CIDADE=GUARA/tipo_negocio=Venda/*.parquet)
+  <destino>/snap-.../_estado.json -> marca d'água (maior data_da_busca exportada)
+
+Modo incremental (padrão): acrescenta ao snapshot vigente só as linhas com
+data_da_busca posterior à marca d'água. Um imóvel re-coletado aparece em mais
+de um arquivo; na carga vale a linha com data_da_busca mais recente.
+grupo_duplicado (utils/dedup.py) vai junto; como o incremental não reexporta
+anúncios que só mudaram de grupo, depois de um dedup --reconstruir gerar o
+snapshot com --completo (snapshots anteriores à coluna também).
+
+Uso (dentro de api/):
+  python -m utils.snapshot_parquet --destino ../snapshots            # incremental
+  python -m utils.snapshot_parquet --destino ../snapshots --completo # novo snapshot
+
+Na API: LAUDO_SNAPSHOT_DIR=<destino> carrega o snapshot vigente (memory-map)
+em um SQLite em memória no startup, sem consultar o MySQL.
+
+pip install pyarrow
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float
+from utils.localidades import uf_da_cidade
+from utils.storage import StorageBackend, SQLiteBackend, get_backend
+
+LOTE = 50_000
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+PARTICOES = ["uf", "CIDADE", "tipo_negocio"]
+
+
+def _schema():
+    import pyarrow as pa
+    return pa.schema([
+        ("ID", pa.int64()),
+        ("uf", pa.string()),
+        ("CIDADE", pa.string()),
+        ("BAIRRO", pa.string()),
+        ("endereco", pa.string()),
+        ("tipo", pa.string()),
+        ("Titulo", pa.string()),
+        ("Metragem", pa.string()),
+        ("QUARTOS", pa.int16()),
+        ("SUITES", pa.int16()),
+        ("VAGAS", pa.int16()),
+        ("VALOR", pa.string()),
+        ("tipo_negocio", pa.string()),
+        ("valor_m2", pa.string()),
+        ("data_da_busca", pa.timestamp("s")),
+        ("metragem_num", pa.float64()),
+        ("valor_num", pa.float64()),
+        ("grupo_duplicado", pa.int64()),
+    ])
+
+
+def _parse_data(s):
+    if not s:
+        return None
+    try:
+        return datetime.strptime(str(s)[:19], FORMATO_DATA)
+    except ValueError:
+        return None
+
+
+def _linha_tipada(r: dict) -> dict:
+    return {
+        "ID": int(r["ID"]),
+        "uf": uf_da_cidade(r.get("CIDADE")) or "ND",
+        "CIDADE": r.get("CIDADE") or "N/D",
+        "BAIRRO": r.get("BAIRRO"),
+        "endereco": r.get("endereco"),
+        "tipo": r.get("tipo"),
+        "Titulo": r.get("Titulo"),
+        "Metragem": r.get("Metragem"),
+        "QUARTOS": r.get("QUARTOS"),
+        "SUITES": r.get("SUITES"),
+        "VAGAS": r.get("VAGAS"),
+        "VALOR": r.get("VALOR"),
+        "tipo_negocio": r.get("tipo_negocio") or "N/D",
+        "valor_m2": r.get("valor_m2"),
+        "data_da_busca": _parse_data(r.get("data_da_busca")),
+        "metragem_num": parse_metragem_str_to_float(r.get("Metragem")),
+        "valor_num": parse_valor_str_to_float(r.get("VALOR")),
+        "grupo_duplicado": r.get("grupo_duplicado"),
+    }
+
+
+# =========================
+# Estado / ponteiro
+# =========================
+def snapshot_atual(destino: str) -> str | None:
+    ponteiro = os.path.join(destino, "ATUAL")
+    if not os.path.exists(ponteiro):
+        return None
+    with open(ponteiro, encoding="utf-8") as f:
+        nome = f.read().strip()
+    return os.path.join(destino, nome) if nome else None
+
+
+def _ler_estado(snap_dir: str) -> dict:
+    path = os.path.join(snap_dir, "_estado.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _gravar_json_atomico(path: str, dados):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# =========================
+# Exportação
+# =========================
+def exportar(backend: StorageBackend, destino: str, completo: bool = False) -> dict:
+    """Exporta (total ou incremental) e devolve o estado gravado."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    os.makedirs(destino, exist_ok=True)
+    snap_dir = None if completo else snapshot_atual(destino)
+    if not snap_dir:
+        nome = "snap-" + datetime.now().strftime("%Y%m%dT%H%M%S")
+        snap_dir = os.path.join(destino, nome)
+        os.makedirs(snap_dir, exist_ok=True)
+    estado = _ler_estado(snap_dir)
+    marca = estado.get("ultima_data_da_busca")
+
+    sql = "SELECT * FROM imoveis_df"
+    params = []
+    if marca:
+        sql += " WHERE data_da_busca > %s"
+        params.append(marca)
+    sql += " ORDER BY data_da_busca ASC"
+
+    schema = _schema()
+    lote_n = estado.get("lotes", 0)
+    linhas_total = 0
+    with backend.cursor() as cur:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(LOTE)
+            if not rows:
+                break
+            dados = [_linha_tipada(r) for r in rows]
+            tabela = pa.Table.from_pylist(dados, schema=schema)
+            ds.write_dataset(
+                tabela, snap_dir, format="parquet",
+                partitioning=ds.partitioning(
+                    pa.schema([schema.field(c) for c in PARTICOES]), flavor="hive"),
+                basename_template=f"lote-{lote_n:06d}-{{i}}.parquet",
+                existing_data_behavior="overwrite_or_ignore",
+                file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+            )
+            lote_n += 1
+            linhas_total += len(rows)
+            marca = max((r.get("data_da_busca") or "") for r in rows) or marca
+
+    estado = {
+        "ultima_data_da_busca": marca,
+        "lotes": lote_n,
+        "linhas": estado.get("linhas", 0) + linhas_total,
+        "atualizado_em": datetime.now().strftime(FORMATO_DATA),
+    }
+    _gravar_json_atomico(os.path.join(snap_dir, "_estado.json"), estado)
+    tmp = os.path.join(destino, "ATUAL.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(snap_dir))
+    os.replace(tmp, os.path.join(destino, "ATUAL"))
+    estado["snapshot"] = snap_dir
+    estado["exportadas_agora"] = linhas_total
+    return estado
+
+
+# =========================
+# Carga (API)
+# =========================
+def ler_snapshot(snap_dir: str, colunas: list | None = None):
+    """Lê o dataset via memory-map; devolve pyarrow.Table."""
+    import pyarrow.parquet as pq
+    return pq.read_table(snap_dir, columns=colunas, memory_map=True, partitioning="hive")
+
+
+def carregar_em_sqlite(destino: str, nome_memoria: str = "laudo_snapshot") -> SQLiteBackend | None:
+    """
+    Carrega o snapshot vigente num SQLite em memória compartilhada
+    (mesmas colunas tipadas do backend embutido). None se não houver snapshot.
+    """
+    snap_dir = snapshot_atual(destino)
+    if not snap_dir:
+        return None
+    tabela = ler_snapshot(snap_dir).sort_by([("data_da_busca", "ascending")])
+
+    backend = SQLiteBackend.em_memoria(nome_memoria)
+    grupos: dict = {}   # ID -> grupo_duplicado da linha mais recente
+    with backend.transacao() as cur:
+        for lote in tabela.to_batches(max_chunksize=LOTE):
+            for r in lote.to_pylist():
+                dt = r.get("data_da_busca")
+                r["data_da_busca"] = dt.strftime(FORMATO_DATA) if dt else None
+                r["CIDADE"] = str(r["CIDADE"])
+                r["tipo_negocio"] = str(r["tipo_negocio"])
+                backend.upsert_imovel(cur, r)
+                grupos[r["ID"]] = r.get("grupo_duplicado")
+        # upsert_imovel não grava grupo_duplicado: sem ele FILTRO_REPRESENTANTE não colapsaria nada
+        cur.executemany("UPDATE imoveis_df SET grupo_duplicado = %s WHERE ID = %s",
+                        [(g, id_) for id_, g in grupos.items() if g is not None])
+    return backend
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Snapshot Parquet de imoveis_df.")
+    ap.add_argument("--destino", required=True, help="Diretório dos snapshots.")
+    ap.add_argument("--completo", action="store_true", help="Gera um snapshot novo (não incremental).")
+    args = ap.parse_args()
+
+    estado = exportar(get_backend(), args.destino, completo=args.completo)
+    print(f"[OK] {estado['exportadas_agora']} linha(s) exportada(s) -> {estado['snapshot']}")
+    print(f"     marca d'água: {estado['ultima_data_da_busca']} | total no snapshot: {estado['linhas']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,684 @@
+# -*- coding: utf-8 -*-
+"""
+storage.py
+Camada única de acesso a dados (API, consultas_imoveis.py e getdf.py).
+
+Backends:
+  - MySQLBackend  -> servidor MySQL (produção), colunas texto como no schema_dfdb.sql
+                     + colunas geradas metragem_num/valor_num (migracoes.sql)
+  - SQLiteBackend -> arquivo local embutido, com colunas numéricas tipadas
+                     (metragem_num, valor_num) e índices próprios p/ comparáveis
+
+Escolha do backend por variável de ambiente:
+  LAUDO_DB_BACKEND = mysql (padrão) | sqlite
+  LAUDO_SQLITE_PATH = caminho do arquivo .sqlite (padrão: ./laudo.sqlite)
+  LAUDO_MYSQL_HOST / _PORT / _USER / _PASSWORD / _DATABASE
+  LAUDO_MYSQL_POOL = conexões do pool aberto pela API na inicialização (padrão: 10; 0 = sem pool)
+
+As consultas são escritas no estilo do MySQL (placeholder %s). O cursor do
+SQLite converte os placeholders, e as expressões numéricas de Metragem/VALOR
+ficam em `backend.expr_metragem` / `backend.expr_valor`.
+
+Uso (gera a base local a partir do MySQL), a partir da pasta api/:
+  python -m utils.storage --exportar-sqlite laudo.sqlite
+"""
+
+import os
+import re
+import sqlite3
+import argparse
+import time
+from contextlib import contextmanager
+
+from utils.parsers import parse_metragem_str_to_float, parse_valor_str_to_float
+
+# =========================
+# Config
+# =========================
+MYSQL_CONFIG = {
+    "user": os.getenv("LAUDO_MYSQL_USER", ""),
+    "password": os.getenv("LAUDO_MYSQL_PASSWORD", ""),
+    "host": os.getenv("LAUDO_MYSQL_HOST", ""),
+    "database": os.getenv("LAUDO_MYSQL_DATABASE", "quadr767_laudo-db"),
+    "port": int(os.getenv("LAUDO_MYSQL_PORT", "3306")),
+}
+
+MYSQL_POOL = int(os.getenv("LAUDO_MYSQL_POOL", "10"))
+MYSQL_POOL_MAX = 32  # limite do mysql.connector.pooling
+
+SQLITE_PATH = os.getenv("LAUDO_SQLITE_PATH", "laudo.sqlite")
+# instruções da VM do SQLite entre duas verificações do tempo máximo de consulta
+PASSOS_PROGRESSO = 10000
+
+COLUNAS_IMOVEL = [
+    "ID", "CIDADE", "BAIRRO", "endereco", "tipo", "Titulo", "Metragem",
+    "QUARTOS", "SUITES", "VAGAS", "VALOR", "tipo_negocio", "valor_m2", "data_da_busca",
+]
+
+
+# =========================
+# Interface
+# =========================
+class StorageBackend:
+    """
+    Interface comum. Subclasses implementam `conectar()` e `upsert_imovel()`.
+    Conexões são abertas por operação (mesmo padrão da API original); no
+    MySQL, com abrir_pool(), vêm de um pool aberto na inicialização da API.
+    """
+    nome = "base"
+    # expressões SQL que devolvem Metragem/VALOR numéricos
+    # colunas geradas (STORED) a partir de Metragem/VALOR, indexadas (idx_valor_id)
+    expr_metragem = "metragem_num"
+    expr_valor = "valor_num"
+    # trava de linha em leitura-para-escrita (SELECT ... FOR UPDATE)
+    sufixo_lock = " FOR UPDATE"
+    # INSERT que ignora linhas com chave UNIQUE repetida
+    prefixo_insert_ignore = "INSERT IGNORE"
+
+    def conectar(self):
+        raise NotImplementedError
+
+    def novo_cursor(self, conn):
+        raise NotImplementedError
+
+    @contextmanager
+    def cursor(self):
+        """Cursor de leitura com linhas em dict."""
+        conn = self.conectar()
+        cur = self.novo_cursor(conn)
+        try:
+            yield cur
+        finally:
+            cur.close()
+            conn.close()
+
+    @contextmanager
+    def transacao(self):
+        """Cursor de escrita: commit ao final, rollback em erro."""
+        conn = self.conectar()
+        cur = self.novo_cursor(conn)
+        try:
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+    def upsert_imovel(self, cur, row: dict):
+        raise NotImplementedError
+
+    def abrir_pool(self, tamanho: int) -> int:
+        """Abre de antemão `tamanho` conexões reaproveitadas por conectar(). Retorna quantas (0 = sem pool)."""
+        return 0
+
+    # ---- tempo máximo por consulta (utils/admissao.py / cascata de comparáveis) ----
+    def limitar_tempo_consulta(self, cur, ms: int):
+        """Consultas seguintes deste cursor são interrompidas depois de `ms` milissegundos (0 = sem limite)."""
+
+    def tempo_esgotado(self, erro: Exception) -> bool:
+        """True se `erro` é a interrupção de limitar_tempo_consulta."""
+        return False
+
+    @contextmanager
+    def tempo_maximo(self, cur, ms: int | None):
+        """Limita as consultas do bloco a `ms` milissegundos (None/0 = sem limite)."""
+        if not ms:
+            yield
+            return
+        self.limitar_tempo_consulta(cur, ms)
+        try:
+            yield
+        finally:
+            self.limitar_tempo_consulta(cur, 0)
+
+    # ---- carga em massa (utils/carga_bulk.py) ----
+    def conectar_carga(self):
+        """Conexão para carga em massa (por padrão, a mesma de conectar())."""
+        return self.conectar()
+
+    def listar_indices_secundarios(self, conn, tabela: str) -> list:
+        """[(nome, sql_para_recriar)] dos índices que não são PK nem UNIQUE."""
+        raise NotImplementedError
+
+    def remover_indice(self, conn, tabela: str, nome: str):
+        raise NotImplementedError
+
+    def recriar_indices(self, conn, tabela: str, indices: list):
+        raise NotImplementedError
+
+    def esvaziar(self, conn, tabela: str):
+        raise NotImplementedError
+
+    def carregar_tsv(self, conn, tabela: str, colunas: list, arquivo: str) -> int:
+        """Carrega um arquivo TSV (formato padrão do LOAD DATA: \\N = NULL). Retorna nº de linhas."""
+        raise NotImplementedError
+
+    def pos_carga(self, conn, tabela: str):
+        """Ajustes depois de carregar a tabela (ex.: colunas derivadas)."""
+
+
+# =========================
+# MySQL
+# =========================
+SQL_UPSERT_MYSQL = """
+    INSERT INTO imoveis_df
+      (ID, CIDADE, BAIRRO, endereco, tipo, Titulo, Metragem, QUARTOS, SUITES, VAGAS, VALOR, tipo_negocio, valor_m2, data_da_busca)
+    VALUES
+      (%(ID)s, %(CIDADE)s, %(BAIRRO)s, %(endereco)s, %(tipo)s, %(Titulo)s, %(Metragem)s, %(QUARTOS)s, %(SUITES)s, %(VAGAS)s, %(VALOR)s, %(tipo_negocio)s, %(valor_m2)s, %(data_da_busca)s)
+    ON DUPLICATE KEY UPDATE
+      CIDADE=VALUES(CIDADE),
+      BAIRRO=VALUES(BAIRRO),
+      endereco=VALUES(endereco),
+      tipo=VALUES(tipo),
+      Titulo=VALUES(Titulo),
+      Metragem=VALUES(Metragem),
+      QUARTOS=VALUES(QUARTOS),
+      SUITES=VALUES(SUITES),
+      VAGAS=VALUES(VAGAS),
+      VALOR=VALUES(VALOR),
+      tipo_negocio=VALUES(tipo_negocio),
+      valor_m2=VALUES(valor_m2),
+      data_da_busca=VALUES(data_da_busca)
+"""
+
+
+class MySQLBackend(StorageBackend):
+    nome = "mysql"
+
+    def __init__(self, config: dict | None = None):
+        self.config = dict(config or MYSQL_CONFIG)
+        self._pool = None
+
+    def abrir_pool(self, tamanho: int) -> int:
+        # import tardio: scripts que não usam MySQL não carregam o conector
+        from mysql.connector import pooling
+        tamanho = min(max(0, tamanho), MYSQL_POOL_MAX)
+        if tamanho and self._pool is None:
+            # pool_reset_session: a conexão devolvida volta sem as variáveis de sessão
+            # (ex.: MAX_EXECUTION_TIME de limitar_tempo_consulta)
+            self._pool = pooling.MySQLConnectionPool(pool_name=f"laudo_{id(self)}", pool_size=tamanho,
+                                                     pool_reset_session=True, **self.config)
+        return self._pool.pool_size if self._pool else 0
+
+    def conectar(self):
+        import mysql.connector
+        if self._pool is not None:
+            try:
+                # close() da conexão do pool a devolve ao pool
+                return self._pool.get_connection()
+            except mysql.connector.errors.PoolError:
+                pass  # pool esgotado: conexão avulsa
+        return mysql.connector.connect(**self.config)
+
+    def novo_cursor(self, conn):
+        return conn.cursor(dictionary=True)
+
+    def upsert_imovel(self, cur, row: dict):
+        cur.execute(SQL_UPSERT_MYSQL, row)
+
+    def limitar_tempo_consulta(self, cur, ms: int):
+        # vale para os SELECT da sessão (MySQL 5.7.8+); a conexão é fechada ao fim da requisição
+        cur.execute("SET SESSION MAX_EXECUTION_TIME = %s", (int(ms),))
+
+    def tempo_esgotado(self, erro: Exception) -> bool:
+        return getattr(erro, "errno", None) == 3024  # ER_QUERY_TIMEOUT
+
+    def conectar_carga(self):
+        import mysql.connector
+        conn = mysql.connector.connect(**self.config, allow_local_infile=True, autocommit=True)
+        cur = conn.cursor()
+        cur.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+        cur.close()
+        return conn
+
+    def listar_indices_secundarios(self, conn, tabela: str) -> list:
+        cur = conn.cursor(dictionary=True)
+        cur.execute(f"SHOW INDEX FROM `{tabela}`")
+        indices: dict = {}
+        for r in cur.fetchall():
+            if r["Key_name"] == "PRIMARY" or not int(r["Non_unique"]):
+                continue
+            col = f"`{r['Column_name']}`" + (f"({r['Sub_part']})" if r.get("Sub_part") else "")
+            tipo = "FULLTEXT KEY" if r.get("Index_type") == "FULLTEXT" else "KEY"
+            indices.setdefault(r["Key_name"], (tipo, []))[1].append((int(r["Seq_in_index"]), col))
+        cur.close()
+        return [(nome, f"ADD {tipo} `{nome}` ({', '.join(c for _, c in sorted(cols))})")
+                for nome, (tipo, cols) in indices.items()]
+
+    def remover_indice(self, conn, tabela: str, nome: str):
+        cur = conn.cursor()
+        cur.execute(f"ALTER TABLE `{tabela}` DROP INDEX `{nome}`")
+        cur.close()
+
+    def recriar_indices(self, conn, tabela: str, indices: list):
+        if not indices:
+            return
+        cur = conn.cursor()
+        # um único ALTER: a tabela é percorrida uma vez para todos os índices
+        cur.execute(f"ALTER TABLE `{tabela}` " + ", ".join(sql for _, sql in indices))
+        cur.close()
+
+    def esvaziar(self, conn, tabela: str):
+        cur = conn.cursor()
+        cur.execute(f"TRUNCATE TABLE `{tabela}`")
+        cur.close()
+
+    def carregar_tsv(self, conn, tabela: str, colunas: list, arquivo: str) -> int:
+        cur = conn.cursor()
+        cols = ", ".join(f"`{c}`" for c in colunas)
+        cur.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE `{tabela}` CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+            f"({cols})",
+            (os.path.abspath(arquivo),),
+        )
+        n = cur.rowcount
+        cur.close()
+        return n
+
+
+# =========================
+# SQLite (embutido)
+# =========================
+SCHEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS imoveis_df (
+  ID INTEGER PRIMARY KEY,
+  CIDADE TEXT NOT NULL,
+  BAIRRO TEXT NOT NULL,
+  endereco TEXT,
+  tipo TEXT,
+  Titulo TEXT NOT NULL,
+  Metragem TEXT,
+  QUARTOS INTEGER,
+  SUITES INTEGER,
+  VAGAS INTEGER,
+  VALOR TEXT,
+  tipo_negocio TEXT,
+  valor_m2 TEXT,
+  data_da_busca TEXT,
+  metragem_num REAL,
+  valor_num REAL,
+  grupo_duplicado INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_cidade ON imoveis_df (CIDADE);
+CREATE INDEX IF NOT EXISTS idx_bairro ON imoveis_df (BAIRRO);
+CREATE INDEX IF NOT EXISTS idx_comparaveis
+  ON imoveis_df (tipo_negocio, QUARTOS, SUITES, VAGAS, metragem_num);
+CREATE INDEX IF NOT EXISTS idx_grupo_duplicado ON imoveis_df (grupo_duplicado);
+CREATE INDEX IF NOT EXISTS idx_data_busca ON imoveis_df (data_da_busca);
+CREATE INDEX IF NOT EXISTS idx_valor_id ON imoveis_df (valor_num, ID);
+
+CREATE TABLE IF NOT EXISTS endereco (
+  uf TEXT NOT NULL,
+  cidade TEXT,
+  bairro TEXT,
+  endereco TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_endereco_uf ON endereco (uf);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_endereco ON endereco (uf, cidade, bairro, endereco);
+
+CREATE TABLE IF NOT EXISTS endereco_versao (
+  uf TEXT PRIMARY KEY,
+  versao INTEGER NOT NULL,
+  atualizado_em TEXT
+);
+
+CREATE TABLE IF NOT EXISTS tipo (
+  id INTEGER PRIMARY KEY,
+  tipo TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS rollup_m2 (
+  tipo_negocio TEXT NOT NULL,
+  uf TEXT NOT NULL,
+  cidade TEXT NOT NULL,
+  bairro TEXT NOT NULL,
+  tipo TEXT NOT NULL,
+  quartos INTEGER NOT NULL,
+  suites INTEGER NOT NULL,
+  vagas INTEGER NOT NULL,
+  faixa_metragem TEXT NOT NULL,
+  n INTEGER NOT NULL,
+  soma_m2 REAL NOT NULL,
+  sketch TEXT NOT NULL,
+  media_aparada REAL,
+  atualizado_em TEXT,
+  PRIMARY KEY (tipo_negocio, uf, cidade, bairro, tipo, quartos, suites, vagas, faixa_metragem)
+);
+CREATE INDEX IF NOT EXISTS idx_rollup_local ON rollup_m2 (uf, cidade, bairro);
+
+CREATE TABLE IF NOT EXISTS dedup_lsh (
+  banda INTEGER NOT NULL,
+  hash TEXT NOT NULL,
+  ID INTEGER NOT NULL,
+  PRIMARY KEY (banda, hash, ID)
+);
+CREATE INDEX IF NOT EXISTS idx_dedup_lsh_id ON dedup_lsh (ID);
+
+CREATE TABLE IF NOT EXISTS imoveis_historico (
+  ID INTEGER NOT NULL,
+  seq INTEGER NOT NULL,
+  data_da_busca TEXT,
+  hash TEXT NOT NULL,
+  quadro TEXT NOT NULL,
+  dados TEXT NOT NULL,
+  uf TEXT NOT NULL,
+  cidade TEXT NOT NULL,
+  bairro TEXT NOT NULL,
+  tipo_negocio TEXT NOT NULL,
+  tipo TEXT NOT NULL,
+  valor_m2 REAL,
+  PRIMARY KEY (ID, seq)
+);
+CREATE INDEX IF NOT EXISTS idx_hist_id_data ON imoveis_historico (ID, data_da_busca);
+CREATE INDEX IF NOT EXISTS idx_hist_local ON imoveis_historico (uf, cidade, bairro, tipo_negocio, data_da_busca);
+
+CREATE TABLE IF NOT EXISTS mudanca_imovel (
+  versao INTEGER PRIMARY KEY AUTOINCREMENT,
+  ID INTEGER,
+  uf TEXT,
+  cidade TEXT,
+  bairro TEXT,
+  endereco TEXT,
+  tipo TEXT,
+  tipo_negocio TEXT,
+  criado_em TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_mudanca_criado ON mudanca_imovel (criado_em);
+"""
+
+# colunas acrescentadas depois da criação original (bases .sqlite antigas)
+COLUNAS_MIGRACAO_SQLITE = {
+    "imoveis_df": [("grupo_duplicado", "INTEGER")],
+}
+
+SQL_UPSERT_SQLITE = """
+    INSERT INTO imoveis_df
+      (ID, CIDADE, BAIRRO, endereco, tipo, Titulo, Metragem, QUARTOS, SUITES, VAGAS, VALOR, tipo_negocio, valor_m2, data_da_busca,
+       metragem_num, valor_num)
+    VALUES
+      (:ID, :CIDADE, :BAIRRO, :endereco, :tipo, :Titulo, :Metragem, :QUARTOS, :SUITES, :VAGAS, :VALOR, :tipo_negocio, :valor_m2, :data_da_busca,
+       :metragem_num, :valor_num)
+    ON CONFLICT(ID) DO UPDATE SET
+      CIDADE=excluded.CIDADE,
+      BAIRRO=excluded.BAIRRO,
+      endereco=excluded.endereco,
+      tipo=excluded.tipo,
+      Titulo=excluded.Titulo,
+      Metragem=excluded.Metragem,
+      QUARTOS=excluded.QUARTOS,
+      SUITES=excluded.SUITES,
+      VAGAS=excluded.VAGAS,
+      VALOR=excluded.VALOR,
+      tipo_negocio=excluded.tipo_negocio,
+      valor_m2=excluded.valor_m2,
+      data_da_busca=excluded.data_da_busca,
+      metragem_num=excluded.metragem_num,
+      valor_num=excluded.valor_num
+"""
+
+
+def _dict_factory(cursor, row):
+    return {d[0]: v for d, v in zip(cursor.description, row)}
+
+
+class _CursorSQLite:
+    """Adapta o cursor do sqlite3 às consultas escritas com placeholder %s."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.limite_s = None   # tempo máximo por consulta (SQLiteBackend.limitar_tempo_consulta)
+        self.prazo = None
+
+    def execute(self, sql, params=()):
+        if self.limite_s:
+            self.prazo = time.monotonic() + self.limite_s
+        if isinstance(params, dict):
+            # %(nome)s -> :nome
+            return self._cur.execute(re.sub(r"%\((\w+)\)s", r":\1", sql), params)
+        return self._cur.execute(sql.replace("%s", "?"), tuple(params or ()))
+
+    def executemany(self, sql, seq):
+        return self._cur.executemany(sql.replace("%s", "?"), seq)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def fetchmany(self, size):
+        return self._cur.fetchmany(size)
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def close(self):
+        self._cur.close()
+
+
+class SQLiteBackend(StorageBackend):
+    nome = "sqlite"
+    expr_metragem = "metragem_num"
+    expr_valor = "valor_num"
+    sufixo_lock = ""  # SQLite trava o arquivo inteiro na escrita
+    prefixo_insert_ignore = "INSERT OR IGNORE"
+
+    def __init__(self, caminho: str | None = None):
+        self.caminho = caminho or SQLITE_PATH
+        self._uri = self.caminho.startswith("file:")
+        self._ancora = None
+
+    @classmethod
+    def em_memoria(cls, nome: str) -> "SQLiteBackend":
+        """Base em memória compartilhada entre as conexões do processo."""
+        backend = cls(f"file:{nome}?mode=memory&cache=shared")
+        # a base some quando a última conexão fecha; esta fica aberta
+        backend._ancora = backend.conectar()
+        backend.criar_schema()
+        return backend
+
+    def conectar(self):
+        conn = sqlite3.connect(self.caminho, uri=self._uri, check_same_thread=False)
+        conn.row_factory = _dict_factory
+        return conn
+
+    def novo_cursor(self, conn):
+        return _CursorSQLite(conn.cursor())
+
+    def criar_schema(self):
+        conn = self.conectar()
+        try:
+            for tabela, colunas in COLUNAS_MIGRACAO_SQLITE.items():
+                existentes = {r["name"] for r in conn.execute(f"PRAGMA table_info({tabela})")}
+                if not existentes:
+                    continue  # tabela nova: o script abaixo cria completa
+                for nome, tipo in colunas:
+                    if nome not in existentes:
+                        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {nome} {tipo}")
+            # bases antigas: endereco sem uq_endereco pode ter linhas repetidas
+            if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'uq_endereco'").fetchone() and \
+                    conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'endereco'").fetchone():
+                conn.execute("DELETE FROM endereco WHERE rowid NOT IN "
+                             "(SELECT MIN(rowid) FROM endereco GROUP BY uf, cidade, bairro, endereco)")
+            conn.executescript(SCHEMA_SQLITE)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def limitar_tempo_consulta(self, cur, ms: int):
+        # o progress handler roda a cada N instruções da VM; devolver True interrompe a consulta
+        conn = cur._cur.connection
+        if not ms:
+            cur.limite_s = cur.prazo = None
+            conn.set_progress_handler(None, 0)
+            return
+        cur.limite_s = ms / 1000.0
+        conn.set_progress_handler(lambda: cur.prazo is not None and time.monotonic() > cur.prazo,
+                                  PASSOS_PROGRESSO)
+
+    def tempo_esgotado(self, erro: Exception) -> bool:
+        return isinstance(erro, sqlite3.OperationalError) and "interrupted" in str(erro)
+
+    def upsert_imovel(self, cur, row: dict):
+        dados = {c: row.get(c) for c in COLUNAS_IMOVEL}
+        dados["metragem_num"] = parse_metragem_str_to_float(row.get("Metragem"))
+        dados["valor_num"] = parse_valor_str_to_float(row.get("VALOR"))
+        cur.execute(SQL_UPSERT_SQLITE, dados)
+
+    def listar_indices_secundarios(self, conn, tabela: str) -> list:
+        rows = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (tabela,),
+        ).fetchall()
+        # índices automáticos (PK/UNIQUE) têm sql NULL; UNIQUE explícito fica
+        return [(r["name"], r["sql"]) for r in rows if " UNIQUE " not in r["sql"].upper()]
+
+    def remover_indice(self, conn, tabela: str, nome: str):
+        conn.execute(f"DROP INDEX IF EXISTS {nome}")
+        conn.commit()
+
+    def recriar_indices(self, conn, tabela: str, indices: list):
+        for _, sql in indices:
+            conn.execute(sql)
+        conn.commit()
+
+    def esvaziar(self, conn, tabela: str):
+        conn.execute(f"DELETE FROM {tabela}")
+        conn.commit()
+
+    def carregar_tsv(self, conn, tabela: str, colunas: list, arquivo: str) -> int:
+        # como o LOAD DATA LOCAL do MySQL: linhas com chave repetida são ignoradas
+        sql = (f"{self.prefixo_insert_ignore} INTO {tabela} ({', '.join(colunas)}) "
+               f"VALUES ({', '.join('?' * len(colunas))})")
+        cur = conn.executemany(sql, _ler_tsv(arquivo))
+        conn.commit()
+        return cur.rowcount
+
+    def pos_carga(self, conn, tabela: str):
+        if tabela != "imoveis_df":
+            return
+        # colunas numéricas do SQLite (o dump do MySQL só traz o texto)
+        conn.create_function("parse_metragem", 1, parse_metragem_str_to_float, deterministic=True)
+        conn.create_function("parse_valor", 1, parse_valor_str_to_float, deterministic=True)
+        conn.execute("UPDATE imoveis_df SET metragem_num = parse_metragem(Metragem), valor_num = parse_valor(VALOR)")
+        conn.commit()
+
+
+_ESCAPES_TSV = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a", "\\": "\\"}
+
+
+def _campo_tsv(campo: str):
+    if campo == "\\N":
+        return None
+    if "\\" not in campo:
+        return campo
+    return re.sub(r"\\(.)", lambda m: _ESCAPES_TSV.get(m.group(1), m.group(1)), campo)
+
+
+def _ler_tsv(arquivo: str):
+    """Linhas de um TSV no formato do LOAD DATA (escape com barra, \\N = NULL), sob demanda."""
+    with open(arquivo, "r", encoding="utf-8", newline="\n") as f:
+        for linha in f:
+            yield tuple(_campo_tsv(c) for c in linha.rstrip("\n").split("\t"))
+
+
+# =========================
+# Seleção do backend
+# =========================
+_backend: StorageBackend | None = None
+
+
+def criar_backend(nome: str | None = None) -> StorageBackend:
+    nome = (nome or os.getenv("LAUDO_DB_BACKEND", "mysql")).strip().lower()
+    if nome == "sqlite":
+        backend = SQLiteBackend()
+        backend.criar_schema()  # IF NOT EXISTS: cria tabelas novas em bases antigas
+        return backend
+    if nome == "mysql":
+        return MySQLBackend()
+    raise ValueError(f"Backend desconhecido: {nome}")
+
+
+def get_backend() -> StorageBackend:
+    """Backend do processo (criado na primeira chamada)."""
+    global _backend
+    if _backend is None:
+        _backend = criar_backend()
+    return _backend
+
+
+def set_backend(backend: StorageBackend):
+    global _backend
+    _backend = backend
+
+
+# =========================
+# Exportação MySQL -> SQLite
+# =========================
+def exportar_sqlite(origem: StorageBackend, destino: SQLiteBackend, lote: int = 5000) -> int:
+    """Copia imoveis_df, endereco e tipo para o SQLite local. Retorna nº de imóveis."""
+    destino.criar_schema()
+    total = 0
+    with origem.cursor() as cur_o, destino.transacao() as cur_d:
+        cur_o.execute("SELECT * FROM imoveis_df")
+        while True:
+            rows = cur_o.fetchmany(lote)
+            if not rows:
+                break
+            for r in rows:
+                destino.upsert_imovel(cur_d, r)
+            total += len(rows)
+
+    copiar_tabelas_auxiliares(origem, destino, lote)
+    return total
+
+
+def copiar_tabelas_auxiliares(origem: StorageBackend, destino: SQLiteBackend, lote: int = 5000):
+    """Copia endereco (com as versões por UF) e tipo (tabelas pequenas) para o SQLite local."""
+    with origem.cursor() as cur_o, destino.transacao() as cur_d:
+        cur_d.execute("DELETE FROM endereco")
+        cur_o.execute("SELECT uf, cidade, bairro, endereco FROM endereco")
+        while True:
+            rows = cur_o.fetchmany(lote)
+            if not rows:
+                break
+            cur_d.executemany(
+                "INSERT OR IGNORE INTO endereco (uf, cidade, bairro, endereco) VALUES (%s, %s, %s, %s)",
+                [(r["uf"], r["cidade"], r["bairro"], r["endereco"]) for r in rows],
+            )
+
+        cur_d.execute("DELETE FROM endereco_versao")
+        cur_o.execute("SELECT uf, versao, atualizado_em FROM endereco_versao")
+        cur_d.executemany(
+            "INSERT INTO endereco_versao (uf, versao, atualizado_em) VALUES (%s, %s, %s)",
+            [(r["uf"], r["versao"], r["atualizado_em"]) for r in cur_o.fetchall()],
+        )
+
+        cur_d.execute("DELETE FROM tipo")
+        cur_o.execute("SELECT id, tipo FROM tipo")
+        cur_d.executemany(
+            "INSERT INTO tipo (id, tipo) VALUES (%s, %s)",
+            [(r["id"], r["tipo"]) for r in cur_o.fetchall()],
+        )
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Camada de dados do laudo-imogo.")
+    ap.add_argument("--exportar-sqlite", metavar="CAMINHO",
+                    help="Copia o MySQL configurado para um arquivo SQLite local.")
+    args = ap.parse_args()
+
+    if args.exportar_sqlite:
+        n = exportar_sqlite(MySQLBackend(), SQLiteBackend(args.exportar_sqlite))
+        print(f"[OK] {n} imóveis exportados para {args.exportar_sqlite}")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
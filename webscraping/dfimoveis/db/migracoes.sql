@@ -0,0 +1,95 @@
+-- Migrações para bancos criados com versões anteriores do schema_dfdb.sql.
+-- Rode só os blocos que ainda não foram aplicados (bases novas já nascem
+-- com tudo pelo schema_dfdb.sql).
+
+USE dfdb;
+
+-- 2026-10-19: deduplicação de anúncios (api/utils/dedup.py)
+ALTER TABLE imoveis_df
+  ADD COLUMN grupo_duplicado BIGINT(20) NULL,
+  ADD KEY idx_grupo_duplicado (grupo_duplicado);
+
+CREATE TABLE IF NOT EXISTS dedup_lsh (
+  banda TINYINT NOT NULL,
+  hash CHAR(16) NOT NULL,
+  ID BIGINT(20) NOT NULL,
+  PRIMARY KEY (banda, hash, ID),
+  KEY idx_dedup_lsh_id (ID)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+-- depois: python -m utils.dedup --reconstruir (dentro de api/)
+
+-- 2026-10-19: comparáveis lidos por janelas de recência (ORDER BY data_da_busca DESC)
+ALTER TABLE imoveis_df
+  ADD KEY idx_data_busca (data_da_busca);
+
+-- 2026-10-19: histórico de preços (api/utils/historico.py)
+CREATE TABLE IF NOT EXISTS imoveis_historico (
+  ID BIGINT(20) NOT NULL,
+  seq INT NOT NULL,
+  data_da_busca VARCHAR(20) NULL,
+  hash CHAR(16) NOT NULL,
+  quadro CHAR(1) NOT NULL,
+  dados TEXT NOT NULL,
+  uf CHAR(2) NOT NULL,
+  cidade VARCHAR(120) NOT NULL,
+  bairro VARCHAR(160) NOT NULL,
+  tipo_negocio VARCHAR(60) NOT NULL,
+  tipo VARCHAR(120) NOT NULL,
+  valor_m2 DOUBLE NULL,
+  PRIMARY KEY (ID, seq),
+  KEY idx_hist_id_data (ID, data_da_busca),
+  KEY idx_hist_local (uf, cidade, bairro, tipo_negocio, data_da_busca)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+-- depois: python -m utils.historico --inicializar (dentro de api/)
+
+-- 2026-10-19: colunas numéricas geradas + índice da listagem paginada (GET /api/laudo/imoveis)
+-- (MySQL 5.7+; a API passa a usar metragem_num/valor_num nas consultas)
+ALTER TABLE imoveis_df
+  ADD COLUMN metragem_num DECIMAL(10,2) AS (IF(
+    IF(LOCATE(',', REPLACE(Metragem, ' m²', '')), REPLACE(REPLACE(REPLACE(Metragem, ' m²', ''), '.', ''), ',', '.'), REPLACE(Metragem, ' m²', ''))
+      REGEXP '^[0-9]{1,8}([.][0-9]+)?$',
+    CAST(IF(LOCATE(',', REPLACE(Metragem, ' m²', '')), REPLACE(REPLACE(REPLACE(Metragem, ' m²', ''), '.', ''), ',', '.'), REPLACE(Metragem, ' m²', '')) AS DECIMAL(10,2)),
+    NULL)) STORED,
+  ADD COLUMN valor_num BIGINT UNSIGNED AS (IF(REPLACE(REPLACE(VALOR, '.', ''), ',', '') REGEXP '^[0-9]{1,18}$',
+    CAST(REPLACE(REPLACE(VALOR, '.', ''), ',', '') AS UNSIGNED), NULL)) STORED,
+  ADD KEY idx_valor_id (valor_num, ID);
+
+-- 2026-10-19: sincronização incremental de endereco (api/utils/enderecos.py)
+-- remove linhas repetidas antes da chave única
+CREATE TABLE endereco_novo LIKE endereco;
+ALTER TABLE endereco_novo ADD UNIQUE KEY uq_endereco (uf, cidade, bairro, endereco);
+INSERT IGNORE INTO endereco_novo (uf, cidade, bairro, endereco) SELECT uf, cidade, bairro, endereco FROM endereco;
+RENAME TABLE endereco TO endereco_antigo, endereco_novo TO endereco;
+DROP TABLE endereco_antigo;
+CREATE TABLE IF NOT EXISTS endereco_versao (
+  uf CHAR(2) NOT NULL,
+  versao INT NOT NULL,
+  atualizado_em DATETIME NULL,
+  PRIMARY KEY (uf)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+-- depois: python -m utils.enderecos --sincronizar (dentro de api/)
+
+-- 2026-10-19: canal de mudanças do ingest para os caches da API (api/utils/mudancas.py)
+CREATE TABLE IF NOT EXISTS mudanca_imovel (
+  versao BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  ID BIGINT(20) NULL,
+  uf CHAR(2) NULL,
+  cidade VARCHAR(120) NULL,
+  bairro VARCHAR(160) NULL,
+  endereco VARCHAR(200) NULL,
+  tipo VARCHAR(120) NULL,
+  tipo_negocio VARCHAR(60) NULL,
+  criado_em VARCHAR(20) NOT NULL,
+  PRIMARY KEY (versao),
+  KEY idx_mudanca_criado (criado_em)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+-- depois: LAUDO_MUDANCAS=1 na API; podar de tempos em tempos: python -m utils.mudancas --podar 7 (dentro de api/)
+
+-- 2026-10-19: metragem_num com separador de milhar ("1.200,00 m²"), mesma regra de
+-- parse_metragem_str_to_float; só para bases que já aplicaram o bloco das colunas geradas
+ALTER TABLE imoveis_df
+  MODIFY COLUMN metragem_num DECIMAL(10,2) AS (IF(
+    IF(LOCATE(',', REPLACE(Metragem, ' m²', '')), REPLACE(REPLACE(REPLACE(Metragem, ' m²', ''), '.', ''), ',', '.'), REPLACE(Metragem, ' m²', ''))
+      REGEXP '^[0-9]{1,8}([.][0-9]+)?$',
+    CAST(IF(LOCATE(',', REPLACE(Metragem, ' m²', '')), REPLACE(REPLACE(REPLACE(Metragem, ' m²', ''), '.', ''), ',', '.'), REPLACE(Metragem, ' m²', '')) AS DECIMAL(10,2)),
+    NULL)) STORED;
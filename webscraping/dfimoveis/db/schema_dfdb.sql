@@ -21,7 +21,106 @@ CREATE TABLE IF NOT EXISTS imoveis_df (
   tipo_negocio VARCHAR(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL,
   valor_m2 VARCHAR(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL,
   data_da_busca VARCHAR(200) CHARACTER SET utf8mb4 COLLATE utf8mb4_general_ci NULL,
+  grupo_duplicado BIGINT(20) NULL,
+  -- valores numéricos derivados do texto (ordenação/filtros indexáveis; NULL se não for número)
+  metragem_num DECIMAL(10,2) AS (IF(
+    IF(LOCATE(',', REPLACE(Metragem, ' m²', '')), REPLACE(REPLACE(REPLACE(Metragem, ' m²', ''), '.', ''), ',', '.'), REPLACE(Metragem, ' m²', ''))
+      REGEXP '^[0-9]{1,8}([.][0-9]+)?$',
+    CAST(IF(LOCATE(',', REPLACE(Metragem, ' m²', '')), REPLACE(REPLACE(REPLACE(Metragem, ' m²', ''), '.', ''), ',', '.'), REPLACE(Metragem, ' m²', '')) AS DECIMAL(10,2)),
+    NULL)) STORED,
+  valor_num BIGINT UNSIGNED AS (IF(REPLACE(REPLACE(VALOR, '.', ''), ',', '') REGEXP '^[0-9]{1,18}$',
+    CAST(REPLACE(REPLACE(VALOR, '.', ''), ',', '') AS UNSIGNED), NULL)) STORED,
   PRIMARY KEY (ID),
   KEY idx_cidade (CIDADE),
-  KEY idx_bairro (BAIRRO)
+  KEY idx_bairro (BAIRRO),
+  KEY idx_grupo_duplicado (grupo_duplicado),
+  KEY idx_data_busca (data_da_busca),
+  KEY idx_valor_id (valor_num, ID)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Agregados de R$/m² por segmento (mantidos pelo getdf.py; ver api/utils/rollups.py)
+CREATE TABLE IF NOT EXISTS rollup_m2 (
+  tipo_negocio VARCHAR(60) NOT NULL,
+  uf CHAR(2) NOT NULL,
+  cidade VARCHAR(120) NOT NULL,
+  bairro VARCHAR(160) NOT NULL,
+  tipo VARCHAR(120) NOT NULL,
+  quartos SMALLINT NOT NULL,
+  suites SMALLINT NOT NULL,
+  vagas SMALLINT NOT NULL,
+  faixa_metragem VARCHAR(16) NOT NULL,
+  n INT NOT NULL,
+  soma_m2 DOUBLE NOT NULL,
+  sketch MEDIUMTEXT NOT NULL,
+  media_aparada DOUBLE NULL,
+  atualizado_em VARCHAR(20) NULL,
+  PRIMARY KEY (tipo_negocio, uf, cidade, bairro, tipo, quartos, suites, vagas, faixa_metragem),
+  KEY idx_rollup_local (uf, cidade, bairro)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Bandas MinHash/LSH para deduplicação de anúncios (ver api/utils/dedup.py)
+CREATE TABLE IF NOT EXISTS dedup_lsh (
+  banda TINYINT NOT NULL,
+  hash CHAR(16) NOT NULL,
+  ID BIGINT(20) NOT NULL,
+  PRIMARY KEY (banda, hash, ID),
+  KEY idx_dedup_lsh_id (ID)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Histórico append-only (versão nova só quando preço/atributos mudam; ver api/utils/historico.py)
+CREATE TABLE IF NOT EXISTS imoveis_historico (
+  ID BIGINT(20) NOT NULL,
+  seq INT NOT NULL,
+  data_da_busca VARCHAR(20) NULL,
+  hash CHAR(16) NOT NULL,
+  quadro CHAR(1) NOT NULL,
+  dados TEXT NOT NULL,
+  uf CHAR(2) NOT NULL,
+  cidade VARCHAR(120) NOT NULL,
+  bairro VARCHAR(160) NOT NULL,
+  tipo_negocio VARCHAR(60) NOT NULL,
+  tipo VARCHAR(120) NOT NULL,
+  valor_m2 DOUBLE NULL,
+  PRIMARY KEY (ID, seq),
+  KEY idx_hist_id_data (ID, data_da_busca),
+  KEY idx_hist_local (uf, cidade, bairro, tipo_negocio, data_da_busca)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Canal de mudanças para os caches da API (lido por versão; ver api/utils/mudancas.py)
+CREATE TABLE IF NOT EXISTS mudanca_imovel (
+  versao BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+  ID BIGINT(20) NULL,
+  uf CHAR(2) NULL,
+  cidade VARCHAR(120) NULL,
+  bairro VARCHAR(160) NULL,
+  endereco VARCHAR(200) NULL,
+  tipo VARCHAR(120) NULL,
+  tipo_negocio VARCHAR(60) NULL,
+  criado_em VARCHAR(20) NOT NULL,
+  PRIMARY KEY (versao),
+  KEY idx_mudanca_criado (criado_em)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Endereços do formulário (carga em massa: python -m utils.carga_bulk --enderecos, dentro de api/)
+CREATE TABLE IF NOT EXISTS endereco (
+  uf CHAR(2) NOT NULL,
+  cidade VARCHAR(120) NULL,
+  bairro VARCHAR(160) NULL,
+  endereco VARCHAR(200) NULL,
+  KEY idx_endereco_uf (uf),
+  UNIQUE KEY uq_endereco (uf, cidade, bairro, endereco)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+-- Versão dos endereços de cada UF (sincronização incremental do getdf.py; ETag de /api/laudo/enderecos/{uf})
+CREATE TABLE IF NOT EXISTS endereco_versao (
+  uf CHAR(2) NOT NULL,
+  versao INT NOT NULL,
+  atualizado_em DATETIME NULL,
+  PRIMARY KEY (uf)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS tipo (
+  id INT NOT NULL,
+  tipo VARCHAR(120) NOT NULL,
+  PRIMARY KEY (id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
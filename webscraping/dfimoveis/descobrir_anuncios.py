@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+descobrir_anuncios.py
+---------------------
+Descobre os anúncios ativos do DFImóveis pelas páginas de resultado de busca,
+em vez de testar ID por ID como o mapear_folder_dfimoveis.py.
+
+Para cada combinação (negócio, uf, cidade, bairro, tipo) da taxonomia em
+/metadata/ (estados, cidades, bairros, tipos — via índice de localidades da
+API), percorre as páginas:
+  https://www.dfimoveis.com.br/{negocio}/{uf}/{cidade}/{bairro}/{tipo}?pagina={n}
+extrai os IDs dos links /imovel/... e grava em url_validas.txt no formato que
+o getdf.py lê:
+  https://www.dfimoveis.com.br/imovel/impressao/{id}
+
+A paginação para quando uma página não traz nenhum ID novo (ou em
+--max-paginas). Timeout, erro de conexão ou status diferente de 200/404
+interrompem a combinação sem marcá-la como concluída: os IDs já achados
+são gravados e o --resumir tenta de novo. Cidades sem bairros conhecidos são percorridas inteiras
+(bairro "todos"). Uma requisição por página de ~30 anúncios, contra uma por
+ID na varredura sequencial.
+
+Uso:
+  pip install requests
+  python descobrir_anuncios.py --negocios venda,aluguel --ufs DF
+  python descobrir_anuncios.py --ufs DF --cidades "AGUAS CLARAS" --resumir
+
+Teste local (servidor com páginas salvas em test/fixtures/):
+  python test/stub_dfimoveis.py --porta 8098
+  python descobrir_anuncios.py --base http://127.0.0.1:8098 --ufs DF --sleep 0 --saida /tmp/descoberta
+
+Opções:
+  --negocios <lista>  venda,aluguel (padrão: venda)
+  --ufs <lista>       UFs (padrão: todas do metadata/estados)
+  --cidades <lista>   Restringe às cidades informadas
+  --tipos <lista>     Restringe aos tipos informados (padrão: metadata/tipos)
+  --nivel <str>       bairro (padrão) | cidade (uma busca por cidade/tipo)
+  --max-paginas <int> Limite de páginas por combinação (padrão: 200)
+  --base <url>        Raiz do site (padrão: https://www.dfimoveis.com.br)
+  --saida <dir>       Diretório de url_validas.txt e descoberta_progresso.txt
+  --resumir           Pula combinações já concluídas e não duplica URLs
+  --timeout / --sleep / --ua   como no mapear_folder_dfimoveis.py
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import unicodedata
+
+import requests
+
+# metadados compilados compartilhados com a API (api/utils/localidades.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "api"))
+from utils import localidades
+
+BASE_DEFAULT = "https://www.dfimoveis.com.br"
+URL_BUSCA = "{base}/{negocio}/{uf}/{cidade}/{bairro}/{tipo}"
+URL_IMPRESSAO = "https://www.dfimoveis.com.br/imovel/impressao/{id}"
+TIPOS_JSON = os.path.join(localidades.METADATA_DIR, "tipos", "tipos.json")
+UA_DEFAULT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+    "AppleWebKit/537.36 (KHTML, like Gecko) "
+    "Chrome/123.0.0.0 Safari/537.36"
+)
+
+# href de anúncio: /imovel/<slug>-<id> ou /imovel/impressao/<id>
+RE_LINK_ANUNCIO = re.compile(r"""href=["']([^"']*/imovel/[^"'?#]*?(\d{3,}))/?(?:[?#][^"']*)?["']""", re.I)
+
+
+def slug(s: str) -> str:
+    """'ÁGUAS CLARAS' -> 'aguas-claras' (formato dos caminhos de busca do site)."""
+    s = unicodedata.normalize("NFD", s or "")
+    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+    return re.sub(r"[^a-z0-9]+", "-", s.lower()).strip("-")
+
+
+def extrair_ids(html: str) -> list:
+    """IDs dos anúncios linkados na página, na ordem em que aparecem, sem repetir."""
+    vistos, ids = set(), []
+    for m in RE_LINK_ANUNCIO.finditer(html or ""):
+        id_ = int(m.group(2))
+        if id_ not in vistos:
+            vistos.add(id_)
+            ids.append(id_)
+    return ids
+
+
+def carregar_tipos() -> list:
+    with open(TIPOS_JSON, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def combinacoes(negocios: list, ufs: list | None, cidades: list | None, tipos: list, nivel: str):
+    """(negocio, uf, cidade, bairro, tipo) a percorrer; bairro None = cidade inteira."""
+    idx = localidades.indice()
+    filtro_cidades = {localidades.normalizar_nome(c) for c in cidades} if cidades else None
+    for negocio in negocios:
+        for uf in ufs or [u for u in idx.ufs() if u != "ND"]:
+            for cidade in idx.cidades(uf):
+                if filtro_cidades and cidade not in filtro_cidades:
+                    continue
+                bairros = idx.bairros(uf, cidade) if nivel == "bairro" else []
+                for tipo in tipos:
+                    for bairro in bairros or [None]:
+                        yield negocio, uf, cidade, bairro, tipo
+
+
+def chave_combinacao(negocio, uf, cidade, bairro, tipo) -> str:
+    return "|".join([negocio, uf, cidade, bairro or "*", tipo])
+
+
+def url_busca(base: str, negocio, uf, cidade, bairro, tipo) -> str:
+    return URL_BUSCA.format(base=base.rstrip("/"), negocio=slug(negocio), uf=slug(uf),
+                            cidade=slug(cidade), bairro=slug(bairro) if bairro else "todos", tipo=slug(tipo))
+
+
+class FalhaBusca(Exception):
+    """Página de busca não obtida (timeout, conexão, status inesperado): não é 'fim dos resultados'."""
+
+
+def fetch_html(sessao: requests.Session, url: str, timeout: int, ua: str) -> str:
+    """HTML da página; "" se a busca não existe (404). FalhaBusca nos demais erros."""
+    try:
+        resp = sessao.get(url, headers={"User-Agent": ua}, timeout=timeout)
+    except requests.RequestException as e:
+        raise FalhaBusca(f"{type(e).__name__}") from e
+    if resp.status_code == 404:
+        return ""
+    if resp.status_code != 200:
+        raise FalhaBusca(f"HTTP {resp.status_code}")
+    return resp.text or ""
+
+
+def percorrer(sessao, url: str, max_paginas: int, timeout: int, ua: str, sleep: float):
+    """
+    IDs de todas as páginas de uma busca; retorna (ids, nº de requisições, erro).
+    erro é None se a paginação chegou ao fim; senão a falha que a interrompeu.
+    """
+    ids, vistos, reqs = [], set(), 0
+    for pagina in range(1, max_paginas + 1):
+        reqs += 1
+        try:
+            html = fetch_html(sessao, f"{url}?pagina={pagina}", timeout, ua)
+        except FalhaBusca as e:
+            return ids, reqs, f"página {pagina}: {e}"
+        novos = [i for i in extrair_ids(html) if i not in vistos]
+        if not novos:
+            # página vazia, fora do intervalo ou repetindo a última: fim da busca
+            break
+        vistos.update(novos)
+        ids.extend(novos)
+        time.sleep(sleep)
+    return ids, reqs, None
+
+
+def _lista(s: str | None) -> list | None:
+    return [x.strip() for x in s.split(",") if x.strip()] if s else None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Descobre anúncios do DFImóveis pelas páginas de busca.")
+    ap.add_argument("--negocios", default="venda", help="Negócios separados por vírgula (venda,aluguel).")
+    ap.add_argument("--ufs", help="UFs separadas por vírgula (padrão: todas).")
+    ap.add_argument("--cidades", help="Cidades separadas por vírgula (padrão: todas da UF).")
+    ap.add_argument("--tipos", help="Tipos separados por vírgula (padrão: metadata/tipos/tipos.json).")
+    ap.add_argument("--nivel", choices=["bairro", "cidade"], default="bairro",
+                    help="Granularidade das buscas (padrão: bairro).")
+    ap.add_argument("--max-paginas", type=int, default=200, help="Páginas por combinação (padrão: 200).")
+    ap.add_argument("--base", default=BASE_DEFAULT, help="Raiz do site (ou do servidor de teste).")
+    ap.add_argument("--saida", default=".", help="Diretório para url_validas.txt.")
+    ap.add_argument("--timeout", type=int, default=15, help="Timeout por request em segundos (padrão: 15).")
+    ap.add_argument("--sleep", type=float, default=0.5, help="Pausa entre requests (padrão: 0.5s).")
+    ap.add_argument("--ua", default=UA_DEFAULT, help="User-Agent HTTP.")
+    ap.add_argument("--resumir", action="store_true",
+                    help="Pula combinações concluídas e evita URLs duplicadas.")
+    args = ap.parse_args()
+
+    saida_dir = os.path.abspath(args.saida)
+    os.makedirs(saida_dir, exist_ok=True)
+    path_validas = os.path.join(saida_dir, "url_validas.txt")
+    path_progresso = os.path.join(saida_dir, "descoberta_progresso.txt")
+
+    ja_validas, ja_feitas = set(), set()
+    if args.resumir:
+        if os.path.exists(path_validas):
+            with open(path_validas, "r", encoding="utf-8") as f:
+                ja_validas = set(x.strip() for x in f if x.strip())
+        if os.path.exists(path_progresso):
+            with open(path_progresso, "r", encoding="utf-8") as f:
+                ja_feitas = set(x.strip() for x in f if x.strip())
+
+    ufs = [u.upper() for u in _lista(args.ufs)] if args.ufs else None
+    tipos = _lista(args.tipos) or carregar_tipos()
+    combos = combinacoes(_lista(args.negocios), ufs, _lista(args.cidades), tipos, args.nivel)
+
+    print(f"Saída: {saida_dir}")
+    sessao = requests.Session()
+    n_combos, n_reqs, novas, falhas, t0 = 0, 0, 0, 0, time.time()
+    with open(path_validas, "a", encoding="utf-8") as f_ok, \
+         open(path_progresso, "a", encoding="utf-8") as f_prog:
+        for combo in combos:
+            chave = chave_combinacao(*combo)
+            if chave in ja_feitas:
+                continue
+            url = url_busca(args.base, *combo)
+            ids, reqs, erro = percorrer(sessao, url, args.max_paginas, args.timeout, args.ua, args.sleep)
+            n_combos += 1
+            n_reqs += reqs
+
+            for id_ in ids:
+                u = URL_IMPRESSAO.format(id=id_)
+                if u not in ja_validas:
+                    ja_validas.add(u)
+                    f_ok.write(u + "\n")
+                    novas += 1
+            f_ok.flush()
+            if erro:
+                # falha de rede/servidor: fica fora do progresso para o --resumir tentar de novo
+                falhas += 1
+                print(f"[WARN] {chave}: {erro} ({len(ids)} anúncio(s) antes da falha)")
+                time.sleep(args.sleep)
+                continue
+            # combinação só conta como feita depois que as URLs foram gravadas
+            f_prog.write(chave + "\n")
+            f_prog.flush()
+
+            if ids:
+                print(f"[OK] {chave}: {len(ids)} anúncio(s) em {reqs} página(s)")
+            if n_combos % 100 == 0:
+                print(f"[INFO] {n_combos} combinações | {n_reqs} requests | {novas} URLs novas "
+                      f"| {time.time() - t0:.0f}s")
+            time.sleep(args.sleep)
+
+    print(f"Concluído. Combinações: {n_combos} | Requests: {n_reqs} | URLs novas: {novas} | Com falha: {falhas}")
+    if falhas:
+        print("[INFO] rode de novo com --resumir para repetir as combinações com falha")
+    print(f"- url_validas.txt: {path_validas}")
+
+
+if __name__ == "__main__":
+    main()
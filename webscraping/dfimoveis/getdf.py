@@ -4,25 +4,37 @@ getdf.py (versão ajustada)
 Lê links do arquivo demo.txt, coleta dados de https://www.dfimoveis.com.br/imovel/impressao/{ID}
 e grava na tabela dfdb.imoveis_df (MySQL).
 
-pip install requests beautifulsoup4 lxml pymysql python-dateutil
+pip install requests beautifulsoup4 lxml mysql-connector-python python-dateutil
 
 Esse script foi ajustado para:
  - Pegar os dados dos imoveis do Distrito Federal. 
  - O tipo de negocio (venda ou aluguel) é determinado pela presença dos campos "Valor do imóvel venda" ou "Valor do imóvel aluguel".
  - O campo "Metragem" mantém o formato original (ex: "94,00 m²").
  - Se não funcionar, chama o Juca
+
+Telemetria da execução (telemetria.py) em ./telemetria: log JSON-lines, métricas e resumo
+em execucoes.jsonl; --metricas-porta 9101 serve as métricas ao vivo.
 """
 
 import os
 import re
 import time
 import sys
+import argparse
+from contextlib import nullcontext
 from datetime import datetime
 from dateutil import tz
-import pymysql
 import requests
 from bs4 import BeautifulSoup
 
+# camada de dados compartilhada com a API (api/utils/storage.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "api"))
+from utils.storage import MySQLBackend, SQLiteBackend
+from utils import rollups, snapshot_mmap, dedup, historico, localidades, perfil, mudancas
+from utils.enderecos import SincronizadorEnderecos
+
+import telemetria
+
 # =========================
 # CONFIG
 # =========================
@@ -32,7 +44,11 @@ MYSQL_USER = "root"
 MYSQL_PASS = ""
 MYSQL_DB   = "dfdb"
 MYSQL_PORT = 3306
+# LAUDO_DB_BACKEND=sqlite grava direto na base local (LAUDO_SQLITE_PATH)
+DB_BACKEND = os.getenv("LAUDO_DB_BACKEND", "mysql")
 INPUT_FILE = "demo.txt" 
+# snapshot mmap lido pelos workers da API (gerado ao final da coleta, se definido)
+MMAP_PATH = os.getenv("LAUDO_MMAP_PATH")
 
 REQUEST_TIMEOUT = 25
 RATE_LIMIT_SLEEP = 1.0
@@ -148,51 +164,71 @@ def build_titulo(tipo, bairro, cidade, endereco):
     titulo = " | ".join(base) if base else "Imóvel"
     return titulo[:200]
 
-def fetch_html(url: str):
+def fetch_html(url: str, tel=telemetria.DESLIGADA):
     try:
         resp = requests.get(url, headers={"User-Agent": UA}, timeout=REQUEST_TIMEOUT)
-        if resp.status_code == 200:
-            return resp.text
-    except Exception:
-        pass
+    except Exception as e:
+        tel.registrar_http(url, None, erro=e)
+        return None
+    tel.registrar_http(url, resp.status_code, len(resp.content))
+    if resp.status_code == 200:
+        return resp.text
     return None
 
-def insert_or_update(conn, row):
-    sql = """
-    INSERT INTO imoveis_df
-      (ID, CIDADE, BAIRRO, endereco, tipo, Titulo, Metragem, QUARTOS, SUITES, VAGAS, VALOR, tipo_negocio, valor_m2, data_da_busca)
-    VALUES
-      (%(ID)s, %(CIDADE)s, %(BAIRRO)s, %(endereco)s, %(tipo)s, %(Titulo)s, %(Metragem)s, %(QUARTOS)s, %(SUITES)s, %(VAGAS)s, %(VALOR)s, %(tipo_negocio)s, %(valor_m2)s, %(data_da_busca)s)
-    ON DUPLICATE KEY UPDATE
-      CIDADE=VALUES(CIDADE),
-      BAIRRO=VALUES(BAIRRO),
-      endereco=VALUES(endereco),
-      tipo=VALUES(tipo),
-      Titulo=VALUES(Titulo),
-      Metragem=VALUES(Metragem),
-      QUARTOS=VALUES(QUARTOS),
-      SUITES=VALUES(SUITES),
-      VAGAS=VALUES(VAGAS),
-      VALOR=VALUES(VALOR),
-      tipo_negocio=VALUES(tipo_negocio),
-      valor_m2=VALUES(valor_m2),
-      data_da_busca=VALUES(data_da_busca)
-    """
-    with conn.cursor() as cur:
-        cur.execute(sql, row)
-    conn.commit()
-
-def parse_page(url: str):
+def criar_backend():
+    if DB_BACKEND == "sqlite":
+        backend = SQLiteBackend()
+        backend.criar_schema()
+        return backend
+    return MySQLBackend({
+        "host": MYSQL_HOST,
+        "user": MYSQL_USER,
+        "password": MYSQL_PASS,
+        "database": MYSQL_DB,
+        "port": MYSQL_PORT,
+        "charset": "utf8mb4",
+    })
+
+def insert_or_update(backend, row, enderecos=None):
+    with backend.transacao() as cur:
+        # versão anterior do anúncio: desfaz sua parte nos agregados e abre o histórico
+        cur.execute(f"SELECT * FROM imoveis_df WHERE ID = %s{backend.sufixo_lock}", (row["ID"],))
+        antigo = cur.fetchone()
+        backend.upsert_imovel(cur, row)
+        rollups.atualizar(cur, backend, antigo, row)
+        grupo = dedup.registrar(cur, backend, row)
+        historico.registrar(cur, backend, antigo, row)
+        # evento para os caches da API (utils/mudancas.py), visível só depois do commit;
+        # o grupo entra na comparação: reagrupar muda quem é comparável
+        mudancas.registrar(cur, backend, antigo, dict(row, grupo_duplicado=grupo))
+    # endereço novo/alterado vai para a tabela endereco em lotes (após o commit do anúncio)
+    if enderecos is not None:
+        enderecos.registrar(antigo, row)
+
+# campos que o parse deveria preencher em toda página de anúncio (vazio = falha de parse do campo)
+CAMPOS_ESPERADOS = ("CIDADE", "BAIRRO", "endereco", "tipo", "Metragem", "QUARTOS", "VALOR", "tipo_negocio", "valor_m2")
+
+def parse_page(url: str, tel=telemetria.DESLIGADA):
     page_id = extract_id_from_url(url)
     if not page_id:
         print(f"[WARN] ID não encontrado: {url}")
+        tel.falha_campo("ID", url)
         return None
 
-    html = fetch_html(url)
+    with tel.medir("fetch"):
+        html = fetch_html(url, tel)
     if not html:
         print(f"[WARN] Falha ao baixar HTML: {url}")
         return None
 
+    with tel.medir("parse"):
+        row = parse_html(page_id, html)
+    for campo in CAMPOS_ESPERADOS:
+        if row[campo] in (None, "", "N/D"):
+            tel.falha_campo(campo, url)
+    return row
+
+def parse_html(page_id, html: str):
     soup = BeautifulSoup(html, "lxml")
 
     tipo = find_td_value_by_label(soup, "Tipo")
@@ -202,6 +238,8 @@ def parse_page(url: str):
     quartos, suites, vagas = parse_quartos_suite_vagas(soup)
     valor, tipo_negocio = parse_valor_e_negocio(soup)
     valor_m2, metragem = parse_valor_m2_e_area(soup)
+    # mesma grafia do índice de localidades (CAIXA ALTA, sem acento) quando a cidade/bairro é conhecido
+    cidade, bairro = localidades.indice().canonico(cidade, bairro)
     titulo = build_titulo(tipo, bairro, cidade, endereco)
 
     row = {
@@ -223,41 +261,65 @@ def parse_page(url: str):
     return row
 
 def main():
+    ap = argparse.ArgumentParser(description="Coleta os anúncios listados em demo.txt.")
+    ap.add_argument("--profile", nargs="?", const="perfil_getdf", metavar="PREFIXO",
+                    help="Perfil da execução + tempos de fetch/parse/write (<PREFIXO>.html|.prof e _etapas.json).")
+    ap.add_argument("--telemetria", default="telemetria", metavar="DIR",
+                    help="Diretório do log JSON-lines, métricas e resumo das execuções (padrão: ./telemetria).")
+    ap.add_argument("--metricas-porta", type=int, metavar="PORTA",
+                    help="Serve as métricas ao vivo em http://127.0.0.1:PORTA/metricas (e /metrics).")
+    args = ap.parse_args()
+
     if not os.path.exists(INPUT_FILE):
         print(f"[ERRO] Arquivo '{INPUT_FILE}' não encontrado.")
         sys.exit(1)
 
-    conn = pymysql.connect(
-        host=MYSQL_HOST,
-        user=MYSQL_USER,
-        password=MYSQL_PASS,
-        database=MYSQL_DB,
-        port=MYSQL_PORT,
-        charset="utf8mb4",
-        autocommit=False,
-        cursorclass=pymysql.cursors.DictCursor,
-    )
+    with open(INPUT_FILE, encoding="utf-8") as f_in:
+        n_urls = sum(1 for line in f_in if line.strip())
+
+    backend = criar_backend()
 
     total, ok = 0, 0
-    with conn:
-        for line in open(INPUT_FILE, encoding="utf-8"):
+    medicao = perfil.perfilar_execucao(args.profile) if args.profile else nullcontext(perfil.ETAPAS_DESLIGADAS)
+    with medicao as etapas, \
+         telemetria.Telemetria("getdf", args.telemetria, total=n_urls, etapas=etapas,
+                               parametros={"entrada": INPUT_FILE, "backend": DB_BACKEND}) as tel, \
+         open(INPUT_FILE, encoding="utf-8") as f_in, \
+         SincronizadorEnderecos(backend) as enderecos:
+        if args.metricas_porta:
+            tel.servir(args.metricas_porta)
+        for line in f_in:
             url = line.strip()
             if not url:
                 continue
             total += 1
             print(f"[INFO] Buscando: {url}")
             try:
-                data = parse_page(url)
+                data = parse_page(url, tel)
                 if data:
-                    insert_or_update(conn, data)
+                    with tel.medir("write"):
+                        insert_or_update(backend, data, enderecos)
                     ok += 1
+                    tel.contar("linhas_gravadas")
                     print(f"[OK] ID {data['ID']} gravado.")
                 else:
+                    tel.contar("sem_dados")
                     print("[WARN] Nenhum dado.")
             except Exception as e:
+                tel.contar("erros")
+                tel.evento("erro", url=url, erro=type(e).__name__, detalhe=str(e)[:200])
                 print(f"[ERRO] {url}: {e}")
+            tel.avancar()
             time.sleep(RATE_LIMIT_SLEEP)
-    print(f"[FINALIZADO] {ok}/{total} registros salvos.")
+        enderecos.descarregar()
+        tel.contar("enderecos_novos", enderecos.inseridas)
+    print(f"[FINALIZADO] {ok}/{total} registros salvos. Telemetria: {tel.caminho_log}")
+    if enderecos.inseridas:
+        print(f"[OK] {enderecos.inseridas} endereço(s) novo(s) na tabela endereco")
+
+    if MMAP_PATH and ok:
+        info = snapshot_mmap.gerar(backend, MMAP_PATH)
+        print(f"[OK] Snapshot mmap geração {info['geracao']} ({info['linhas']} linhas) -> {MMAP_PATH}")
 
 if __name__ == "__main__":
     main()
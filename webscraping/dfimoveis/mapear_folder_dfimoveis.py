@@ -8,7 +8,9 @@ Percorre sequencialmente um intervalo de IDs do DFImóveis no endpoint:
 Para cada URL:
 - Se a página contém o heading H1 com classe "titulo" e o texto "Folder do Imóvel",
   grava a URL em url_validas.txt
-- Caso contrário, grava a URL em url_invalidas.txt
+- Se o servidor responde 404, ou 200 sem esse heading, grava a URL em url_invalidas.txt
+- Falhas transitórias (timeout/conexão, 5xx, 429 etc.) vão para url_erros.txt e
+  são requisitadas de novo numa próxima execução (inclusive com --resumir)
 
 Uso:
   pip install requests beautifulsoup4
@@ -23,23 +25,43 @@ Opções:
   --sleep <float>     Pausa entre requisições em segundos (padrão: 0.1)
   --ua <str>          User-Agent customizado
   --resumir           Continua o processamento sem duplicar linhas se os .txt já existem
+  --adaptativo        Varredura adaptativa (sondagem_adaptativa.py): amostra o intervalo,
+                      varre ID a ID só os blocos densos e pula trechos sem anúncios
+  --sem-varredura-final  Com --adaptativo, não requisita os IDs que a fase adaptativa pulou
+                      (bem menos requisições, mas perde ~5% dos anúncios: os isolados)
+  --bloom <arquivo>   Filtro de Bloom dos IDs inválidos de execuções anteriores
+                      (com --adaptativo; padrão: <saida>/url_invalidas.bloom)
+  --profile [prefixo] Perfil da execução + tempos de fetch/parse/write
+                      (padrão: <saida>/perfil_mapear.html|.prof e _etapas.json)
+  --telemetria <dir>  Log JSON-lines, métricas e resumo das execuções (padrão: <saida>/telemetria)
+  --metricas-porta N  Serve as métricas ao vivo em http://127.0.0.1:N/metricas (e /metrics)
 
 Notas:
-- O script é SEQUENCIAL por especificação.
-- Tolerante a erros HTTP: 404/500/timeout contam como inválidas.
+- O script é SEQUENCIAL por especificação (no modo adaptativo, a ordem segue os blocos).
+- Para só descobrir os anúncios ativos, prefira o descobrir_anuncios.py (páginas de busca).
+- Tolerante a erros HTTP: só 404 conta como inválida; 5xx/429/timeout ficam em url_erros.txt.
 - Detecção do texto é "case-insensitive", ignora acentos e espaços extras.
 """
 
 import os
 import re
+import sys
 import time
 import argparse
 import unicodedata
 from typing import Optional
+from contextlib import nullcontext
 
 import requests
 from bs4 import BeautifulSoup
 
+import sondagem_adaptativa
+import telemetria
+
+# perfil sob demanda compartilhado com a API (api/utils/perfil.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "api"))
+from utils import perfil
+
 BASE_URL = "https://www.dfimoveis.com.br/imovel/impressao/{id}"
 UA_DEFAULT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -66,15 +88,59 @@ def has_folder_heading(html: str) -> bool:
             return True
     return False
 
-def fetch_html(url: str, timeout: int, ua: str) -> Optional[str]:
+def fetch_pagina(url: str, timeout: int, ua: str, tel=telemetria.DESLIGADA) -> tuple:
+    """(status HTTP ou None em erro de rede, HTML quando status == 200)."""
     try:
         resp = requests.get(url, headers={"User-Agent": ua}, timeout=timeout)
-        # Considera 200 somente; outros status => inválida
-        if resp.status_code == 200 and resp.text:
-            return resp.text
-        return None
-    except requests.RequestException:
-        return None
+    except requests.RequestException as e:
+        tel.registrar_http(url, None, erro=e)
+        return None, None
+    tel.registrar_http(url, resp.status_code, len(resp.content))
+    if resp.status_code == 200 and resp.text:
+        return 200, resp.text
+    return resp.status_code, None
+
+def fetch_html(url: str, timeout: int, ua: str, tel=telemetria.DESLIGADA) -> Optional[str]:
+    # Considera 200 somente; outros status => None
+    return fetch_pagina(url, timeout, ua, tel)[1]
+
+def varrer_adaptativo(args, sondar, path_validas: str, path_invalidas: str, saida_dir: str):
+    """Modo --adaptativo: decide quais IDs requisitar; sondar(id) faz a requisição e grava."""
+    ids_validos, ids_invalidos = set(), set()
+    if args.resumir:
+        ids_validos = sondagem_adaptativa.ids_do_arquivo(path_validas)
+        ids_invalidos = sondagem_adaptativa.ids_do_arquivo(path_invalidas)
+    conhecidos = dict.fromkeys(ids_invalidos, False)
+    conhecidos.update(dict.fromkeys(ids_validos, True))
+
+    path_bloom = args.bloom or os.path.join(saida_dir, "url_invalidas.bloom")
+    if os.path.exists(path_bloom):
+        filtro = sondagem_adaptativa.FiltroBloom.carregar(path_bloom)
+        print(f"Filtro de Bloom: {path_bloom} ({filtro.n} IDs inválidos)")
+    else:
+        filtro = None
+
+    plano = sondagem_adaptativa.SondagemAdaptativa(args.inicio, args.fim, sondar, filtro=filtro,
+                                                   conhecidos=conhecidos,
+                                                   varredura_final=not args.sem_varredura_final)
+    estat = plano.executar()
+    print(f"Adaptativo: {estat['requisicoes']} requisições para {abs(args.fim - args.inicio) + 1} IDs "
+          f"| blocos densos {estat['blocos_densos']} / esparsos {estat['blocos_esparsos']} "
+          f"| pulados pelo filtro {estat['puladas_filtro']} "
+          f"| varredura final {estat['requisicoes_varredura_final']}")
+
+    if estat["falhas"]:
+        print(f"- {estat['falhas']} falhas transitórias (url_erros.txt) ficam para a próxima execução")
+
+    # filtro da próxima execução: só IDs requisitados e confirmados inválidos (url_invalidas.txt,
+    # de todas as execuções), abaixo do maior válido; pulados pelo filtro e falhas ficam de fora
+    validos = sondagem_adaptativa.ids_do_arquivo(path_validas) | set(plano.validos())
+    invalidos = (sondagem_adaptativa.ids_do_arquivo(path_invalidas) | plano.invalidos()) - validos
+    novo = sondagem_adaptativa.filtro_de_invalidos(invalidos, max(validos) if validos else None)
+    if novo.n:
+        novo.salvar(path_bloom)
+        print(f"- filtro de Bloom:   {path_bloom} ({novo.n} IDs)")
+
 
 def main():
     ap = argparse.ArgumentParser(description="Mapeia URLs com 'Folder do Imóvel' no DFImóveis.")
@@ -85,6 +151,16 @@ def main():
     ap.add_argument("--sleep", type=float, default=0.1, help="Pausa entre requests (padrão: 0.1s).")
     ap.add_argument("--ua", default=UA_DEFAULT, help="User-Agent HTTP.")
     ap.add_argument("--resumir", action="store_true", help="Evita duplicatas lendo arquivos existentes.")
+    ap.add_argument("--adaptativo", action="store_true", help="Pula blocos de IDs sem anúncios.")
+    ap.add_argument("--sem-varredura-final", action="store_true",
+                    help="Adaptativo sem a varredura final (menos requisições, perde válidos isolados).")
+    ap.add_argument("--bloom", help="Filtro de Bloom dos IDs inválidos (padrão: <saida>/url_invalidas.bloom).")
+    ap.add_argument("--profile", nargs="?", const="", metavar="PREFIXO",
+                    help="Perfil da execução + tempos de fetch/parse/write.")
+    ap.add_argument("--telemetria", metavar="DIR",
+                    help="Log JSON-lines, métricas e resumo das execuções (padrão: <saida>/telemetria).")
+    ap.add_argument("--metricas-porta", type=int, metavar="PORTA",
+                    help="Serve as métricas ao vivo em http://127.0.0.1:PORTA/metricas (e /metrics).")
     args = ap.parse_args()
 
     saida_dir = os.path.abspath(args.saida)
@@ -92,6 +168,7 @@ def main():
 
     path_validas = os.path.join(saida_dir, "url_validas.txt")
     path_invalidas = os.path.join(saida_dir, "url_invalidas.txt")
+    path_erros = os.path.join(saida_dir, "url_erros.txt")
 
     # Conjuntos para resumir/evitar duplicatas
     ja_validas = set()
@@ -107,6 +184,7 @@ def main():
     total = 0
     encontrados = 0
     invalidos = 0
+    erros = 0
 
     # Ordem sequencial (decrescente se inicio > fim; crescente caso contrário)
     step = -1 if args.inicio >= args.fim else 1
@@ -115,38 +193,82 @@ def main():
     print(f"Saída: {saida_dir}")
     print(f"Processando IDs de {args.inicio} até {args.fim} (passo {step}) ...")
 
-    with open(path_validas, "a", encoding="utf-8") as f_ok, \
-         open(path_invalidas, "a", encoding="utf-8") as f_bad:
+    if args.profile is not None:
+        medicao = perfil.perfilar_execucao(args.profile or os.path.join(saida_dir, "perfil_mapear"))
+    else:
+        medicao = nullcontext(perfil.ETAPAS_DESLIGADAS)
+
+    # ETA sobre o intervalo (sem as já processadas, com --resumir); no adaptativo não se sabe de antemão
+    if args.adaptativo:
+        pendentes = None
+    elif args.resumir:
+        pendentes = sum(1 for i in rng if BASE_URL.format(id=i) not in ja_validas
+                        and BASE_URL.format(id=i) not in ja_invalidas)
+    else:
+        pendentes = len(rng)
 
-        for i in rng:
+    with medicao as etapas, \
+         telemetria.Telemetria("mapear", args.telemetria or os.path.join(saida_dir, "telemetria"),
+                               total=pendentes, etapas=etapas,
+                               parametros={"inicio": args.inicio, "fim": args.fim,
+                                           "adaptativo": args.adaptativo}) as tel, \
+         open(path_validas, "a", encoding="utf-8") as f_ok, \
+         open(path_invalidas, "a", encoding="utf-8") as f_bad, \
+         open(path_erros, "a", encoding="utf-8") as f_err:
+        if args.metricas_porta:
+            tel.servir(args.metricas_porta)
+
+        def sondar(i: int) -> Optional[bool]:
+            """True/False confirmados; None para falha transitória (rede, 5xx, 429...)."""
+            nonlocal total, encontrados, invalidos, erros
             url = BASE_URL.format(id=i)
             total += 1
-
-            # Resume: já processada?
-            if args.resumir and (url in ja_validas or url in ja_invalidas):
-                continue
-
-            html = fetch_html(url, timeout=args.timeout, ua=args.ua)
-            if html and has_folder_heading(html):
-                f_ok.write(url + "\n")
-                f_ok.flush()
-                encontrados += 1
-                status = "OK"
-            else:
-                f_bad.write(url + "\n")
-                f_bad.flush()
-                invalidos += 1
-                status = "NOK"
+            with tel.medir("fetch"):
+                status_http, html = fetch_pagina(url, timeout=args.timeout, ua=args.ua, tel=tel)
+            with tel.medir("parse"):
+                valida = bool(html) and has_folder_heading(html)
+            if html and not valida:
+                tel.falha_campo("titulo", url)
+            with tel.medir("write"):
+                if valida:
+                    f_ok.write(url + "\n")
+                    f_ok.flush()
+                    encontrados += 1
+                    status = "OK"
+                elif html or status_http == 404:
+                    f_bad.write(url + "\n")
+                    f_bad.flush()
+                    invalidos += 1
+                    status = "NOK"
+                else:
+                    f_err.write(url + "\n")
+                    f_err.flush()
+                    erros += 1
+                    status = f"ERRO {status_http or 'rede'}"
+            tel.contar("validas" if valida else "invalidas" if status == "NOK" else "erros")
+            tel.avancar()
 
             # Log leve
             if total % 100 == 0:
-                print(f"[{total}] últimos 100: válidas+{encontrados} | inválidas+{invalidos} -> {url} [{status}]")
+                print(f"[{total}] últimos 100: válidas+{encontrados} | inválidas+{invalidos} | erros+{erros} -> {url} [{status}]")
 
             time.sleep(args.sleep)
+            return None if status.startswith("ERRO") else status == "OK"
+
+        if args.adaptativo:
+            varrer_adaptativo(args, sondar, path_validas, path_invalidas, saida_dir)
+        else:
+            for i in rng:
+                url = BASE_URL.format(id=i)
+                # Resume: já processada?
+                if args.resumir and (url in ja_validas or url in ja_invalidas):
+                    continue
+                sondar(i)
 
-    print(f"Concluído. Total: {total} | Válidas: {encontrados} | Inválidas: {invalidos}")
+    print(f"Concluído. Total: {total} | Válidas: {encontrados} | Inválidas: {invalidos} | Erros: {erros}")
     print(f"- url_validas.txt:   {path_validas}")
     print(f"- url_invalidas.txt: {path_invalidas}")
+    print(f"- url_erros.txt:     {path_erros}")
 
 if __name__ == "__main__":
     main()
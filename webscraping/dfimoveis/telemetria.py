@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+telemetria.py
+-------------
+Telemetria estruturada das execuções dos scrapers (getdf.py,
+mapear_folder_dfimoveis.py).
+
+Por execução, em <dir> (padrão: ./telemetria):
+  <script>_<AAAAMMDD-HHMMSS>.jsonl   log JSON-lines: inicio, erros (HTTP não-200,
+                                      timeouts, falhas de parse por campo),
+                                      progresso a cada INTERVALO_PROGRESSO s, fim
+  <script>_metricas.json             retrato atual dos contadores (reescrito a cada
+                                      progresso; dá para acompanhar com watch/jq)
+  execucoes.jsonl                    resumo de cada execução, para comparar execuções
+
+Contadores: classes de status HTTP (http_2xx, http_4xx...), timeouts, erros
+de conexão, bytes baixados, falhas de parse por campo, linhas gravadas;
+histogramas de latência (ms) de fetch/parse/write; taxa (itens/s) e ETA
+sobre a lista de entrada.
+
+--metricas-porta N nos scripts sobe um servidor local com
+  GET /metricas  (JSON)   e   GET /metrics  (formato texto do Prometheus)
+
+Comparar execuções:
+  python telemetria.py --comparar telemetria/execucoes.jsonl [--script getdf] [--ultimas 10]
+"""
+
+import os
+import json
+import time
+import bisect
+import argparse
+import threading
+from datetime import datetime
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+INTERVALO_PROGRESSO = 10.0  # segundos
+# limites superiores dos baldes dos histogramas (ms); o último balde é "acima de 30 s"
+BALDES_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+# =========================
+# Histograma
+# =========================
+class Histograma:
+    """Histograma de latências em baldes fixos (ms), com percentis aproximados pelo limite do balde."""
+
+    def __init__(self):
+        self.baldes = [0] * (len(BALDES_MS) + 1)
+        self.n = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, ms: float):
+        self.baldes[bisect.bisect_left(BALDES_MS, ms)] += 1
+        self.n += 1
+        self.soma += ms
+        self.maximo = max(self.maximo, ms)
+
+    def percentil(self, q: float) -> float | None:
+        if not self.n:
+            return None
+        alvo, acumulado = q * self.n, 0
+        for i, c in enumerate(self.baldes):
+            acumulado += c
+            if acumulado >= alvo:
+                return float(BALDES_MS[i]) if i < len(BALDES_MS) else round(self.maximo, 1)
+        return round(self.maximo, 1)
+
+    def resumo(self) -> dict:
+        return {
+            "n": self.n,
+            "media_ms": round(self.soma / self.n, 2) if self.n else None,
+            "p50_ms": self.percentil(0.50), "p90_ms": self.percentil(0.90), "p99_ms": self.percentil(0.99),
+            "max_ms": round(self.maximo, 1),
+            "baldes": {("<=" + str(b)) if i < len(BALDES_MS) else ">" + str(BALDES_MS[-1]): c
+                       for i, (b, c) in enumerate(zip(BALDES_MS + [None], self.baldes)) if c},
+        }
+
+
+# =========================
+# Telemetria de uma execução
+# =========================
+class Telemetria:
+    """
+    total: nº de itens da entrada (para ETA; None = desconhecido).
+    etapas: perfil.Etapas do --profile (os tempos medidos aqui também vão para lá).
+    """
+
+    def __init__(self, script: str, diretorio: str = "telemetria", total: int | None = None,
+                 etapas=None, parametros: dict | None = None):
+        os.makedirs(diretorio, exist_ok=True)
+        self.script = script
+        self.diretorio = diretorio
+        self.total = total
+        self.etapas = etapas
+        self.inicio = time.time()
+        self.id_execucao = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.contadores: dict = {}
+        self.falhas_parse: dict = {}
+        self.histogramas: dict = {}
+        self.feitos = 0
+        self._lock = threading.Lock()
+        self._ultimo_progresso = time.monotonic()
+        self._servidor = None
+        self.caminho_log = os.path.join(diretorio, f"{script}_{self.id_execucao}.jsonl")
+        self.caminho_metricas = os.path.join(diretorio, f"{script}_metricas.json")
+        self._log = open(self.caminho_log, "a", encoding="utf-8")
+        self.evento("inicio", total=total, parametros=parametros or {})
+
+    # ----- registro -----
+    def evento(self, tipo: str, **campos):
+        linha = {"ts": datetime.now().isoformat(timespec="milliseconds"), "evento": tipo, **campos}
+        with self._lock:
+            self._log.write(json.dumps(linha, ensure_ascii=False, default=str) + "\n")
+
+    def contar(self, nome: str, n: int = 1):
+        with self._lock:
+            self.contadores[nome] = self.contadores.get(nome, 0) + n
+
+    def registrar_http(self, url: str, status: int | None, n_bytes: int = 0, erro: Exception | None = None):
+        """status None = sem resposta (timeout/erro de conexão)."""
+        if status is not None:
+            self.contar(f"http_{status // 100}xx")
+            self.contar("bytes_baixados", n_bytes)
+            if status != 200:
+                self.evento("http", url=url, status=status)
+            return
+        nome = type(erro).__name__ if erro else "Erro"
+        self.contar("timeouts" if "Timeout" in nome else "erros_conexao")
+        self.evento("erro_rede", url=url, erro=nome, detalhe=str(erro)[:200])
+
+    def falha_campo(self, campo: str, url: str | None = None):
+        with self._lock:
+            self.falhas_parse[campo] = self.falhas_parse.get(campo, 0) + 1
+        self.evento("parse", campo=campo, url=url)
+
+    def _registrar_tempo(self, nome: str, dt: float):
+        with self._lock:
+            h = self.histogramas.get(nome)
+            if h is None:
+                h = self.histogramas[nome] = Histograma()
+            h.registrar(dt * 1000.0)
+        if self.etapas is not None:
+            self.etapas.registrar(nome, dt)
+
+    @contextmanager
+    def medir(self, nome: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._registrar_tempo(nome, time.perf_counter() - t0)
+
+    def avancar(self, n: int = 1):
+        """Item da entrada concluído; a cada INTERVALO_PROGRESSO grava progresso + retrato das métricas."""
+        self.feitos += n
+        if time.monotonic() - self._ultimo_progresso >= INTERVALO_PROGRESSO:
+            self._ultimo_progresso = time.monotonic()
+            retrato = self.retrato()
+            self.evento("progresso", **{k: retrato[k] for k in ("feitos", "total", "itens_por_s", "eta_s")})
+            self.salvar_metricas(retrato)
+
+    # ----- leitura -----
+    def retrato(self) -> dict:
+        decorrido = time.time() - self.inicio
+        taxa = self.feitos / decorrido if decorrido > 0 else 0.0
+        eta = None
+        if self.total is not None and taxa > 0:
+            eta = round(max(0, self.total - self.feitos) / taxa, 1)
+        with self._lock:
+            return {
+                "script": self.script, "execucao": self.id_execucao,
+                "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+                "decorrido_s": round(decorrido, 1),
+                "feitos": self.feitos, "total": self.total,
+                "itens_por_s": round(taxa, 3), "eta_s": eta,
+                "contadores": dict(self.contadores),
+                "falhas_parse": dict(self.falhas_parse),
+                "latencias": {k: h.resumo() for k, h in self.histogramas.items()},
+            }
+
+    def salvar_metricas(self, retrato: dict | None = None):
+        tmp = self.caminho_metricas + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(retrato or self.retrato(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.caminho_metricas)
+
+    def texto_prometheus(self) -> str:
+        r = self.retrato()
+        pre = f"dfimoveis_{self.script}"
+        linhas = [f"{pre}_itens_feitos {r['feitos']}", f"{pre}_itens_por_segundo {r['itens_por_s']}"]
+        if r["total"] is not None:
+            linhas.append(f"{pre}_itens_total {r['total']}")
+        if r["eta_s"] is not None:
+            linhas.append(f"{pre}_eta_segundos {r['eta_s']}")
+        for nome, v in sorted(r["contadores"].items()):
+            linhas.append(f"{pre}_{nome}_total {v}")
+        for campo, v in sorted(r["falhas_parse"].items()):
+            linhas.append(f'{pre}_parse_falhas_total{{campo="{campo}"}} {v}')
+        with self._lock:
+            for etapa, h in sorted(self.histogramas.items()):
+                acumulado = 0
+                for limite, c in zip(BALDES_MS + ["+Inf"], h.baldes):
+                    acumulado += c
+                    linhas.append(f'{pre}_latencia_ms_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+                linhas.append(f'{pre}_latencia_ms_sum{{etapa="{etapa}"}} {round(h.soma, 3)}')
+                linhas.append(f'{pre}_latencia_ms_count{{etapa="{etapa}"}} {h.n}')
+        return "\n".join(linhas) + "\n"
+
+    # ----- servidor local -----
+    def servir(self, porta: int):
+        tel = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metricas"):
+                    corpo = json.dumps(tel.retrato(), ensure_ascii=False).encode("utf-8")
+                    tipo = "application/json"
+                elif self.path.startswith("/metrics"):
+                    corpo = tel.texto_prometheus().encode("utf-8")
+                    tipo = "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", porta), Handler)
+        threading.Thread(target=self._servidor.serve_forever, name="telemetria", daemon=True).start()
+        print(f"[INFO] métricas em http://127.0.0.1:{porta}/metricas (e /metrics)")
+
+    # ----- fim -----
+    def encerrar(self, **extras) -> dict:
+        """Grava o evento de fim, o retrato final e o resumo em execucoes.jsonl."""
+        resumo = dict(self.retrato(), **extras)
+        resumo["fim"] = datetime.now().isoformat(timespec="seconds")
+        self.evento("fim", **{k: resumo[k] for k in ("feitos", "decorrido_s", "itens_por_s")})
+        self.salvar_metricas(resumo)
+        with open(os.path.join(self.diretorio, "execucoes.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(resumo, ensure_ascii=False, default=str) + "\n")
+        self._log.close()
+        if self._servidor is not None:
+            self._servidor.shutdown()
+        return resumo
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, tb):
+        if tipo is not None:
+            self.evento("abortada", erro=tipo.__name__, detalhe=str(erro)[:200])
+        self.encerrar(interrompida=tipo is not None)
+
+
+class _TelemetriaDesligada:
+    """Mesma interface, sem registrar nada (parse_page/fetch_html chamados fora de uma execução)."""
+    _nulo = nullcontext()
+
+    def medir(self, nome: str):
+        return self._nulo
+
+    def registrar_http(self, *args, **kwargs):
+        pass
+
+    def falha_campo(self, *args, **kwargs):
+        pass
+
+    def contar(self, *args, **kwargs):
+        pass
+
+
+DESLIGADA = _TelemetriaDesligada()
+
+
+# =========================
+# Comparação entre execuções
+# =========================
+def comparar(caminho: str, script: str | None = None, ultimas: int = 10):
+    with open(caminho, encoding="utf-8") as f:
+        resumos = [json.loads(x) for x in f if x.strip()]
+    if script:
+        resumos = [r for r in resumos if r.get("script") == script]
+    resumos = resumos[-ultimas:]
+    print(f"{'execução':<17}{'script':<8}{'itens':>8}{'itens/s':>9}{'fetch p50':>11}{'fetch p90':>11}"
+          f"{'2xx':>7}{'4xx':>6}{'5xx':>6}{'timeouts':>9}{'parse':>7}")
+    for r in resumos:
+        c = r.get("contadores", {})
+        fetch = r.get("latencias", {}).get("fetch", {})
+        print(f"{r['execucao']:<17}{r['script'][:7]:<8}{r['feitos']:>8}{r['itens_por_s']:>9.2f}"
+              f"{fetch.get('p50_ms') or '-':>11}{fetch.get('p90_ms') or '-':>11}"
+              f"{c.get('http_2xx', 0):>7}{c.get('http_4xx', 0):>6}{c.get('http_5xx', 0):>6}"
+              f"{c.get('timeouts', 0):>9}{sum(r.get('falhas_parse', {}).values()):>7}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Resumo das execuções dos scrapers.")
+    ap.add_argument("--comparar", metavar="EXECUCOES_JSONL", required=True,
+                    help="Arquivo execucoes.jsonl do diretório de telemetria.")
+    ap.add_argument("--script", help="Só as execuções deste script (getdf, mapear).")
+    ap.add_argument("--ultimas", type=int, default=10)
+    args = ap.parse_args()
+    comparar(args.comparar, args.script, args.ultimas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+simular_sondagem.py
+Reproduz a varredura adaptativa (sondagem_adaptativa.py) contra conjuntos de
+IDs gravados, sem requisições: compara nº de requisições e recall com a
+varredura sequencial do mapear_folder_dfimoveis.py.
+
+Entrada gravada (url_validas.txt / url_invalidas.txt de uma execução real):
+  python test/simular_sondagem.py --validas 15-10_url_validas.txt --invalidas-anteriores url_invalidas.txt
+
+Cenário sintético (faixa recente densa + lotes de anúncios espalhados):
+  python test/simular_sondagem.py --sintetico --seed 7
+  python test/simular_sondagem.py --sintetico --passo-maximo 16 --vizinhanca 8
+  python test/simular_sondagem.py --sintetico --seed 7 --sem-varredura-final
+
+--invalidas-anteriores alimenta o filtro de Bloom (como o --bloom do
+mapear_folder); no cenário sintético, --fracao-anterior define quantos dos
+IDs inválidos já eram conhecidos de uma execução anterior.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import sondagem_adaptativa as sa
+
+
+def cenario_sintetico(inicio: int, fim: int, seed: int) -> set:
+    """
+    IDs válidos de um intervalo: os mais recentes (perto de `fim`) são densos,
+    os antigos aparecem em lotes curtos (imobiliárias publicando em sequência)
+    e isolados raros.
+    """
+    rnd = random.Random(seed)
+    n = fim - inicio + 1
+    validos = set()
+    for i in range(inicio, fim + 1):
+        idade = (fim - i) / n
+        p = 0.45 * (1 - idade / 0.08) if idade < 0.08 else 0.0015
+        if rnd.random() < p:
+            validos.add(i)
+    for _ in range(n // 900):
+        ini = rnd.randint(inicio, fim)
+        for i in range(ini, min(fim, ini + rnd.randint(5, 60)) + 1):
+            if rnd.random() < 0.6:
+                validos.add(i)
+    return validos
+
+
+def simular(validos: set, inicio: int, fim: int, filtro=None, **params) -> dict:
+    plano = sa.SondagemAdaptativa(inicio, fim, lambda i: i in validos, filtro=filtro, **params)
+    t0 = time.perf_counter()
+    estat = plano.executar()
+    achados = set(plano.validos())
+    alvo = {i for i in validos if min(inicio, fim) <= i <= max(inicio, fim)}
+    # perdidos sem nenhum válido a até 2 IDs de distância (só a varredura completa acha)
+    isolados = sum(1 for i in alvo - achados if not any(i + d in validos for d in (-2, -1, 1, 2)))
+    total = abs(fim - inicio) + 1
+    return dict(estat,
+                total_ids=total,
+                recall=len(achados & alvo) / len(alvo) if alvo else 1.0,
+                perdidos=len(alvo - achados),
+                perdidos_isolados=isolados,
+                fracao_requisicoes=estat["requisicoes"] / total,
+                segundos=round(time.perf_counter() - t0, 2))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Simula a varredura adaptativa de IDs contra conjuntos gravados.")
+    ap.add_argument("--validas", help="Arquivo com as URLs (ou IDs) válidas gravadas.")
+    ap.add_argument("--invalidas-anteriores", help="url_invalidas.txt de uma execução anterior (filtro de Bloom).")
+    ap.add_argument("--sintetico", action="store_true", help="Gera um cenário sintético em vez de ler arquivos.")
+    ap.add_argument("--inicio", type=int, help="ID inicial (padrão: maior ID válido / 1240957 no sintético).")
+    ap.add_argument("--fim", type=int, help="ID final (padrão: menor ID válido / inicio-200000 no sintético).")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--fracao-anterior", type=float, default=0.5,
+                    help="Sintético: fração dos inválidos já conhecidos (padrão: 0.5).")
+    ap.add_argument("--tamanho-bloco", type=int, default=sa.TAMANHO_BLOCO)
+    ap.add_argument("--amostras", type=int, default=sa.AMOSTRAS_POR_BLOCO)
+    ap.add_argument("--limiar-denso", type=float, default=sa.LIMIAR_DENSO)
+    ap.add_argument("--passo-maximo", type=int, default=sa.PASSO_MAXIMO)
+    ap.add_argument("--vizinhanca", type=int, default=sa.VIZINHANCA)
+    ap.add_argument("--sem-varredura-final", action="store_true",
+                    help="Só a fase adaptativa (menos requisições, perde válidos isolados).")
+    args = ap.parse_args()
+
+    if args.sintetico:
+        inicio = args.inicio or 1240957
+        fim = args.fim or inicio - 200_000
+        validos = cenario_sintetico(min(inicio, fim), max(inicio, fim), args.seed)
+        rnd = random.Random(args.seed + 1)
+        invalidos_antes = {i for i in range(min(inicio, fim), max(inicio, fim) + 1)
+                           if i not in validos and rnd.random() < args.fracao_anterior}
+    elif args.validas:
+        validos = sa.ids_do_arquivo(args.validas)
+        if not validos:  # arquivo com um ID por linha
+            with open(args.validas, encoding="utf-8") as f:
+                validos = {int(x) for x in f if x.strip().isdigit()}
+        if not validos:
+            print("[ERRO] Nenhum ID válido no arquivo.")
+            sys.exit(1)
+        inicio = args.inicio or max(validos)
+        fim = args.fim or min(validos)
+        invalidos_antes = sa.ids_do_arquivo(args.invalidas_anteriores) if args.invalidas_anteriores else set()
+    else:
+        ap.print_help()
+        return
+
+    params = dict(tamanho_bloco=args.tamanho_bloco, amostras_por_bloco=args.amostras,
+                  limiar_denso=args.limiar_denso, passo_maximo=args.passo_maximo, vizinhanca=args.vizinhanca,
+                  varredura_final=not args.sem_varredura_final)
+    maior_valido = max(validos)
+    filtro = sa.filtro_de_invalidos(invalidos_antes, maior_valido) if invalidos_antes else None
+
+    total = abs(fim - inicio) + 1
+    print(f"Intervalo {inicio} -> {fim}: {total} IDs, {len(validos)} válidos ({len(validos) / total:.1%})")
+    print(f"{'estratégia':<22}{'requisições':>12}{'% do seq.':>11}{'recall':>9}")
+    print(f"{'sequencial':<22}{total:>12}{1:>11.1%}{1:>9.2%}")
+    for nome, f in (("adaptativa", None), ("adaptativa + Bloom", filtro)):
+        if nome.endswith("Bloom") and f is None:
+            continue
+        r = simular(validos, inicio, fim, filtro=f, **params)
+        print(f"{nome:<22}{r['requisicoes']:>12}{r['fracao_requisicoes']:>11.1%}{r['recall']:>9.2%}"
+              f"   (densos={r['blocos_densos']}, esparsos={r['blocos_esparsos']}, "
+              f"pulados pelo filtro={r['puladas_filtro']}, varredura final={r['requisicoes_varredura_final']}, "
+              f"perdidos={r['perdidos']} dos quais isolados={r['perdidos_isolados']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+stub_dfimoveis.py
+Servidor local que imita as páginas de busca do DF Imóveis, para testar o
+descobrir_anuncios.py sem acessar o site.
+
+GET /{negocio}/{uf}/{cidade}/{bairro}/{tipo}?pagina=N serve
+  fixtures/busca/{negocio}/{uf}/{cidade}/{bairro}/{tipo}/pagina-N.html
+e, para combinações sem página salva, uma busca sem resultados (200, como o
+site). Ao encerrar (Ctrl+C) mostra quantas requisições foram atendidas.
+
+Uso:
+  python test/stub_dfimoveis.py --porta 8098
+  python descobrir_anuncios.py --base http://127.0.0.1:8098 --ufs DF --cidades "AGUAS CLARAS,BRASILIA" --sleep 0
+"""
+
+import os
+import argparse
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "busca")
+
+SEM_RESULTADOS = """<!DOCTYPE html>
+<html lang="pt-br"><head><meta charset="utf-8"><title>DF Imóveis</title></head>
+<body><header><a href="/">DF Imóveis</a></header>
+<div id="resultadoDaBuscaDeImoveis"><p>Nenhum imóvel encontrado.</p></div></body></html>
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    requisicoes = 0
+    com_resultado = 0
+
+    def do_GET(self):
+        partes = urlsplit(self.path)
+        segmentos = [s for s in partes.path.split("/") if s]
+        if len(segmentos) != 5 or any(s in (".", "..") for s in segmentos):
+            self.send_error(404)
+            return
+        pagina = (parse_qs(partes.query).get("pagina") or ["1"])[0]
+        if not pagina.isdigit():
+            self.send_error(400)
+            return
+
+        Handler.requisicoes += 1
+        arquivo = os.path.join(FIXTURES_DIR, *segmentos, f"pagina-{int(pagina)}.html")
+        if os.path.exists(arquivo):
+            Handler.com_resultado += 1
+            with open(arquivo, "rb") as f:
+                corpo = f.read()
+        else:
+            corpo = SEM_RESULTADOS.encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, fmt, *args):
+        pass  # uma linha por requisição atrapalha mais do que ajuda aqui
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Páginas de busca falsas do DF Imóveis (fixtures).")
+    ap.add_argument("--porta", type=int, default=8098)
+    args = ap.parse_args()
+
+    srv = ThreadingHTTPServer(("127.0.0.1", args.porta), Handler)
+    print(f"[OK] DF Imóveis falso em http://127.0.0.1:{args.porta} (fixtures: {FIXTURES_DIR})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"[INFO] {Handler.requisicoes} requisição(ões), {Handler.com_resultado} com fixture")
+
+
+if __name__ == "__main__":
+    main()